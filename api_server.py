@@ -0,0 +1,335 @@
+"""
+Headless HTTP API for the FAQ bot.
+
+    python api_server.py --port 8000
+    curl -s localhost:8000/answer -d '{"query": "how do I do kyc"}'
+
+Endpoints (JSON in, JSON out):
+    POST /answer    {"query", "top_k"?, "return_prompt"?, "language"?, "deadline"?} -> rag_answer result
+    POST /retrieve  {"query", "top_k"?, "category"?, "subcategory"?} -> {"retrieved_faqs": [...]}
+    GET  /health
+    GET  /metrics   Prometheus text (see models/metrics.py)
+
+Queries that arrive within API_BATCH_WINDOW_MS of each other are encoded and
+searched together in one encode/index.search call on a dedicated thread, so
+the event loop is never blocked on the model. LLM calls then run concurrently
+on a separate thread pool. Beyond API_MAX_PENDING requests in flight, new ones
+are rejected with 503 and a Retry-After header instead of queueing without
+bound. A "deadline" (seconds, default RAG_DEADLINE) counts from the request's
+arrival; past it, the answer degrades to the top FAQ instead of waiting.
+Bodies must be a JSON object sent with Content-Length (chunked bodies get
+411), and headers are capped at MAX_HEADERS lines and MAX_HEADER_BYTES.
+"""
+import argparse
+import asyncio
+import functools
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from models import metrics
+from models.rag_pipeline import get_pipeline
+from models.together_inference import TogetherClient, set_client
+from models.llm_providers import get_llm
+from models.config import (
+    TOP_K_RETRIEVAL, API_BATCH_WINDOW_MS, API_MAX_BATCH, API_MAX_PENDING, API_LLM_WORKERS
+)
+
+MAX_BODY_BYTES = 64 * 1024
+MAX_HEADERS = 100
+MAX_HEADER_BYTES = 16 * 1024
+
+class QueryBatcher:
+    """
+    Collects queries into micro-batches for FAQPipeline.build_query_contexts.
+
+    The first query of a batch waits at most `window` seconds for others to
+    join; a batch is flushed early once it holds `max_batch` queries.
+    """
+    def __init__(self, pipeline, window=API_BATCH_WINDOW_MS / 1000, max_batch=API_MAX_BATCH):
+        self.pipeline = pipeline
+        self.window = window
+        self.max_batch = max_batch
+        self.queue = asyncio.Queue()
+        # One thread: encode/search calls are already batched, running them in parallel only adds contention
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='encoder')
+        self.batches = 0
+        self.batched_queries = 0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        self.executor.shutdown(wait=False)
+
+    async def context(self, query, k):
+        """QueryContext for `query` with at least `k` neighbours."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((query, k, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            queries = [query for query, _, _ in batch]
+            k = max(k for _, k, _ in batch)
+            try:
+                contexts = await loop.run_in_executor(self.executor, self.pipeline.build_query_contexts, queries, k)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.batched_queries += len(batch)
+            for (_, _, future), ctx in zip(batch, contexts):
+                if not future.done():
+                    future.set_result(ctx)
+
+class APIServer:
+    def __init__(self, pipeline, window=API_BATCH_WINDOW_MS / 1000, max_batch=API_MAX_BATCH,
+                 max_pending=API_MAX_PENDING, llm_workers=API_LLM_WORKERS):
+        self.pipeline = pipeline
+        self.batcher = QueryBatcher(pipeline, window=window, max_batch=max_batch)
+        self.max_pending = max_pending
+        self.llm_executor = ThreadPoolExecutor(max_workers=llm_workers, thread_name_prefix='llm')
+        self.pending = 0
+        self.rejected = 0
+        self.served = 0
+
+    async def answer(self, body):
+        arrived = time.monotonic()
+        query, top_k = _query_args(body)
+        # An explicit 0 means no deadline, not the server default
+        deadline = body.get('deadline')
+        deadline = float(self.pipeline.deadline or 0) if deadline is None else float(deadline)
+        ctx = await self.batcher.context(query, self.pipeline.search_width(top_k))
+        loop = asyncio.get_running_loop()
+
+        def answer_with_context():
+            # Time spent queued and batching counts against the deadline
+            remaining = max(deadline - (time.monotonic() - arrived), 1e-3) if deadline else 0
+            return self.pipeline.answer_with_context(ctx, return_prompt=bool(body.get('return_prompt')), top_k=top_k,
+                                                     answer_language=body.get('language'), deadline=remaining)
+        result = await loop.run_in_executor(self.llm_executor, answer_with_context)
+        # A background LLM rephrasing of a direct answer only lands in the answer cache here
+        result.pop('upgrade', None)
+        return result
+
+    async def retrieve(self, body):
+        query, top_k = _query_args(body)
+        category, subcategory = body.get('category'), body.get('subcategory')
+        ctx = await self.batcher.context(query, self.pipeline.search_width(top_k))
+        if category is None and subcategory is None:
+            # Only reads the batched search results
+            retrieved = self.pipeline.retrieve_faq(query, top_k=top_k, ctx=ctx)
+        else:
+            # A partition search (and the first build of its sub-index) is real work: keep it off the event loop
+            retrieved = await asyncio.get_running_loop().run_in_executor(
+                self.batcher.executor, functools.partial(self.pipeline.retrieve_faq, query, top_k=top_k, ctx=ctx,
+                                                         category=category, subcategory=subcategory))
+        return {'retrieved_faqs': retrieved}
+
+    def health(self):
+        return {
+            'status': 'ok',
+            'pending': self.pending,
+            'served': self.served,
+            'rejected': self.rejected,
+            'answers': self.pipeline.answer_stats(),
+            'llm_providers': get_llm().stats(),
+            'batches': self.batcher.batches,
+            'mean_batch_size': self.batcher.batched_queries / self.batcher.batches if self.batcher.batches else 0.0,
+        }
+
+    async def dispatch(self, method, path, body):
+        """Returns (status, payload); payload is a dict (JSON) or str (plain text)."""
+        path = path.split('?', 1)[0]
+        if method == 'GET' and path == '/health':
+            return HTTPStatus.OK, self.health()
+        if method == 'GET' and path == '/metrics':
+            return HTTPStatus.OK, metrics.dump_metrics('prometheus')
+        routes = {'/answer': self.answer, '/retrieve': self.retrieve}
+        if path not in routes:
+            return HTTPStatus.NOT_FOUND, {'error': f"No route for {path}"}
+        if method != 'POST':
+            return HTTPStatus.METHOD_NOT_ALLOWED, {'error': "Use POST"}
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return HTTPStatus.SERVICE_UNAVAILABLE, {'error': "Server busy, retry shortly"}
+        self.pending += 1
+        try:
+            payload = json.loads(body or b'{}')
+            if not isinstance(payload, dict):
+                raise ValueError("Request body must be a JSON object")
+            result = await routes[path](payload)
+            self.served += 1
+            return HTTPStatus.OK, result
+        except (ValueError, TypeError) as e:
+            return HTTPStatus.BAD_REQUEST, {'error': str(e)}
+        except Exception as e:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(e)}
+        finally:
+            self.pending -= 1
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except RequestError as e:
+                    # Where the next request would start is unknown, so answer and close
+                    writer.write(_response(e.status, {'error': str(e)}, False))
+                    await writer.drain()
+                    break
+                except ValueError as e:
+                    writer.write(_response(HTTPStatus.BAD_REQUEST, {'error': f"Malformed request: {e}"}, False))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                if body is _TOO_LARGE:
+                    status, payload = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': "Body too large"}
+                else:
+                    status, payload = await self.dispatch(method, path, body)
+                keep_alive = headers.get('connection', '').lower() != 'close' and body is not _TOO_LARGE
+                writer.write(_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8000):
+        self.batcher.start()
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_BODY_BYTES)
+        print(f"FAQ API listening on http://{host}:{server.sockets[0].getsockname()[1]}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.batcher.stop()
+            self.llm_executor.shutdown(wait=False)
+
+def _query_args(body):
+    query = body.get('query')
+    if not isinstance(query, str) or not query.strip():
+        raise ValueError("'query' must be a non-empty string")
+    top_k = int(body.get('top_k', TOP_K_RETRIEVAL))
+    if top_k < 1:
+        raise ValueError("'top_k' must be at least 1")
+    return query, top_k
+
+_TOO_LARGE = object()
+
+class RequestError(ValueError):
+    """A request the server will not read further; answered with `status` and the connection closed."""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+async def _read_request(reader):
+    """
+    (method, path, headers, body) for the next request, or None at EOF.
+    Raises ValueError for a malformed request line, header or Content-Length,
+    and RequestError for too many or too large headers and chunked bodies.
+    """
+    line = await reader.readline()  # ValueError past the stream limit too
+    if not line.strip():
+        return None
+    parts = line.decode('latin-1').split(' ', 2)
+    if len(parts) != 3:
+        raise ValueError(f"bad request line {line[:100]!r}")
+    method, path, _ = parts
+    headers = {}
+    n_headers = header_bytes = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        n_headers += 1
+        header_bytes += len(line)
+        if n_headers > MAX_HEADERS or header_bytes > MAX_HEADER_BYTES:
+            raise RequestError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE,
+                               f"At most {MAX_HEADERS} headers and {MAX_HEADER_BYTES} bytes of headers")
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if 'transfer-encoding' in headers:
+        if headers['transfer-encoding'].lower() == 'chunked':
+            raise RequestError(HTTPStatus.LENGTH_REQUIRED, "Chunked bodies are not supported; send Content-Length")
+        raise RequestError(HTTPStatus.NOT_IMPLEMENTED, f"Unsupported Transfer-Encoding {headers['transfer-encoding']!r}")
+    length = int(headers.get('content-length', 0))
+    if length < 0:
+        raise ValueError(f"bad Content-Length {length}")
+    if length > MAX_BODY_BYTES:
+        return method, path, headers, _TOO_LARGE
+    body = await reader.readexactly(length) if length else b''
+    return method, path, headers, body
+
+def _json_default(obj):
+    # Retrieval results carry numpy ints/floats (indices, distances)
+    if hasattr(obj, 'item'):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def _response(status, payload, keep_alive):
+    if isinstance(payload, str):
+        data, content_type = payload.encode('utf8'), 'text/plain; version=0.0.4'
+    else:
+        data, content_type = json.dumps(payload, ensure_ascii=False, default=_json_default).encode('utf8'), 'application/json'
+    lines = [
+        f"HTTP/1.1 {status.value} {status.phrase}",
+        f"Content-Type: {content_type}",
+        f"Content-Length: {len(data)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    if status == HTTPStatus.SERVICE_UNAVAILABLE:
+        lines.append("Retry-After: 1")
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + data
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the FAQ bot over HTTP")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--batch-window-ms', type=float, default=API_BATCH_WINDOW_MS)
+    parser.add_argument('--max-batch', type=int, default=API_MAX_BATCH)
+    parser.add_argument('--max-pending', type=int, default=API_MAX_PENDING)
+    parser.add_argument('--llm-workers', type=int, default=API_LLM_WORKERS)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    pipeline = get_pipeline()
+    for name, secs in pipeline.warmup().items():
+        print(f"Loaded {name} in {secs:.2f}s")
+    # Enough pooled connections for every LLM worker
+    set_client(TogetherClient(pool_size=args.llm_workers))
+    server = APIServer(pipeline, window=args.batch_window_ms / 1000, max_batch=args.max_batch,
+                       max_pending=args.max_pending, llm_workers=args.llm_workers)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
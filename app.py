@@ -1,5 +1,6 @@
 import streamlit as st
-from models.rag_pipeline import rag_answer
+from models.rag_pipeline import get_pipeline
+from models.config import RETRIEVAL_MODE
 from langdetect import detect
 from translate import Translator
 
@@ -7,50 +8,93 @@ st.set_page_config(page_title="Jupiter Money FAQ Bot", page_icon="💬")
 st.title("Jupiter Money FAQ Bot")
 st.write("Ask any question about Jupiter's banking services. The bot will find the best FAQ and answer conversationally!")
 
+MAX_SESSION_ANSWERS = 50  # Answers kept per session so reruns don't re-query the LLM
+
+# One pipeline per process, shared by every session and rerun
+@st.cache_resource(show_spinner="Loading FAQ index and model...")
+def load_pipeline():
+    pipeline = get_pipeline()
+    pipeline.warmup()
+    return pipeline
+
+@st.cache_data(show_spinner=False, max_entries=1000)
+def detect_language(text):
+    try:
+        return detect(text)
+    except Exception:
+        return 'en'
+
+# Raises on failure so failed translations are not cached
+@st.cache_data(show_spinner=False, max_entries=1000)
+def translate_text(text, to_lang, from_lang):
+    return Translator(to_lang=to_lang, from_lang=from_lang).translate(text)
+
+pipeline = load_pipeline()
+
 if 'user_query' not in st.session_state:
     st.session_state['user_query'] = ''
 if 'detected_lang' not in st.session_state:
     st.session_state['detected_lang'] = 'en'
-if 'translated_answer' not in st.session_state:
-    st.session_state['translated_answer'] = ''
+if 'answers' not in st.session_state:
+    st.session_state['answers'] = {}       # query_for_rag -> rag_answer result
+if 'translations' not in st.session_state:
+    st.session_state['translations'] = {}  # (query_for_rag, lang) -> translated answer
 
 user_query = st.text_input("Ask a question:", value=st.session_state['user_query'], key="user_query_input")
 
 if user_query:
     # Detect language
-    try:
-        detected_lang = detect(user_query)
-    except Exception:
-        detected_lang = 'en'
+    detected_lang = detect_language(user_query)
     st.session_state['detected_lang'] = detected_lang
-    # Translate to English if needed
+    # Translate to English if needed; the multilingual index embeds the query as-is
+    multilingual = RETRIEVAL_MODE == 'multilingual'
+    answer_language = detected_lang if multilingual and detected_lang != 'en' else None
     query_for_rag = user_query
-    if detected_lang != 'en':
-        translator = Translator(to_lang='en', from_lang=detected_lang)
+    if detected_lang != 'en' and not multilingual:
         try:
-            query_for_rag = translator.translate(user_query)
+            query_for_rag = translate_text(user_query, 'en', detected_lang)
         except Exception:
             query_for_rag = user_query
-    with st.spinner("Thinking..."):
-        # try:
-        result = rag_answer(query_for_rag, return_prompt=True)
-        answer = result['llm_response']
-        # except Exception as e:
-        #     answer = "Sorry, the model is taking too long to respond. Please try again later."
-        #     result = {'llm_response': answer, 'retrieved_faq': {'question': '', 'answer': ''}, 'related_questions': [], 'system_prompt': ''}
     st.subheader("Bot's Answer")
-    st.markdown(answer)
+    answer_box = st.empty()
+    answers = st.session_state['answers']
+    result = answers.get(query_for_rag)
+    if result is None:
+        answer_box.markdown("_Thinking..._")
+        # Render tokens as they stream in, then swap in the cleaned final answer
+        streamed = ''
+        for event in pipeline.rag_answer_stream(query_for_rag, return_prompt=True, answer_language=answer_language):
+            if event['type'] == 'token':
+                streamed += event['text']
+                answer_box.markdown(streamed + "▌")
+            else:
+                result = event['result']
+        # Widget clicks rerun the script; reuse this answer instead of asking the LLM again.
+        # A degraded answer is not kept, so the next rerun gives the LLM another chance.
+        if result.get('answer_source') != 'degraded':
+            answers[query_for_rag] = result
+            if len(answers) > MAX_SESSION_ANSWERS:
+                answers.pop(next(iter(answers)))
+    answer = result['llm_response']
+    answer_box.markdown(answer)
+    timing = result['timing']
+    st.caption(f"First token in {timing['time_to_first_token']:.2f}s, full answer in {timing['total_time']:.2f}s")
+    if result.get('answer_source') == 'faq':
+        st.caption("Answered directly from a matching FAQ.")
+    elif result.get('answer_source') == 'degraded':
+        st.caption("The assistant is slow to respond right now, so this is the closest FAQ answer.")
     # Option to translate answer back to original language
-    if detected_lang != 'en':
+    if detected_lang != 'en' and not multilingual:
+        translation_key = (query_for_rag, detected_lang)
         if st.button(f"Translate answer to {detected_lang}"):
-            translator = Translator(to_lang=detected_lang, from_lang='en')
             try:
-                translated = translator.translate(result['llm_response'])
+                translated = translate_text(answer, detected_lang, 'en')
             except Exception:
-                translated = "[Translation failed] " + result['llm_response']
-            st.session_state['translated_answer'] = translated
-        if st.session_state['translated_answer']:
-            st.markdown(f"**Translated Answer:** {st.session_state['translated_answer']}")
+                translated = "[Translation failed] " + answer
+            st.session_state['translations'][translation_key] = translated
+        translated = st.session_state['translations'].get(translation_key)
+        if translated:
+            st.markdown(f"**Translated Answer:** {translated}")
     # Related questions as clickable suggestions
     if result['related_questions']:
         st.markdown("**Related questions:**")
@@ -59,7 +103,6 @@ if user_query:
             label = q['question']
             if cols[i].button(label, key=f"related_{i}"):
                 st.session_state['user_query'] = q['question']
-                st.session_state['translated_answer'] = ''
                 st.rerun()
     with st.expander("Show thinking process (retrieved FAQ, prompt, etc.)"):
         st.markdown("---")
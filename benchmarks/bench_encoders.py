@@ -0,0 +1,163 @@
+"""
+Parity and speed of the query encoder backends against torch fp32.
+
+    python -m models.encoders --export                  # once, for the onnx backends
+    python -m benchmarks.bench_encoders --out bench_encoders.json
+    python -m benchmarks.bench_encoders --backends torch,onnx_int8 --faq-queries 500
+
+Queries are the labelled questions (rag_vs_llm_results.csv by default) plus a
+sample of FAQ questions. For every backend, against the torch fp32 vectors of
+the same queries:
+
+    drift       1 - cosine similarity per query (mean, p99, max)
+    agreement   top-1 match and top-k overlap when searching the FAQ index
+    latency     single-query encode p50/p95, batch throughput, and single-query
+                latency once the query-embedding LRU holds the query
+    cold start  import + load + first encode in a fresh process, its peak RSS
+                and whether torch was imported at all
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+from models.rag_pipeline import FAQPipeline
+from models.encoders import ENCODER_BACKENDS, CachedEncoder, load_encoder
+from models.calibrate_direct_answer import load_labels
+from models.index_factory import normalize
+from models.config import TOP_K_RETRIEVAL
+from .bench_rag import summarize
+
+COLD_START = """
+import json, resource, sys, time
+start = time.perf_counter()
+from models.encoders import load_encoder
+encoder = load_encoder(sys.argv[1], sys.argv[2])
+loaded = time.perf_counter()
+encoder.encode(['warmup query'])
+first_encode = time.perf_counter() - loaded
+# ru_maxrss survives exec on Linux (it would report the parent's peak); VmHWM does not
+peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+try:
+    with open('/proc/self/status') as f:
+        peak_kb = next(int(line.split()[1]) for line in f if line.startswith('VmHWM'))
+except OSError:
+    pass
+print(json.dumps({
+    'load_s': loaded - start,
+    'first_encode_s': first_encode,
+    'peak_rss_mb': peak_kb / 1024,
+    'torch_imported': 'torch' in sys.modules,
+}))
+"""
+
+def load_queries(labels_path, pipeline, n_faq, seed=0):
+    queries = [query for query, _, _ in load_labels(labels_path)] if labels_path and os.path.exists(labels_path) else []
+    questions = list(pipeline.questions)
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(questions), size=min(n_faq, len(questions)), replace=False)
+    return queries + [questions[i] for i in sorted(picks)]
+
+def cold_start(model_name, backend):
+    result = subprocess.run([sys.executable, '-c', COLD_START, model_name, backend],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        return {'error': result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'failed'}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def search(pipeline, vectors, k):
+    index = pipeline.index  # loads index_meta too
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    if pipeline.index_meta.get('normalize'):
+        vectors = normalize(vectors)
+    _, I = index.search(vectors, k)
+    return I
+
+def parity(reference, vectors, ref_hits, hits):
+    cos = (normalize(reference.copy()) * normalize(vectors.copy())).sum(axis=1)
+    drift = 1.0 - cos
+    overlap = [len(set(a) & set(b)) / len(a) for a, b in zip(ref_hits, hits)]
+    return {
+        'drift_mean': float(drift.mean()),
+        'drift_p99': float(np.percentile(drift, 99)),
+        'drift_max': float(drift.max()),
+        'top1_agreement': float(np.mean(ref_hits[:, 0] == hits[:, 0])),
+        'topk_overlap': float(np.mean(overlap)),
+    }
+
+def speed(encoder, queries, batch_size):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        encoder.encode([query])
+        latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    for i in range(0, len(queries), batch_size):
+        encoder.encode(queries[i:i + batch_size])
+    batch_wall = time.perf_counter() - start
+    # Second pass through a warm LRU: what repeated questions cost
+    cached = CachedEncoder(encoder, max_entries=len(queries))
+    cached.encode(queries)
+    cached_latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        cached.encode([query])
+        cached_latencies.append(time.perf_counter() - start)
+    single = summarize(latencies)
+    return {
+        'single_p50_ms': single['p50_ms'],
+        'single_p95_ms': single['p95_ms'],
+        'batch_qps': len(queries) / batch_wall,
+        'cached_p50_ms': summarize(cached_latencies)['p50_ms'],
+    }
+
+def run(model_name, backends, labels_path, n_faq, k=TOP_K_RETRIEVAL, batch_size=32):
+    pipeline = FAQPipeline(model_name=model_name, answer_cache=False, query_cache_size=0)
+    queries = load_queries(labels_path, pipeline, n_faq)
+    results = {'meta': {'timestamp': time.time(), 'model_name': model_name, 'queries': len(queries), 'k': k}}
+    reference = np.asarray(load_encoder(model_name, 'torch').encode(queries), dtype='float32')
+    ref_hits = search(pipeline, reference, k)
+    for backend in backends:
+        row = {'cold_start': cold_start(model_name, backend)}
+        try:
+            encoder = load_encoder(model_name, backend)
+        except Exception as e:
+            row['error'] = str(e)
+            results[backend] = row
+            print(f"{backend}: unavailable ({e})")
+            continue
+        vectors = np.asarray(encoder.encode(queries), dtype='float32')
+        row.update(parity(reference, vectors, ref_hits, search(pipeline, vectors, k)))
+        row.update(speed(encoder, queries, batch_size))
+        results[backend] = row
+        cold = row['cold_start']
+        print(f"{backend}: drift mean {row['drift_mean']:.2e} max {row['drift_max']:.2e}, "
+              f"top-1 {row['top1_agreement']:.3f}, top-{k} overlap {row['topk_overlap']:.3f}, "
+              f"p50 {row['single_p50_ms']:.1f}ms, {row['batch_qps']:.0f} q/s batched, "
+              f"cold start {cold.get('load_s', float('nan')):.2f}s / {cold.get('peak_rss_mb', float('nan')):.0f}MB")
+    return results
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare query encoder backends with torch fp32")
+    parser.add_argument('--model', default=None, help="Embedding model (default MODEL_NAME)")
+    parser.add_argument('--backends', default=','.join(ENCODER_BACKENDS))
+    parser.add_argument('--labels', default='rag_vs_llm_results.csv', help="Labelled CSV or JSONL of queries")
+    parser.add_argument('--faq-queries', type=int, default=200, help="FAQ questions added to the query set")
+    parser.add_argument('--k', type=int, default=TOP_K_RETRIEVAL)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--out', default='bench_encoders.json')
+    return parser.parse_args()
+
+def main():
+    from models.rag_pipeline import MODEL_NAME
+    args = parse_args()
+    results = run(args.model or MODEL_NAME, args.backends.split(','), args.labels, args.faq_queries,
+                  k=args.k, batch_size=args.batch_size)
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.out}")
+
+if __name__ == "__main__":
+    main()
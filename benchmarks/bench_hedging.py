@@ -0,0 +1,104 @@
+"""
+Hedged LLM calls against two local stub providers.
+
+    python -m benchmarks.bench_hedging --requests 400 --tail-rate 0.05 --tail-latency 3
+    python -m benchmarks.bench_hedging --deadline 1.0 --out bench_hedging.json
+
+The primary stub speaks the Together API and sends `tail_rate` of its
+replies after `tail_latency` seconds; the secondary stub speaks the Hugging
+Face Inference API. Each configuration (primary only, hedged, and with
+--deadline each of them under that deadline) gets the same requests, and
+reports latency percentiles, which provider answered, and how many
+requests missed the deadline (the pipeline answers those with the top FAQ,
+flagged degraded).
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from models.llm_providers import HedgedLLM, HuggingFaceProvider, TogetherProvider
+from models.together_inference import DeadlineExceeded, TogetherClient
+from models.prompt_builder import build_prompt
+from .bench_rag import summarize
+from .stub_together import start_stub_server
+
+SAMPLE_FAQ = {
+    'question': 'How can I do KYC on Jupiter?', 'category': 'KYC', 'subcategory': None,
+    'answer': 'Open the Jupiter app, go to Profile and follow the steps to complete your video KYC.',
+}
+
+def run_config(name, llm, n_requests, concurrency, deadline):
+    def one(i):
+        # Distinct prompts so the client's single-flight does not merge requests
+        prompt = build_prompt(f"how do I do kyc #{i}", [SAMPLE_FAQ])
+        start = time.monotonic()
+        try:
+            _, provider = llm.complete(prompt, deadline=start + deadline if deadline else None)
+        except DeadlineExceeded:
+            provider = 'degraded'
+        return time.monotonic() - start, provider
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(n_requests)))
+    latencies = [latency for latency, _ in outcomes]
+    answered_by = {}
+    for _, provider in outcomes:
+        answered_by[provider] = answered_by.get(provider, 0) + 1
+    report = dict(summarize(latencies), max_ms=1000 * max(latencies), answered_by=answered_by)
+    print(f"{name}: p50 {report['p50_ms']:.0f}ms p99 {report['p99_ms']:.0f}ms max {report['max_ms']:.0f}ms, "
+          f"answered by {answered_by}")
+    return report
+
+def run(n_requests=400, concurrency=8, latency=0.2, jitter=0.05, tail_rate=0.05, tail_latency=3.0,
+        secondary_latency=0.3, deadline=None, hedge_quantile=0.95):
+    primary_server, _, primary_url = start_stub_server(latency=latency, jitter=jitter, tail_rate=tail_rate,
+                                                       tail_latency=tail_latency)
+    secondary_server, _, secondary_url = start_stub_server(latency=secondary_latency, jitter=jitter)
+    client = TogetherClient(api_url=primary_url, api_key='stub', pool_size=concurrency * 2)
+    primary = TogetherProvider(client)
+    secondary = HuggingFaceProvider(api_url=secondary_url)
+    results = {'meta': {
+        'timestamp': time.time(), 'requests': n_requests, 'concurrency': concurrency, 'latency': latency,
+        'tail_rate': tail_rate, 'tail_latency': tail_latency, 'secondary_latency': secondary_latency,
+        'deadline': deadline,
+    }}
+    configs = [('primary_only', [primary]), ('hedged', [primary, secondary])]
+    try:
+        for name, providers in configs:
+            # min_samples=20: the first requests hedge after the initial delay, then after the measured quantile
+            llm = HedgedLLM(providers, quantile=hedge_quantile, initial_delay=latency * 2, max_workers=concurrency * 4)
+            results[name] = run_config(name, llm, n_requests, concurrency, None)
+            results[name]['hedge'] = llm.stats()
+            if deadline:
+                results[f'{name}_deadline'] = run_config(f'{name} (deadline {deadline}s)', llm, n_requests,
+                                                         concurrency, deadline)
+    finally:
+        client.close()
+        primary_server.shutdown()
+        secondary_server.shutdown()
+    return results
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark hedged LLM calls against two stub providers")
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.2, help="Primary's typical latency (s)")
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--tail-rate', type=float, default=0.05, help="Fraction of slow primary replies")
+    parser.add_argument('--tail-latency', type=float, default=3.0)
+    parser.add_argument('--secondary-latency', type=float, default=0.3)
+    parser.add_argument('--hedge-quantile', type=float, default=0.95)
+    parser.add_argument('--deadline', type=float, help="Also run each configuration under this deadline (s)")
+    parser.add_argument('--out', default='bench_hedging.json')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    results = run(n_requests=args.requests, concurrency=args.concurrency, latency=args.latency, jitter=args.jitter,
+                  tail_rate=args.tail_rate, tail_latency=args.tail_latency, secondary_latency=args.secondary_latency,
+                  deadline=args.deadline, hedge_quantile=args.hedge_quantile)
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.out}")
+
+if __name__ == "__main__":
+    main()
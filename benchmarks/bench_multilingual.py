@@ -0,0 +1,139 @@
+"""
+Translate-then-retrieve vs. multilingual-embedding retrieval on Hindi and
+French queries.
+
+    python -m models.build_faiss_index --multilingual    # once
+    python -m benchmarks.bench_multilingual --out bench_multilingual.json
+    python -m benchmarks.bench_multilingual --with-llm   # also time full answers
+
+The translate path is what app.py does by default: langdetect, a
+translate.Translator call to English, then retrieval with MiniLM (and, with
+--with-llm, an English answer translated back). The multilingual path embeds
+the original query and asks the LLM to answer in the user's language in the
+same call. Reports hit@1 / hit@k against the FAQ each query was written for,
+latency percentiles and translation failures, per language and path.
+"""
+import argparse
+import json
+import time
+from langdetect import detect
+from translate import Translator
+from models.rag_pipeline import get_pipeline
+from models.related_graph import question_key
+from models.config import TOP_K_RETRIEVAL
+from .bench_rag import summarize
+
+# (language, query, FAQ question it should retrieve)
+EXAMPLES = [
+    ('hi', "मैं बचत खाता कैसे खोल सकता हूँ?", "how can i open a savings account?"),
+    ('hi', "जुपिटर मनी क्या है?", "what is jupiter money?"),
+    ('hi', "क्या जुपिटर एक बैंक है?", "is jupiter a bank?"),
+    ('hi', "केवाईसी क्या है?", "What is KYC?"),
+    ('hi', "मैं जुपिटर पर केवाईसी कैसे कर सकता हूँ?", "How can I do KYC on Jupiter?"),
+    ('hi', "मुझे चेकबुक कैसे मिल सकती है?", "How can I get a chequebook?"),
+    ('hi', "मैं जुपिटर पर UPI नंबर कैसे बना सकता हूँ?", "How can I create a UPI number on Jupiter?"),
+    ('hi', "मैं जुपिटर से पैसे कैसे ट्रांसफर करूं?", "how can i transfer money from jupiter?"),
+    ('hi', "मैंने गलत UPI ID पर पैसे भेज दिए, अब मैं क्या करूं?", "I transferred money to a wrong UPI ID. What can I do now?"),
+    ('hi', "जुपिटर का व्हाट्सएप नंबर क्या है?", "what is jupiter's whatsapp number?"),
+    ('hi', "क्या मेरा वित्तीय डेटा सुरक्षित है?", "Is my financial data secure?"),
+    ('hi', "मैं अपने डेबिट कार्ड का पिन कैसे सेट करूं?", "how can i set a pin for my debit card?"),
+    ('fr', "Comment puis-je ouvrir un compte d'épargne ?", "how can i open a savings account?"),
+    ('fr', "Qu'est-ce que Jupiter Money ?", "what is jupiter money?"),
+    ('fr', "Jupiter est-il une banque ?", "is jupiter a bank?"),
+    ('fr', "Qu'est-ce que le KYC ?", "What is KYC?"),
+    ('fr', "Comment faire le KYC sur Jupiter ?", "How can I do KYC on Jupiter?"),
+    ('fr', "Comment puis-je obtenir un chéquier ?", "How can I get a chequebook?"),
+    ('fr', "Comment créer un numéro UPI sur Jupiter ?", "How can I create a UPI number on Jupiter?"),
+    ('fr', "Comment transférer de l'argent depuis Jupiter ?", "how can i transfer money from jupiter?"),
+    ('fr', "J'ai envoyé de l'argent au mauvais identifiant UPI, que puis-je faire ?",
+     "I transferred money to a wrong UPI ID. What can I do now?"),
+    ('fr', "Quel est le numéro WhatsApp de Jupiter ?", "what is jupiter's whatsapp number?"),
+    ('fr', "Mes données financières sont-elles sécurisées ?", "Is my financial data secure?"),
+    ('fr', "Que dois-je faire si je pense que ma carte a été utilisée frauduleusement ?",
+     "What should I do if I think my card has been used fraudulently?"),
+]
+
+def translate_path(pipeline, query, top_k, with_llm):
+    """Returns (retrieved questions, translation failures) the way app.py answers in translate mode."""
+    failures = 0
+    try:
+        lang = detect(query)
+    except Exception:
+        lang = 'en'
+    query_en = query
+    if lang != 'en':
+        try:
+            query_en = Translator(to_lang='en', from_lang=lang).translate(query)
+        except Exception:
+            failures += 1
+    if not with_llm:
+        return [r['question'] for r in pipeline.retrieve_faq(query_en, top_k=top_k)], failures
+    result = pipeline.rag_answer(query_en, top_k=top_k)
+    if lang != 'en':
+        try:
+            Translator(to_lang=lang, from_lang='en').translate(result['llm_response'])
+        except Exception:
+            failures += 1
+    return [r['question'] for r in result['retrieved_faqs']], failures
+
+def multilingual_path(pipeline, query, top_k, with_llm):
+    if not with_llm:
+        return [r['question'] for r in pipeline.retrieve_faq(query, top_k=top_k)], 0
+    try:
+        lang = detect(query)
+    except Exception:
+        lang = 'en'
+    result = pipeline.rag_answer(query, top_k=top_k, answer_language=lang)
+    return [r['question'] for r in result['retrieved_faqs']], 0
+
+def run_path(name, path_fn, pipeline, examples, top_k, with_llm):
+    rows = {}
+    for lang, query, expected in examples:
+        start = time.perf_counter()
+        questions, failures = path_fn(pipeline, query, top_k, with_llm)
+        elapsed = time.perf_counter() - start
+        keys = [question_key(q) for q in questions]
+        row = rows.setdefault(lang, {'latencies': [], 'hit@1': 0, f'hit@{top_k}': 0, 'translation_failures': 0})
+        row['latencies'].append(elapsed)
+        row['hit@1'] += int(bool(keys) and keys[0] == question_key(expected))
+        row[f'hit@{top_k}'] += int(question_key(expected) in keys)
+        row['translation_failures'] += failures
+    report = {}
+    for lang, row in rows.items():
+        n = len(row['latencies'])
+        report[lang] = dict(
+            summarize(row.pop('latencies')),
+            **{key: value / n if key.startswith('hit@') else value for key, value in row.items()}
+        )
+    print(f"{name}: " + ", ".join(
+        f"{lang} hit@1 {r['hit@1']:.2f} p50 {r['p50_ms']:.0f}ms" for lang, r in report.items()
+    ))
+    return report
+
+def run(top_k=TOP_K_RETRIEVAL, with_llm=False, repeats=1):
+    examples = EXAMPLES * repeats
+    results = {'meta': {'timestamp': time.time(), 'top_k': top_k, 'with_llm': with_llm, 'queries': len(examples)}}
+    for name, mode, path_fn in (('translate', 'translate', translate_path),
+                                ('multilingual', 'multilingual', multilingual_path)):
+        pipeline = get_pipeline(mode)
+        results['meta'][f'{name}_load_times_s'] = pipeline.warmup()
+        results[name] = run_path(name, path_fn, pipeline, examples, top_k, with_llm)
+    return results
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare translate-then-retrieve with multilingual retrieval")
+    parser.add_argument('--top-k', type=int, default=TOP_K_RETRIEVAL)
+    parser.add_argument('--with-llm', action='store_true', help="Time full answers, not just retrieval")
+    parser.add_argument('--repeats', type=int, default=1, help="Run the example set this many times")
+    parser.add_argument('--out', default='bench_multilingual.json')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    results = run(top_k=args.top_k, with_llm=args.with_llm, repeats=args.repeats)
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"Results written to {args.out}")
+
+if __name__ == "__main__":
+    main()
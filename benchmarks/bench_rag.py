@@ -0,0 +1,181 @@
+"""
+Offline latency/throughput benchmark for the RAG pipeline.
+
+    python -m benchmarks.bench_rag --sizes 0,10000,100000 --concurrency 1,4,16 \
+        --llm-latency 0.3 --out bench_results.json
+
+Size 0 means the real corpus and index. Larger sizes are synthetic corpora:
+the real FAQs repeated with varied question text, indexed over jittered
+copies of the real embeddings, so nothing has to be re-encoded. LLM calls go
+to a local stub Together server (benchmarks/stub_together.py).
+
+Reports p50/p95/p99 latency and QPS per stage (encode, search, related
+lookup, prompt build, LLM call, answer extraction) and end-to-end at each
+concurrency level, as JSON.
+"""
+import argparse
+import json
+import platform
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from models.rag_pipeline import (
+    FAQPipeline, QueryContext, build_prompt, complete_prompt, extract_final_answer, group_similar_faqs, search_width
+)
+from models.together_inference import TogetherClient, set_client
+from models.index_factory import build_index, index_meta, normalize
+from models.config import TOP_K_RETRIEVAL, TOP_K_RELATED
+from .stub_together import start_stub_server
+
+STAGES = ('encode', 'search', 'related', 'prompt', 'llm', 'extract')
+
+def summarize(samples, wall_time=None):
+    samples = np.asarray(samples, dtype='float64')
+    summary = {
+        'n': int(len(samples)),
+        'mean_ms': 1000 * float(samples.mean()),
+        'p50_ms': 1000 * float(np.percentile(samples, 50)),
+        'p95_ms': 1000 * float(np.percentile(samples, 95)),
+        'p99_ms': 1000 * float(np.percentile(samples, 99)),
+    }
+    # Stage QPS is for back-to-back calls on one thread; end-to-end QPS uses wall time
+    summary['qps'] = len(samples) / (wall_time if wall_time is not None else float(samples.sum()))
+    return summary
+
+def make_queries(questions, n, seed=0):
+    """User-like variants of real questions (casing, punctuation, filler)."""
+    rng = np.random.default_rng(seed)
+    fillers = ['', 'please tell me ', 'hey, ', 'i want to know ', 'quick question: ']
+    queries = []
+    for i in rng.integers(0, len(questions), size=n):
+        q = questions[i].rstrip('?').lower()
+        queries.append(f"{fillers[rng.integers(0, len(fillers))]}{q}{'?' if rng.random() < 0.5 else ''}")
+    return queries
+
+def synthetic_pipeline(base, size, index_type='flat_l2', seed=0):
+    """A pipeline over `size` synthetic FAQs derived from the base pipeline's corpus."""
+    rng = np.random.default_rng(seed)
+    faqs = base.faqs
+    embeddings = np.asarray(base.embeddings, dtype='float32')
+    picks = rng.integers(0, len(faqs), size=size)
+    synthetic_faqs = []
+    for n, i in enumerate(picks):
+        faq = faqs[i]
+        synthetic_faqs.append({
+            'question': f"{faq['question']} (variant {n})",
+            'answer': faq['answer'],
+            'category': faq['category'],
+            'subcategory': faq['subcategory'],
+        })
+    vectors = embeddings[picks] + rng.normal(0, 0.05, size=(size, embeddings.shape[1])).astype('float32')
+    index, params = build_index(vectors.astype('float32'), index_type)
+    pipeline = FAQPipeline(answer_cache=False, query_cache_size=0)
+    return pipeline.use_components(faqs=synthetic_faqs, index=index, model=base.model,
+                                   index_meta=index_meta(index_type, params), embeddings=vectors)
+
+def bench_stages(pipeline, queries, top_k=TOP_K_RETRIEVAL):
+    """Run the rag_answer steps one by one and time each of them."""
+    timings = {stage: [] for stage in STAGES}
+    for query in queries:
+        t0 = time.perf_counter()
+        emb = pipeline.model.encode([query]).astype('float32')
+        t1 = time.perf_counter()
+        if pipeline.index_meta.get('normalize'):
+            emb = normalize(emb)
+        D, I = pipeline.index.search(emb, min(search_width(top_k), pipeline.index.ntotal))
+        ctx = QueryContext(query, emb[0], D[0], pipeline._to_positions(I)[0])
+        t2 = time.perf_counter()
+        retrieved = group_similar_faqs(pipeline.retrieve_faq(query, top_k=top_k, ctx=ctx))
+        top = retrieved[0]
+        pipeline.get_related_questions(query, exclude_idx=top['index'], top_k=TOP_K_RELATED,
+                                       category=top['category'], subcategory=top['subcategory'], ctx=ctx)
+        t3 = time.perf_counter()
+        prompt = build_prompt(query, retrieved, top_k=top_k)
+        t4 = time.perf_counter()
+        llm_response = complete_prompt(prompt)
+        t5 = time.perf_counter()
+        extract_final_answer(llm_response)
+        t6 = time.perf_counter()
+        for stage, (a, b) in zip(STAGES, [(t0, t1), (t1, t2), (t2, t3), (t3, t4), (t4, t5), (t5, t6)]):
+            timings[stage].append(b - a)
+    return {stage: summarize(samples) for stage, samples in timings.items()}
+
+def bench_concurrency(pipeline, queries, level):
+    """End-to-end rag_answer latency and throughput with `level` concurrent callers."""
+    def one(query):
+        start = time.perf_counter()
+        pipeline.rag_answer(query)
+        return time.perf_counter() - start
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=level) as pool:
+        latencies = list(pool.map(one, queries))
+    wall = time.perf_counter() - start
+    return dict(summarize(latencies, wall_time=wall), concurrency=level)
+
+def run(sizes, levels, n_requests, llm_latency, llm_jitter, index_type='flat_l2', n_stage_queries=200):
+    server, stub, url = start_stub_server(latency=llm_latency, jitter=llm_jitter)
+    set_client(TogetherClient(api_url=url, api_key='stub', pool_size=max(levels)))
+    # No query-embedding LRU: repeated benchmark queries would time cache hits as the encode stage
+    base = FAQPipeline(answer_cache=False, query_cache_size=0)
+    load_times = base.warmup()
+    results = {
+        'meta': {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'llm_latency_s': llm_latency,
+            'llm_jitter_s': llm_jitter,
+            'index_type': index_type,
+            'requests_per_level': n_requests,
+            'load_times_s': load_times,
+        },
+        'runs': [],
+    }
+    try:
+        for size in sizes:
+            pipeline = base if size == 0 else synthetic_pipeline(base, size, index_type=index_type)
+            corpus_size = len(pipeline.questions)
+            print(f"Corpus of {corpus_size} FAQs")
+            queries = make_queries(base.questions, max(n_requests, n_stage_queries))
+            run_result = {
+                'corpus_size': corpus_size,
+                'synthetic': size != 0,
+                'stages': bench_stages(pipeline, queries[:n_stage_queries]),
+                'concurrency': [],
+            }
+            for level in levels:
+                row = bench_concurrency(pipeline, queries[:n_requests], level)
+                print(f"  concurrency {level}: p50 {row['p50_ms']:.0f}ms p95 {row['p95_ms']:.0f}ms {row['qps']:.1f} qps")
+                run_result['concurrency'].append(row)
+            results['runs'].append(run_result)
+    finally:
+        server.shutdown()
+    results['meta']['stub_requests'] = stub.requests
+    return results
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the RAG pipeline against a stub LLM")
+    parser.add_argument('--sizes', default='0,10000,100000', help="Corpus sizes; 0 is the real corpus")
+    parser.add_argument('--concurrency', default='1,4,16', help="Concurrent callers per level")
+    parser.add_argument('--requests', type=int, default=200, help="rag_answer calls per concurrency level")
+    parser.add_argument('--stage-queries', type=int, default=200, help="Queries for the per-stage timings")
+    parser.add_argument('--llm-latency', type=float, default=0.3, help="Stub LLM latency in seconds")
+    parser.add_argument('--llm-jitter', type=float, default=0.05)
+    parser.add_argument('--index-type', default='flat_l2', help="Index type for synthetic corpora")
+    parser.add_argument('--out', default='bench_results.json')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    results = run(
+        [int(s) for s in args.sizes.split(',')],
+        [int(c) for c in args.concurrency.split(',')],
+        args.requests, args.llm_latency, args.llm_jitter,
+        index_type=args.index_type, n_stage_queries=args.stage_queries,
+    )
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Memory and retrieval throughput of N worker processes on one host.
+
+    python -m benchmarks.bench_workers --workers 1,4,16 --faqs 100000 --duration 10
+    python -m benchmarks.bench_workers --backend onnx_int8 --out bench_workers.json
+
+Two modes are compared at each worker count:
+
+    private  every worker loads its own model and index (the default setup)
+    shared   INDEX_MMAP plus one models.encoder_service process: the index
+             is mapped read-only and queries are encoded over a Unix socket
+
+Each worker warms up, then retrieves queries back to back for --duration
+seconds: encode, search and FAQ lookup, without the LLM call, which is
+remote either way. Memory is read from /proc/<pid>/smaps_rollup (Linux).
+PSS charges shared pages (page cache, the mapped index) to the processes
+that share them, so total_pss_mb, summed over workers and the encoder
+service, is what the host actually pays.
+
+--faqs N writes a synthetic corpus of N FAQs (the real ones repeated, over
+jittered copies of the real embeddings) to a temporary directory as a
+columnar corpus and a saved index, so both modes load it from disk.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing.connection import Client
+import numpy as np
+from models.rag_pipeline import FAQPipeline, DATA_PATH, INDEX_PATH, EMBEDDINGS_PATH, MODEL_NAME
+from models.corpus_store import CORPUS_PATH, load_faq_json, save_columnar_corpus
+from models.index_factory import build_index, save_index
+from models.config import ENCODER_BACKEND
+from .bench_rag import make_queries, summarize
+
+MODES = ('private', 'shared')
+
+def process_memory(pid='self'):
+    """RSS, PSS and private memory (MB) of a process, from /proc/<pid>/smaps_rollup."""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {
+        'rss_mb': fields.get('Rss', 0.0),
+        'pss_mb': fields.get('Pss', 0.0),
+        'private_mb': fields.get('Private_Clean', 0.0) + fields.get('Private_Dirty', 0.0),
+    }
+
+def write_synthetic_artifacts(out_dir, size, index_type='flat_l2', embeddings_path=EMBEDDINGS_PATH, seed=0):
+    """Corpus, embeddings and index for `size` synthetic FAQs; returns FAQPipeline path kwargs."""
+    rng = np.random.default_rng(seed)
+    faqs = load_faq_json(DATA_PATH)
+    embeddings = np.load(embeddings_path).astype('float32')
+    picks = rng.integers(0, len(faqs), size=size)
+    synthetic_faqs = [
+        dict(faqs[i], question=f"{faqs[i]['question']} (variant {n})") for n, i in enumerate(picks)
+    ]
+    vectors = (embeddings[picks] + rng.normal(0, 0.05, size=(size, embeddings.shape[1]))).astype('float32')
+    paths = {
+        'data_path': os.path.join(out_dir, 'faqs.json'),  # Never written: the columnar corpus is used as is
+        'corpus_path': os.path.join(out_dir, 'corpus'),
+        'index_path': os.path.join(out_dir, 'faq.index'),
+        'embeddings_path': os.path.join(out_dir, 'embeddings.npy'),
+        'related_graph_path': os.path.join(out_dir, 'related.npz'),
+        'partitions_path': os.path.join(out_dir, 'partitions.npz'),
+    }
+    save_columnar_corpus(synthetic_faqs, path=paths['corpus_path'])
+    np.save(paths['embeddings_path'], vectors)
+    index, params = build_index(vectors, index_type)
+    save_index(index, paths['index_path'], index_type, params)
+    return paths
+
+def worker(mode, paths, model_name, encoder_service, queries, duration, barrier, results):
+    pipeline = FAQPipeline(answer_cache=False, query_cache_size=0, model_name=model_name,
+                           index_mmap=mode == 'shared', encoder_service=encoder_service, **paths)
+    pipeline.warmup()
+    k = pipeline.search_width()
+    barrier.wait()
+    latencies = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        # Distinct text per call so no cache in front of the encoder can answer
+        query = f"{queries[len(latencies) % len(queries)]} {len(latencies)}"
+        t0 = time.perf_counter()
+        ctx = pipeline.build_query_context(query, k=k)
+        pipeline.retrieve_faq(query, ctx=ctx)
+        latencies.append(time.perf_counter() - t0)
+    results.put({'latencies': latencies, 'wall': time.perf_counter() - start, 'memory': process_memory()})
+
+def start_encoder_service(socket_path, model_name, backend, threads, timeout=300):
+    process = subprocess.Popen([
+        sys.executable, '-m', 'models.encoder_service', '--socket', socket_path, '--model', model_name,
+        '--backend', backend, '--threads', str(threads), '--cache-size', '0',
+    ], stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Encoder service exited with code {process.returncode}")
+        try:
+            Client(socket_path, family='AF_UNIX').close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise TimeoutError("Encoder service did not start")
+
+def run_config(mode, n_workers, paths, model_name, backend, queries, duration, worker_threads, service_threads):
+    ctx = multiprocessing.get_context('spawn')
+    service = None
+    socket_path = None
+    if mode == 'shared':
+        socket_path = os.path.join(tempfile.mkdtemp(prefix='faq-encoder-'), 'encoder.sock')
+        service = start_encoder_service(socket_path, model_name, backend, service_threads)
+    # Private workers each get their own encoder threads; ENCODER_BACKEND/THREADS are read at import
+    os.environ['ENCODER_BACKEND'] = backend
+    os.environ['ENCODER_THREADS'] = str(worker_threads)
+    barrier = ctx.Barrier(n_workers)
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=worker, args=(mode, paths, model_name, socket_path, queries, duration, barrier, results))
+        for _ in range(n_workers)
+    ]
+    try:
+        for process in processes:
+            process.start()
+        outcomes = [results.get() for _ in processes]
+        service_memory = process_memory(service.pid) if service is not None else None
+    finally:
+        for process in processes:
+            process.join()
+        if service is not None:
+            service.terminate()
+            service.wait()
+    latencies = [latency for outcome in outcomes for latency in outcome['latencies']]
+    wall = max(outcome['wall'] for outcome in outcomes)
+    memory = [outcome['memory'] for outcome in outcomes]
+    row = dict(summarize(latencies, wall_time=wall), mode=mode, workers=n_workers)
+    for key in ('rss_mb', 'pss_mb', 'private_mb'):
+        row[f'worker_{key}'] = float(np.mean([m[key] for m in memory]))
+    row['service'] = service_memory
+    row['total_pss_mb'] = sum(m['pss_mb'] for m in memory) + (service_memory['pss_mb'] if service_memory else 0.0)
+    print(f"{mode:>7} x{n_workers:<3} {row['qps']:8.1f} qps  p50 {row['p50_ms']:6.1f}ms p95 {row['p95_ms']:6.1f}ms  "
+          f"per worker RSS {row['worker_rss_mb']:6.0f}MB PSS {row['worker_pss_mb']:6.0f}MB "
+          f"private {row['worker_private_mb']:6.0f}MB  total PSS {row['total_pss_mb']:7.0f}MB")
+    return row
+
+def run(worker_counts, n_faqs=0, model_name=MODEL_NAME, backend=ENCODER_BACKEND, duration=10.0, index_type='flat_l2',
+        worker_threads=1, service_threads=0, modes=MODES):
+    queries = make_queries([faq['question'] for faq in load_faq_json(DATA_PATH)], 500)
+    with tempfile.TemporaryDirectory(prefix='bench-workers-') as tmp:
+        if n_faqs:
+            paths = write_synthetic_artifacts(tmp, n_faqs, index_type=index_type)
+        else:
+            paths = {'data_path': DATA_PATH, 'corpus_path': CORPUS_PATH, 'index_path': INDEX_PATH,
+                     'embeddings_path': EMBEDDINGS_PATH}
+        results = {
+            'meta': {
+                'timestamp': time.time(),
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'cpus': os.cpu_count(),
+                'model': model_name,
+                'backend': backend,
+                'faqs': n_faqs or 'real',
+                'index_bytes': os.path.getsize(paths['index_path']),
+                'duration_s': duration,
+                'worker_threads': worker_threads,
+                'service_threads': service_threads,
+            },
+            'runs': [],
+        }
+        for n_workers in worker_counts:
+            for mode in modes:
+                results['runs'].append(run_config(mode, n_workers, paths, model_name, backend, queries, duration,
+                                                  worker_threads, service_threads))
+    return results
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark memory and throughput of several worker processes")
+    parser.add_argument('--workers', default='1,4,16', help="Worker process counts")
+    parser.add_argument('--faqs', type=int, default=0, help="Synthetic corpus size; 0 is the real corpus and index")
+    parser.add_argument('--model', default=MODEL_NAME)
+    parser.add_argument('--backend', default=ENCODER_BACKEND)
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds of queries per configuration")
+    parser.add_argument('--index-type', default='flat_l2', help="Index type for synthetic corpora")
+    parser.add_argument('--worker-threads', type=int, default=1, help="Encoder threads per private worker")
+    parser.add_argument('--service-threads', type=int, default=0, help="Encoder threads of the service (0 = default)")
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--out', default='bench_workers.json')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    results = run([int(n) for n in args.workers.split(',')], n_faqs=args.faqs, model_name=args.model,
+                  backend=args.backend, duration=args.duration, index_type=args.index_type,
+                  worker_threads=args.worker_threads, service_threads=args.service_threads,
+                  modes=args.modes.split(','))
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Local stand-in for Together's chat completions API, for offline benchmarks.
+
+    python -m benchmarks.stub_together --port 8099 --latency 0.5 --jitter 0.1
+    TOGETHER_API_URL=http://127.0.0.1:8099/v1/chat/completions streamlit run app.py
+
+Replies after a configurable delay with a fixed 'FINAL ANSWER:' completion,
+as plain JSON or as server-sent events when the request sets stream=True.
+Requests in the Hugging Face Inference API format ({"inputs": ...}) get a
+[{"generated_text": ...}] reply, so a second stub can stand in for that
+provider. `tail_rate` of the requests take `tail_latency` seconds instead,
+and `error_rate` of them are answered with `error_status`.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_COMPLETION = (
+    "FINAL ANSWER: You can do this from the Jupiter app. Open the app, go to the relevant "
+    "section and follow the on-screen steps. If you need more help, contact support@jupiter.money."
+)
+
+class StubConfig:
+    def __init__(self, latency=0.5, jitter=0.0, completion=DEFAULT_COMPLETION, error_rate=0.0,
+                 tokens_per_second=200.0, tail_rate=0.0, tail_latency=5.0, error_status=503):
+        self.latency = latency
+        self.jitter = jitter
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.completion = completion
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.tokens_per_second = tokens_per_second
+        self.requests = 0
+        self.lock = threading.Lock()
+
+def _make_handler(config):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, status, body):
+            data = json.dumps(body).encode('utf8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length) or b'{}')
+            with config.lock:
+                config.requests += 1
+            if config.error_rate and random.random() < config.error_rate:
+                self._send_json(config.error_status, {'error': 'stub error'})
+                return
+            prompt = ' '.join(m.get('content', '') for m in payload.get('messages', []))
+            usage = {
+                'prompt_tokens': len(prompt.split()),
+                'completion_tokens': len(config.completion.split()),
+            }
+            usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+            if config.tail_rate and random.random() < config.tail_rate:
+                latency = config.tail_latency
+            else:
+                latency = config.latency + random.uniform(-config.jitter, config.jitter)
+            time.sleep(max(0.0, latency))
+            if 'inputs' in payload:
+                self._send_json(200, [{'generated_text': config.completion}])
+                return
+            if payload.get('stream'):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                delay = 1.0 / config.tokens_per_second if config.tokens_per_second else 0
+                for word in config.completion.split(' '):
+                    chunk = {'choices': [{'delta': {'content': word + ' '}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf8'))
+                    self.wfile.flush()
+                    time.sleep(delay)
+                self.wfile.write(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode('utf8'))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+                return
+            self._send_json(200, {
+                'choices': [{'message': {'role': 'assistant', 'content': config.completion}}],
+                'usage': usage,
+            })
+    return StubHandler
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that gave up (deadlines, lost hedges) close their sockets mid-reply
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+def start_stub_server(host='127.0.0.1', port=0, **config_kwargs):
+    """
+    Start the stub in a daemon thread.
+
+    Returns:
+        tuple: (server, config, chat completions URL)
+    """
+    config = StubConfig(**config_kwargs)
+    server = _StubServer((host, port), _make_handler(config))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://{host}:{server.server_port}/v1/chat/completions"
+    return server, config, url
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Together chat completions server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.5, help="Seconds before the reply starts")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Uniform +/- seconds added to latency")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument('--error-status', type=int, default=503, help="HTTP status of the failed requests")
+    parser.add_argument('--tail-rate', type=float, default=0.0, help="Fraction of requests that take --tail-latency")
+    parser.add_argument('--tail-latency', type=float, default=5.0)
+    args = parser.parse_args()
+    server, _, url = start_stub_server(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                                       error_rate=args.error_rate, error_status=args.error_status,
+                                       tail_rate=args.tail_rate, tail_latency=args.tail_latency)
+    print(f"Stub Together API listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
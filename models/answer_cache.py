@@ -0,0 +1,195 @@
+"""
+Semantic answer cache for the RAG pipeline.
+
+Answers are keyed by the query embedding: a new query reuses a cached LLM
+answer when its cosine similarity to a cached query clears a threshold and
+the same FAQs were retrieved for it.
+
+With a path, entries are persisted as an append-only JSONL log: each stored
+answer appends one line (embedding as base64 float32), and a rebind to a new
+index appends a marker line. Loading replays the log; `save()` compacts it
+to the live entries, and runs on load once the log outgrows them.
+"""
+import base64
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from .config import ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL, ANSWER_CACHE_PATH
+
+def index_fingerprint(index_path):
+    """Cheap identifier of an index file that changes whenever it is rebuilt."""
+    try:
+        st = os.stat(index_path)
+    except OSError:
+        return None
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+def cache_path_for_index(index_path, path=ANSWER_CACHE_PATH):
+    """
+    The answer-cache log for one index: ANSWER_CACHE_PATH with the index name
+    inserted, so pipelines over different indexes (translate, multilingual)
+    never clear each other's entries on bind_index.
+    """
+    if not path:
+        return None
+    root, ext = os.path.splitext(path)
+    return f"{root}.{os.path.splitext(os.path.basename(index_path))[0]}{ext}"
+
+def _normalize(vec):
+    vec = np.asarray(vec, dtype='float32').ravel()
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+class SemanticAnswerCache:
+    """
+    LRU + TTL bounded cache of LLM answers keyed by query embedding.
+
+    Args:
+        threshold (float): Minimum cosine similarity for a hit
+        max_entries (int): LRU size bound
+        ttl (float): Seconds an entry stays valid (None or 0 disables expiry)
+        path (str): Optional JSONL log to persist entries across restarts
+    """
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                 ttl=ANSWER_CACHE_TTL, path=ANSWER_CACHE_PATH):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.index_version = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()  # Disk writes never hold up lookups
+        if path:
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expired(self, entry, now):
+        return bool(self.ttl) and now - entry['created'] > self.ttl
+
+    def bind_index(self, index_version):
+        """Drop every entry if the FAQ index has been rebuilt since they were stored."""
+        with self._lock:
+            if index_version == self.index_version:
+                return
+            self._entries.clear()
+            self.index_version = index_version
+        if self.path:
+            self._append({'index_version': index_version})
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        with self._file_lock:
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+    def lookup(self, embedding, faq_indices, language=None):
+        """
+        Return the best cached entry for this query, or None on a miss.
+        Entries only match answers requested in the same `language`.
+        """
+        query = _normalize(embedding)
+        faq_indices = tuple(int(i) for i in faq_indices)
+        now = time.time()
+        with self._lock:
+            best_key, best_sim = None, self.threshold
+            for key, entry in list(self._entries.items()):
+                if self._expired(entry, now):
+                    del self._entries[key]
+                    continue
+                if entry['faq_indices'] != faq_indices or entry.get('language') != language:
+                    continue
+                sim = float(np.dot(query, entry['embedding']))
+                if sim >= best_sim:
+                    best_key, best_sim = key, sim
+            if best_key is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best_key)
+            return dict(self._entries[best_key], similarity=best_sim)
+
+    def store(self, embedding, faq_indices, llm_response, raw_llm_response=None, query=None, language=None):
+        entry = {
+            'query': query,
+            'embedding': _normalize(embedding),
+            'faq_indices': tuple(int(i) for i in faq_indices),
+            'llm_response': llm_response,
+            'raw_llm_response': raw_llm_response,
+            'language': language,
+            'created': time.time(),
+        }
+        with self._lock:
+            self._entries[self._next_key] = entry
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if self.path:
+            self._append({'entry': _encode_entry(entry)})
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+    def _append(self, record):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._file_lock:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a', encoding='utf8') as f:
+                f.write(line)
+
+    def save(self):
+        """Rewrite the log as just the live entries (e.g. at shutdown)."""
+        with self._lock:
+            lines = [json.dumps({'index_version': self.index_version})]
+            lines += [json.dumps({'entry': _encode_entry(entry)}, ensure_ascii=False) for entry in self._entries.values()]
+        with self._file_lock:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf8') as f:
+                f.write('\n'.join(lines) + '\n')
+            os.replace(tmp_path, self.path)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        now = time.time()
+        n_records = 0
+        with self._lock, open(self.path, 'r', encoding='utf8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A line cut off by a crash
+                n_records += 1
+                if 'index_version' in record:
+                    self._entries.clear()
+                    self.index_version = record['index_version']
+                if 'entry' not in record:
+                    continue
+                entry = _decode_entry(record['entry'])
+                if self._expired(entry, now):
+                    continue
+                self._entries[self._next_key] = entry
+                self._next_key += 1
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            n_live = len(self._entries)
+        if n_records > 2 * n_live + 1:
+            self.save()
+
+def _encode_entry(entry):
+    embedding = base64.b64encode(np.asarray(entry['embedding'], dtype='float32').tobytes()).decode('ascii')
+    return dict(entry, embedding=embedding, faq_indices=list(entry['faq_indices']))
+
+def _decode_entry(data):
+    embedding = np.frombuffer(base64.b64decode(data['embedding']), dtype='float32').copy()
+    return dict(data, embedding=embedding, faq_indices=tuple(data['faq_indices']))
@@ -1,51 +1,231 @@
+"""
+Build the FAQ FAISS index.
+
+    python -m models.build_faiss_index [--index-type hnsw --ef-search 128]
+    python -m models.build_faiss_index --benchmark [--synthetic 200000]
+    python -m models.build_faiss_index --multilingual   # index for RETRIEVAL_MODE=multilingual
+    python -m models.build_faiss_index --encoder-backend onnx_int8
+"""
+import argparse
 import json
+import time
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import os
+from .index_factory import (
+    INDEX_TYPES, build_index, save_index, save_ids, normalize, uses_cosine, ids_path, load_index_meta,
+    resolve_params, supports_remove, add_vectors, remove_vectors, id_lookup, ids_to_positions
+)
+from .embedding_store import EmbeddingStore, entry_ids
+from .encoders import ENCODER_BACKENDS, load_encoder, store_model_id, backend_embeddings_path
+from .related_graph import question_key, corpus_fingerprint, build_related_graph, save_related_graph, RELATED_GRAPH_PATH
+from .partitions import PARTITIONS_PATH, build_partitions, save_partitions
+from .corpus_store import CORPUS_PATH, load_faq_json, save_columnar_corpus
+from .config import (
+    TOP_K_RELATED, MULTILINGUAL_MODEL_NAME, MULTILINGUAL_INDEX_PATH, MULTILINGUAL_EMBEDDINGS_PATH,
+    MULTILINGUAL_RELATED_GRAPH_PATH, ENCODER_BACKEND
+)
+from .answer_cache import cache_path_for_index
 
 MODEL_NAME = 'all-MiniLM-L6-v2'
 DATA_PATH = 'data/jupiter_faqs_clean.json'
 INDEX_PATH = 'models/faq_faiss.index'
 EMBEDDINGS_PATH = 'models/faq_embeddings.npy'
+RELATED_GRAPH_WIDTH = TOP_K_RELATED + 2  # Spare neighbours for when one equals the user's question
+RELATED_SEARCH_MARGIN = 10               # Extra candidates per FAQ for category filtering/dedup
+
+def load_faqs():
+    # Load cleaned FAQ data
+    return load_faq_json(DATA_PATH)
+
+def encode_questions(faqs, model_name=MODEL_NAME, embeddings_path=EMBEDDINGS_PATH, encoder_backend='torch'):
+    """Embeddings in corpus order, encoding only questions the store has not seen."""
+    questions = [faq['question'] for faq in faqs]
+    model = None
+    def encode(texts):
+        nonlocal model
+        if model is None:
+            model = load_encoder(model_name, encoder_backend)
+        return np.array(model.encode(texts, show_progress_bar=True)).astype('float32')
+    # Vectors from a quantised backend are not interchangeable with fp32 ones
+    store = EmbeddingStore(backend_embeddings_path(embeddings_path, encoder_backend),
+                           store_model_id(model_name, encoder_backend))
+    embeddings, encoded, reused = store.update(questions, encode)
+    print(f"Embeddings: {encoded} re-encoded, {reused} reused from the store.")
+    return embeddings
+
+def update_index(embeddings, ids, index_type, params, full=False, index_path=INDEX_PATH, model_name=MODEL_NAME):
+    """
+    Update the saved index in place (remove dropped ids, add new ones) when it
+    was built with the same type and parameters; otherwise rebuild it from the
+    stored embeddings.
+    """
+    meta = load_index_meta(index_path)
+    resolved = resolve_params(index_type, params, n_vectors=len(embeddings), dim=embeddings.shape[1])
+    in_place = (
+        not full
+        and meta.get('id_mapped')
+        and meta.get('index_type') == index_type
+        and meta.get('params') == resolved
+        and meta.get('model_name') == model_name
+        and supports_remove(index_type)
+        and os.path.exists(index_path)
+        and os.path.exists(ids_path(index_path))
+    )
+    if in_place:
+        index = faiss.read_index(index_path)
+        old_ids = np.load(ids_path(index_path))
+        removed = np.setdiff1d(old_ids, ids)
+        added = ~np.isin(ids, old_ids)
+        if len(removed):
+            remove_vectors(index, removed)
+        if added.any():
+            add_vectors(index, index_type, embeddings[added], ids[added])
+        print(f"Index updated in place: {int(added.sum())} added, {len(removed)} removed.")
+    else:
+        index, resolved = build_index(embeddings, index_type, params, ids=ids)
+        print(f"Index rebuilt from {len(ids)} stored embeddings.")
+    save_index(index, index_path, index_type, resolved, model_name=model_name, id_mapped=True)
+    save_ids(ids, index_path)
+    return index
+
+def build_related(index, index_type, embeddings, ids, faqs, batch_size=1024, graph_path=RELATED_GRAPH_PATH):
+    """Precompute related questions for every FAQ from the index itself."""
+    question_keys = [question_key(faq['question']) for faq in faqs]
+    categories = [faq['category'] for faq in faqs]
+    subcategories = [faq['subcategory'] for faq in faqs]
+    lookup = id_lookup(ids)
+    k = min(RELATED_GRAPH_WIDTH + RELATED_SEARCH_MARGIN + 1, index.ntotal)
+    candidate_rows = []
+    for start in range(0, len(embeddings), batch_size):
+        batch = np.ascontiguousarray(embeddings[start:start + batch_size], dtype='float32')
+        if uses_cosine(index_type):
+            batch = normalize(batch)
+        _, I = index.search(batch, k)
+        candidate_rows.extend(ids_to_positions(I, lookup))
+    graph = build_related_graph(candidate_rows, question_keys, categories, subcategories, RELATED_GRAPH_WIDTH)
+    save_related_graph(graph, corpus_fingerprint(question_keys, categories, subcategories), graph_path)
+    print(f"Related-question table saved: {graph.shape[0]} FAQs x {graph.shape[1]} neighbours.")
+    return graph
+
+def build_category_partitions(faqs, path=PARTITIONS_PATH):
+    """Save the corpus rows of every category and (category, subcategory) for filtered search."""
+    question_keys = [question_key(faq['question']) for faq in faqs]
+    categories = [faq['category'] for faq in faqs]
+    subcategories = [faq['subcategory'] for faq in faqs]
+    partitions = build_partitions(categories, subcategories)
+    save_partitions(partitions, corpus_fingerprint(question_keys, categories, subcategories), path)
+    print(f"Category partitions saved: {len(partitions)} partitions.")
+    return partitions
+
+def inflate(embeddings, n_total, noise=0.05, seed=0):
+    """Synthetic corpus: jittered copies of the real embeddings, for scale tests."""
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(embeddings), size=n_total)
+    synthetic = embeddings[picks] + rng.normal(0, noise, size=(n_total, embeddings.shape[1])).astype('float32')
+    return synthetic.astype('float32')
+
+def benchmark(embeddings, index_types=INDEX_TYPES, params=None, k=10, n_queries=1000, seed=0):
+    """
+    Build every index type over the same vectors and report recall@k against
+    an exact flat search with the same metric, query latency and index size.
+    """
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(embeddings), size=min(n_queries, len(embeddings)))
+    queries = embeddings[picks] + rng.normal(0, 0.02, size=(len(picks), embeddings.shape[1])).astype('float32')
+    queries = queries.astype('float32')
+    k = min(k, len(embeddings))
+    baselines = {}
+    rows = []
+    for index_type in index_types:
+        cosine = uses_cosine(index_type)
+        q = normalize(queries) if cosine else queries
+        if cosine not in baselines:
+            exact = faiss.IndexFlatIP(embeddings.shape[1]) if cosine else faiss.IndexFlatL2(embeddings.shape[1])
+            exact.add(normalize(embeddings) if cosine else embeddings)
+            baselines[cosine] = exact.search(q, k)[1]
+        start = time.time()
+        index, resolved = build_index(embeddings, index_type, (params or {}).get(index_type))
+        build_time = time.time() - start
+        start = time.time()
+        _, I = index.search(q, k)
+        batch_time = time.time() - start
+        single = []
+        for row in q[:100]:
+            t0 = time.time()
+            index.search(row[None, :], k)
+            single.append(time.time() - t0)
+        truth = baselines[cosine]
+        recall = np.mean([len(set(I[i]) & set(truth[i])) / k for i in range(len(q))])
+        rows.append({
+            'index_type': index_type,
+            'params': resolved,
+            f'recall@{k}': float(recall),
+            'build_s': build_time,
+            'batch_ms_per_query': 1000 * batch_time / len(q),
+            'single_query_p50_ms': 1000 * float(np.percentile(single, 50)),
+            'single_query_p95_ms': 1000 * float(np.percentile(single, 95)),
+            'index_bytes': int(faiss.serialize_index(index).nbytes),
+        })
+    return rows
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the FAQ FAISS index")
+    parser.add_argument('--index-type', default='flat_l2', choices=INDEX_TYPES)
+    parser.add_argument('--nlist', type=int, help="IVF: number of inverted lists")
+    parser.add_argument('--nprobe', type=int, help="IVF: lists visited per query")
+    parser.add_argument('--M', type=int, help="HNSW: neighbours per node")
+    parser.add_argument('--ef-construction', type=int, help="HNSW: build-time beam width")
+    parser.add_argument('--ef-search', type=int, help="HNSW: query-time beam width")
+    parser.add_argument('--pq-m', type=int, help="IVF-PQ: sub-quantizers (must divide the dimension)")
+    parser.add_argument('--pq-nbits', type=int, help="IVF-PQ: bits per sub-quantizer code")
+    parser.add_argument('--full', action='store_true', help="Rebuild the index instead of updating it in place")
+    parser.add_argument('--multilingual', action='store_true',
+                        help=f"Index the English FAQs with {MULTILINGUAL_MODEL_NAME} so non-English queries need no translation")
+    parser.add_argument('--encoder-backend', default=ENCODER_BACKEND, choices=ENCODER_BACKENDS,
+                        help="Backend that encodes the FAQ questions")
+    parser.add_argument('--benchmark', action='store_true', help="Compare all index types instead of building one")
+    parser.add_argument('--k', type=int, default=10, help="Benchmark: recall@k")
+    parser.add_argument('--synthetic', type=int, default=0, help="Benchmark: inflate the corpus to N vectors")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    params = {
+        'nlist': args.nlist, 'nprobe': args.nprobe, 'M': args.M,
+        'efConstruction': args.ef_construction, 'efSearch': args.ef_search,
+        'pq_m': args.pq_m, 'pq_nbits': args.pq_nbits,
+    }
+    if args.multilingual:
+        model_name, index_path = MULTILINGUAL_MODEL_NAME, MULTILINGUAL_INDEX_PATH
+        embeddings_path, graph_path = MULTILINGUAL_EMBEDDINGS_PATH, MULTILINGUAL_RELATED_GRAPH_PATH
+    else:
+        model_name, index_path, embeddings_path, graph_path = MODEL_NAME, INDEX_PATH, EMBEDDINGS_PATH, RELATED_GRAPH_PATH
+    faqs = load_faqs()
+    embeddings = encode_questions(faqs, model_name=model_name, embeddings_path=embeddings_path,
+                                  encoder_backend=args.encoder_backend)
+    if args.benchmark:
+        if args.synthetic:
+            embeddings = inflate(embeddings, args.synthetic)
+        print(f"Benchmarking {len(INDEX_TYPES)} index types over {len(embeddings)} vectors")
+        per_type = {t: params for t in INDEX_TYPES}
+        for row in benchmark(embeddings, params=per_type, k=args.k):
+            print(json.dumps(row))
+        return
+    # Build or update the FAISS index
+    ids = entry_ids(faqs)
+    index = update_index(embeddings, ids, args.index_type, params, full=args.full,
+                         index_path=index_path, model_name=store_model_id(model_name, args.encoder_backend))
+    build_related(index, args.index_type, embeddings, ids, faqs, graph_path=graph_path)
+    build_category_partitions(faqs)
+    meta = save_columnar_corpus(faqs, CORPUS_PATH, source_path=DATA_PATH)
+    print(f"Columnar corpus saved to {CORPUS_PATH}: {meta['n']} FAQs, {len(meta['categories'])} categories.")
+    # Answers cached against the old index are no longer valid
+    cache_path = cache_path_for_index(index_path)
+    if cache_path and os.path.exists(cache_path):
+        os.remove(cache_path)
+    print(f"FAISS {args.index_type} index ({model_name}) and embeddings saved to {index_path}. {len(faqs)} questions indexed.")
 
-os.makedirs('models', exist_ok=True)
-
-def flatten_faqs(faqs):
-    flat = []
-    def recurse(obj, category=None, subcategory=None):
-        if isinstance(obj, list):
-            for item in obj:
-                if isinstance(item, dict) and 'question' in item and 'answer' in item:
-                    flat.append({
-                        'question': item['question'],
-                        'answer': item['answer'],
-                        'category': category,
-                        'subcategory': subcategory
-                    })
-        elif isinstance(obj, dict):
-            for k, v in obj.items():
-                if category is None:
-                    recurse(v, category=k, subcategory=None)
-                else:
-                    recurse(v, category=category, subcategory=k)
-    recurse(faqs)
-    return flat
-
-# Load cleaned FAQ data
-with open(DATA_PATH, 'r') as f:
-    faqs_nested = json.load(f)
-faqs = flatten_faqs(faqs_nested)
-questions = [faq['question'] for faq in faqs]
-
-# Generate embeddings
-model = SentenceTransformer(MODEL_NAME)
-embeddings = model.encode(questions, show_progress_bar=True)
-embeddings = np.array(embeddings).astype('float32')
-
-# Build FAISS index
-index = faiss.IndexFlatL2(embeddings.shape[1])
-index.add(embeddings)
-faiss.write_index(index, INDEX_PATH)
-np.save(EMBEDDINGS_PATH, embeddings)
-print(f"FAISS index and embeddings saved. {len(questions)} questions indexed.") 
\ No newline at end of file
+if __name__ == "__main__":
+    os.makedirs('models', exist_ok=True)
+    main()
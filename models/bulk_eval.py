@@ -0,0 +1,328 @@
+"""
+Bulk evaluation of the RAG pipeline over a JSONL question set.
+
+    python -m models.bulk_eval questions.jsonl --out results.csv
+    python -m models.bulk_eval questions.jsonl --out results.jsonl --concurrency 16 --rps 5 --llm-only
+
+Each input line is a JSON object with the question under `question` or
+`query` (or --field), and an optional `id`. Questions are streamed: they are
+retrieved in batches of --batch-size (one encode and one index search per
+batch), then answered on --concurrency threads, with LLM calls limited to
+--rps per second. At most a few batches are in memory at a time, however
+large the input.
+
+Rows are written to --out as they complete: CSV or JSONL, chosen by the
+file extension, with the same columns as rag_vs_llm_results.csv plus
+per-row timings. The output is also the checkpoint. Re-running the same
+command skips the input rows already in it, so an interrupted run resumes
+where it stopped. A record cut off by the interruption is dropped first,
+and rows whose answer failed are removed and answered again.
+
+The semantic answer cache is off unless --answer-cache is given. Otherwise
+near-duplicate questions would be scored on one shared reply, and an
+evaluation run would fill the cache that serves users.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from .rag_pipeline import FAQPipeline, get_pipeline, pipeline_kwargs
+from .llm_providers import get_llm, set_llm
+from .config import MAX_TOKENS
+
+COLUMNS = [
+    'row', 'id', 'question', 'rag_answer', 'faq_match', 'answer_source', 'rag_time', 'retrieval_ms',
+    'answer_ms', 'prompt_tokens', 'llm_provider', 'llm_only_answer', 'llm_time', 'error',
+]
+LLM_ONLY_SYSTEM_PROMPT = "Answer the following user question in a friendly, helpful way. If you do not know, say so."
+
+class RateLimiter:
+    """Token bucket: at most `rate` acquisitions per second, bursts up to `burst`."""
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+class RateLimitedLLM:
+    """Wraps the shared LLM so every provider call (not cache or direct answers) takes a token."""
+    def __init__(self, llm, limiter):
+        self.llm = llm
+        self.limiter = limiter
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+    def complete(self, prompt, deadline=None):
+        self.limiter.acquire()
+        return self.llm.complete(prompt, deadline=deadline)
+
+class Progress:
+    """Completed input rows: a watermark below which all are done, plus those done out of order."""
+    def __init__(self):
+        self.watermark = 0
+        self.ahead = set()
+        self.count = 0
+
+    def add(self, row):
+        if row in self:
+            return
+        self.count += 1
+        self.ahead.add(row)
+        while self.watermark in self.ahead:
+            self.ahead.remove(self.watermark)
+            self.watermark += 1
+
+    def __contains__(self, row):
+        return row < self.watermark or row in self.ahead
+
+def output_format(path):
+    return 'csv' if path.endswith('.csv') else 'jsonl'
+
+def load_progress(path, fmt):
+    """
+    Rows already in the output. A trailing record cut off mid-write is
+    truncated away so new rows append cleanly. Rows whose answer failed
+    (an error on a valid question, e.g. a provider outage) are removed so
+    they are retried; rows with invalid input stay done.
+    """
+    progress = Progress()
+    if not os.path.exists(path):
+        return progress
+    complete_at = 0
+    pending = b''
+    failed = []  # (start, end) byte spans of the rows to retry
+    with open(path, 'rb') as f:
+        for line in f:
+            pending += line
+            if not pending.endswith(b'\n'):
+                break
+            record = None
+            if fmt == 'csv':
+                # A CSV record can span lines inside quotes; it is complete once its quotes balance
+                if pending.count(b'"') % 2:
+                    continue
+                if complete_at > 0:  # the first record is the header
+                    values = next(csv.reader(io.StringIO(pending.decode('utf8'))), None)
+                    if values:
+                        record = dict(zip(COLUMNS, values))
+            elif pending.strip():
+                try:
+                    record = json.loads(pending)
+                    int(record['row'])
+                except (ValueError, KeyError, TypeError):
+                    break
+            if record is not None:
+                if record.get('error') and record.get('question'):
+                    failed.append((complete_at, complete_at + len(pending)))
+                else:
+                    progress.add(int(record['row']))
+            complete_at += len(pending)
+            pending = b''
+    if complete_at < os.path.getsize(path):
+        print(f"Dropping a partial record at the end of {path}")
+        with open(path, 'rb+') as f:
+            f.truncate(complete_at)
+    if failed:
+        print(f"Retrying {len(failed)} rows that failed in {path}")
+        _drop_spans(path, failed)
+    return progress
+
+def _drop_spans(path, spans):
+    tmp_path = path + '.tmp'
+    with open(path, 'rb') as f, open(tmp_path, 'wb') as out:
+        position = 0
+        for start, end in spans:
+            out.write(f.read(start - position))
+            f.seek(end)
+            position = end
+        out.write(f.read())
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp_path, path)
+
+class RowWriter:
+    """Appends result rows to CSV or JSONL, flushed per row and fsynced every `fsync_every` rows."""
+    def __init__(self, path, fmt, fsync_every=100):
+        self.fmt = fmt
+        self.fsync_every = fsync_every
+        self.written = 0
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.f = open(path, 'a', newline='' if fmt == 'csv' else None, encoding='utf8')
+        if fmt == 'csv':
+            self.writer = csv.DictWriter(self.f, fieldnames=COLUMNS, lineterminator='\n')
+            if new_file:
+                self.writer.writeheader()
+
+    def write(self, row):
+        if self.fmt == 'csv':
+            # One write() per record keeps an interrupted run's damage to the last record
+            buffer = io.StringIO()
+            csv.DictWriter(buffer, fieldnames=COLUMNS, lineterminator='\n').writerow(row)
+            self.f.write(buffer.getvalue())
+        else:
+            self.f.write(json.dumps(row, ensure_ascii=False) + '\n')
+        self.f.flush()
+        self.written += 1
+        if self.written % self.fsync_every == 0:
+            os.fsync(self.f.fileno())
+
+    def close(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+
+def read_questions(path, field=None):
+    """Yields (row number, id, question or None, error) for each non-blank input line."""
+    row = 0
+    with open(path, 'r', encoding='utf8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+                question = item.get(field) if field else (item.get('question') or item.get('query'))
+                item_id = item.get('id', item.get('request_id', ''))
+                error = None if question else f"no {field or 'question/query'} field"
+            except (ValueError, AttributeError) as e:
+                question, item_id, error = None, '', f"invalid JSON: {e}"
+            yield row, item_id, question, error
+            row += 1
+
+def llm_only_answer(question):
+    prompt = {'system': LLM_ONLY_SYSTEM_PROMPT, 'user': f"User question: {question}", 'max_tokens': MAX_TOKENS}
+    return get_llm().complete(prompt)[0]
+
+def answer_row(pipeline, row, item_id, ctx, retrieval_ms, deadline=None, llm_only=False):
+    out = dict.fromkeys(COLUMNS, '')
+    out.update(row=row, id=item_id, question=ctx.query, retrieval_ms=round(retrieval_ms, 2))
+    start = time.perf_counter()
+    try:
+        result = pipeline.answer_with_context(ctx, deadline=deadline)
+        answer_s = time.perf_counter() - start
+        retrieved = result['retrieved_faqs']
+        out.update(
+            rag_answer=result['llm_response'],
+            faq_match=retrieved[0]['answer'] if retrieved else '',
+            answer_source=result['answer_source'],
+            rag_time=round(retrieval_ms / 1000 + answer_s, 4),
+            answer_ms=round(1000 * answer_s, 2),
+            prompt_tokens=result.get('prompt_tokens', ''),
+            llm_provider=result.get('llm_provider', ''),
+        )
+        if llm_only:
+            start = time.perf_counter()
+            out['llm_only_answer'] = llm_only_answer(ctx.query)
+            out['llm_time'] = round(time.perf_counter() - start, 4)
+    except Exception as e:
+        out['error'] = str(e)
+    return out
+
+def error_row(row, item_id, question, error):
+    return dict(dict.fromkeys(COLUMNS, ''), row=row, id=item_id, question=question or '', error=error)
+
+def run(input_path, out_path, mode=None, field=None, batch_size=64, concurrency=8, rps=0.0, deadline=None,
+        llm_only=False, limit=None, fsync_every=100, report_every=100, answer_cache=False):
+    fmt = output_format(out_path)
+    progress = load_progress(out_path, fmt)
+    if progress.count:
+        print(f"Resuming: {progress.count} rows already in {out_path}")
+    # The shared pipeline answers from (and fills) the semantic answer cache
+    pipeline = get_pipeline(mode) if answer_cache else FAQPipeline(answer_cache=False, **pipeline_kwargs(mode))
+    shared_llm = get_llm()
+    if rps:
+        set_llm(RateLimitedLLM(shared_llm, RateLimiter(rps)))
+    writer = RowWriter(out_path, fmt, fsync_every=fsync_every)
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='bulk-eval')
+    max_pending = concurrency + batch_size  # Bounds memory: retrieval runs ahead by about one batch
+    pending = set()
+    done = 0
+    start = time.time()
+
+    def drain(max_left):
+        nonlocal done
+        while len(pending) > max_left:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                pending.remove(future)
+                writer.write(future.result())
+                done += 1
+                if done % report_every == 0:
+                    print(f"{done} rows in {time.time() - start:.0f}s ({done / (time.time() - start):.1f}/s)")
+
+    def flush_batch(batch):
+        batch_start = time.perf_counter()
+        contexts = pipeline.build_query_contexts([question for _, _, question in batch], k=pipeline.search_width())
+        retrieval_ms = 1000 * (time.perf_counter() - batch_start) / len(batch)  # Per-row share of the batch
+        drain(max_pending - len(batch))
+        for (row, item_id, _), ctx in zip(batch, contexts):
+            pending.add(executor.submit(answer_row, pipeline, row, item_id, ctx, retrieval_ms, deadline, llm_only))
+
+    try:
+        batch = []
+        for row, item_id, question, error in read_questions(input_path, field):
+            if limit is not None and row >= limit:
+                break
+            if row in progress:
+                continue
+            if error:
+                writer.write(error_row(row, item_id, question, error))
+                done += 1
+                continue
+            batch.append((row, item_id, question))
+            if len(batch) >= batch_size:
+                flush_batch(batch)
+                batch = []
+        if batch:
+            flush_batch(batch)
+        drain(0)
+    finally:
+        executor.shutdown(wait=True)
+        writer.close()
+        set_llm(shared_llm)
+    elapsed = time.time() - start
+    print(f"Wrote {done} rows to {out_path} in {elapsed:.1f}s"
+          + (f" ({done / elapsed:.1f}/s)" if elapsed > 0 and done else ""))
+    return done
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Answer a JSONL question set with the RAG pipeline")
+    parser.add_argument('input', help="JSONL file, one object per line")
+    parser.add_argument('--out', default='rag_eval_results.csv', help="Output .csv or .jsonl (also the checkpoint)")
+    parser.add_argument('--field', help="Question field (default: question, then query)")
+    parser.add_argument('--mode', default=None, help="Retrieval mode (default RETRIEVAL_MODE)")
+    parser.add_argument('--batch-size', type=int, default=64, help="Questions per encode/search batch")
+    parser.add_argument('--concurrency', type=int, default=8, help="Concurrent answers (LLM calls)")
+    parser.add_argument('--rps', type=float, default=0.0, help="Max LLM calls per second (0 = unlimited)")
+    parser.add_argument('--deadline', type=float, help="Per-answer deadline in seconds (see RAG_DEADLINE)")
+    parser.add_argument('--llm-only', action='store_true', help="Also ask the LLM without FAQ context")
+    parser.add_argument('--answer-cache', action='store_true', help="Reuse and fill the semantic answer cache")
+    parser.add_argument('--limit', type=int, help="Only the first N input rows")
+    parser.add_argument('--fsync-every', type=int, default=100)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    run(args.input, args.out, mode=args.mode, field=args.field, batch_size=args.batch_size,
+        concurrency=args.concurrency, rps=args.rps, deadline=args.deadline, llm_only=args.llm_only,
+        limit=args.limit, fsync_every=args.fsync_every, answer_cache=args.answer_cache)
+
+if __name__ == "__main__":
+    main()
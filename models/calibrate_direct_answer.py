@@ -0,0 +1,143 @@
+"""
+Calibrate the direct-answer fast path against a labelled question set.
+
+    python -m models.calibrate_direct_answer --labels data/labelled_queries.jsonl --target-precision 0.99
+
+A labelled set is a CSV with `question` and `faq_match` (the FAQ answer the
+question should get), or JSONL with `query` plus `faq_question` or
+`faq_answer`. Rows with an empty label are out-of-scope queries that must
+never get a direct answer. The labels have to come from a person: in
+pipeline output (rag_vs_llm_results.csv, models.bulk_eval results)
+`faq_match` is the retriever's own top hit, so every query would count as
+correct. Such files are refused.
+
+Every (threshold, margin) pair on a grid is scored by precision (direct
+answers that returned the right FAQ) and coverage (queries answered
+directly). The pair with the best coverage at the target precision is saved
+to DIRECT_ANSWER_CALIBRATION_PATH, which FAQPipeline picks up for the same
+embedding model.
+"""
+import argparse
+import csv
+import json
+import re
+import time
+import numpy as np
+from .rag_pipeline import get_pipeline
+from .related_graph import question_key
+from .config import DIRECT_ANSWER_CALIBRATION_PATH
+
+# Columns only pipeline output has; their faq_match is the retriever's top hit, not a label
+PIPELINE_OUTPUT_FIELDS = {'rag_answer', 'answer_source'}
+THRESHOLDS = np.round(np.arange(0.70, 1.0, 0.01), 2)
+MARGINS = (0.0, 0.02, 0.05, 0.1, 0.15, 0.2)
+
+def answer_key(text):
+    # Scraped answers differ from CSV exports in quotes and whitespace
+    text = text.replace('‘', "'").replace('’', "'").replace('“', '"').replace('”', '"')
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+def _check_not_pipeline_output(path, fields):
+    if PIPELINE_OUTPUT_FIELDS & set(fields):
+        raise ValueError(f"{path} is pipeline output: its faq_match is what retrieval returned, so calibrating "
+                         f"on it would score every query as correct. Use a hand-labelled question set.")
+
+def load_labels(path):
+    """List of (query, expected question or None, expected answer or None)."""
+    labels = []
+    if path.endswith('.csv'):
+        with open(path, 'r', newline='') as f:
+            reader = csv.DictReader(f)
+            _check_not_pipeline_output(path, reader.fieldnames or ())
+            for row in reader:
+                labels.append((row['question'], None, row.get('faq_match') or None))
+    else:
+        with open(path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    _check_not_pipeline_output(path, row)
+                    labels.append((row['query'], row.get('faq_question'), row.get('faq_answer')))
+    return labels
+
+def score_labels(pipeline, labels, batch_size=64):
+    """Per query: (similarity, margin, top hit is the labelled FAQ)."""
+    scores = []
+    for start in range(0, len(labels), batch_size):
+        batch = labels[start:start + batch_size]
+        contexts = pipeline.build_query_contexts([query for query, _, _ in batch])
+        for ctx, (_, expected_question, expected_answer) in zip(contexts, batch):
+            similarity, margin, row = pipeline.direct_answer_scores(ctx)
+            if row is None or (expected_question is None and expected_answer is None):
+                correct = False
+            elif expected_question is not None:
+                correct = pipeline.question_keys[row] == question_key(expected_question)
+            else:
+                correct = answer_key(pipeline.answers[row]) == answer_key(expected_answer)
+            scores.append((similarity, margin, correct))
+    return scores
+
+def sweep(scores, thresholds=THRESHOLDS, margins=MARGINS):
+    sims = np.array([s for s, _, _ in scores])
+    gaps = np.array([m for _, m, _ in scores])
+    correct = np.array([c for _, _, c in scores], dtype=bool)
+    rows = []
+    for threshold in thresholds:
+        for margin in margins:
+            fires = (sims >= threshold) & (gaps >= margin)
+            n_fires = int(fires.sum())
+            rows.append({
+                'threshold': float(threshold),
+                'margin': float(margin),
+                'fires': n_fires,
+                'coverage': n_fires / len(scores) if len(scores) else 0.0,
+                'precision': float(correct[fires].mean()) if n_fires else 1.0,
+            })
+    return rows
+
+def choose(rows, target_precision):
+    """Highest coverage at the target precision; ties go to the stricter setting."""
+    eligible = [r for r in rows if r['fires'] and r['precision'] >= target_precision]
+    if not eligible:
+        return None
+    return max(eligible, key=lambda r: (r['coverage'], r['threshold'], r['margin']))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Calibrate the direct-answer similarity threshold")
+    parser.add_argument('--labels', required=True, help="Hand-labelled CSV or JSONL (not pipeline output)")
+    parser.add_argument('--mode', default=None, help="Retrieval mode (default RETRIEVAL_MODE)")
+    parser.add_argument('--target-precision', type=float, default=0.98)
+    parser.add_argument('--out', default=DIRECT_ANSWER_CALIBRATION_PATH)
+    parser.add_argument('--dry-run', action='store_true', help="Print the sweep without saving")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    try:
+        labels = load_labels(args.labels)
+    except ValueError as e:
+        raise SystemExit(f"Error: {e}")
+    pipeline = get_pipeline(args.mode)
+    scores = score_labels(pipeline, labels)
+    rows = sweep(scores)
+    best = choose(rows, args.target_precision)
+    print(f"{len(labels)} labelled queries, top-1 accuracy {np.mean([c for _, _, c in scores]):.3f}")
+    for row in rows:
+        if row['margin'] in (0.0, 0.05) and row['fires']:
+            print(f"  threshold {row['threshold']:.2f} margin {row['margin']:.2f}: "
+                  f"precision {row['precision']:.3f} coverage {row['coverage']:.3f}")
+    if best is None:
+        print(f"No setting reaches precision {args.target_precision}; nothing saved.")
+        return
+    print(f"Chosen: threshold {best['threshold']:.2f}, margin {best['margin']:.2f} "
+          f"(precision {best['precision']:.3f}, coverage {best['coverage']:.3f})")
+    if args.dry_run:
+        return
+    calibration = dict(best, model_name=pipeline.model_name, labels=args.labels, n=len(labels),
+                       target_precision=args.target_precision, calibrated_at=time.time())
+    with open(args.out, 'w') as f:
+        json.dump(calibration, f, indent=2)
+    print(f"Calibration saved to {args.out}")
+
+if __name__ == "__main__":
+    main()
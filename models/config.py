@@ -4,7 +4,15 @@ Configuration file for Together API and model settings
 import os
 # Together API Configuration
 TOGETHER_API_KEY = os.getenv('TOGETHER_API_KEY')
-TOGETHER_API_URL = "https://api.together.xyz/v1/chat/completions"
+TOGETHER_API_URL = os.getenv('TOGETHER_API_URL', "https://api.together.xyz/v1/chat/completions")
+
+# Together client (connection pool, timeouts and retries)
+TOGETHER_CONNECT_TIMEOUT = 5    # Seconds to establish the connection
+TOGETHER_READ_TIMEOUT = 60      # Seconds to wait for the completion
+TOGETHER_MAX_RETRIES = 3        # Retries on 429/5xx and connection errors
+TOGETHER_BACKOFF_BASE = 0.5     # Seconds, doubled per retry (with jitter)
+TOGETHER_BACKOFF_MAX = 8        # Cap on a single backoff delay
+TOGETHER_POOL_SIZE = 10         # Pooled keep-alive connections
 
 # Model Configuration
 DEFAULT_MODEL = "meta-llama/Llama-3.3-70B-Instruct-Turbo"
@@ -15,6 +23,27 @@ DEFAULT_MODEL = "meta-llama/Llama-3.3-70B-Instruct-Turbo"
 # - "google/gemma-7b-it" (Gemma model)
 # - "mistralai/Mistral-7B-Instruct-v0.3" (Mistral model)
 
+# Hugging Face Inference API (secondary LLM provider)
+HF_API_URL = os.getenv('HF_API_URL', "https://api-inference.huggingface.co/models/{model}")
+HF_MODEL = "mistralai/Mistral-7B-Instruct-v0.3"
+HF_CONNECT_TIMEOUT = 5   # Seconds to establish the connection
+HF_READ_TIMEOUT = 60     # Seconds to wait for the completion
+
+# LLM providers, primary first (see models/llm_providers.py). With more than
+# one, a request still pending after the primary's recent p95 latency is
+# hedged to the next provider and the first good response wins.
+LLM_PROVIDERS = [name.strip() for name in os.getenv('LLM_PROVIDERS', 'together').split(',') if name.strip()]
+LLM_HEDGE_QUANTILE = 0.95
+LLM_HEDGE_INITIAL_DELAY = 2.0   # Seconds, until enough latencies are recorded
+LLM_HEDGE_MIN_DELAY = 0.1       # Never hedge sooner than this
+LLM_HEDGE_MIN_SAMPLES = 20
+LLM_HEDGE_WINDOW = 500          # Recent latencies kept per provider
+LLM_HEDGE_WORKERS = 32
+LLM_HEDGE_CALL_TIMEOUT = 30.0   # Seconds a pooled provider call may take when the caller sets no deadline
+# End-to-end answer deadline in seconds (0 = none). When it passes before
+# the LLM answers, the top retrieved FAQ answer is returned, flagged degraded.
+RAG_DEADLINE = float(os.getenv('RAG_DEADLINE', '0'))
+
 # Generation Parameters
 MAX_TOKENS = 1500  # Increased for more detailed, stepwise, bullet-pointed answers
 TEMPERATURE = 0.7
@@ -24,4 +53,63 @@ TOP_P = 0.9
 TOP_K_RETRIEVAL = 3  # Use in rag_pipeline.py for top_k
 TOP_K_RELATED = 3    # Use in rag_pipeline.py for related questions
 
+# Prompt budget (estimated tokens, see models/prompt_builder.py)
+PROMPT_CONTEXT_TOKENS = 1200        # All retrieved FAQs together
+PROMPT_ANSWER_TOKENS = 400          # One FAQ answer; longer ones are trimmed at a sentence boundary
+PROMPT_MIN_ANSWER_TOKENS = 40       # Drop lower-ranked FAQs rather than squeeze them below this
+PROMPT_MIN_COMPLETION_TOKENS = 256  # max_tokens floor; grows with the context, capped at MAX_TOKENS
+PROMPT_COMPLETION_RATIO = 1.0       # Completion tokens allowed per context token
+
+# Retrieval mode: "translate" translates non-English queries to English before
+# retrieval; "multilingual" embeds them directly with a multilingual model
+# (build its index with `python -m models.build_faiss_index --multilingual`)
+RETRIEVAL_MODE = os.getenv('RETRIEVAL_MODE', 'translate')
+MULTILINGUAL_MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
+MULTILINGUAL_INDEX_PATH = 'models/faq_faiss_multilingual.index'
+MULTILINGUAL_EMBEDDINGS_PATH = 'models/faq_embeddings_multilingual.npy'
+MULTILINGUAL_RELATED_GRAPH_PATH = 'models/faq_related_multilingual.npz'
+
+# Semantic answer cache (reuse LLM answers for near-paraphrased questions)
+ANSWER_CACHE_ENABLED = os.getenv('ANSWER_CACHE_ENABLED', '1') == '1'
+ANSWER_CACHE_THRESHOLD = 0.92   # Min cosine similarity between queries for a cache hit
+ANSWER_CACHE_MAX_ENTRIES = 1024  # LRU bound
+ANSWER_CACHE_TTL = 24 * 3600     # Seconds before a cached answer expires
+ANSWER_CACHE_PATH = os.getenv('ANSWER_CACHE_PATH')  # e.g. "models/answer_cache.jsonl" to persist; one log per index
+
+# Query encoder backend: "torch" (SentenceTransformer, fp32), "torch_int8" (dynamic
+# int8 quantisation of its Linear layers), "onnx" / "onnx_int8" (onnxruntime, no
+# torch import; export first with `python -m models.encoders --export`)
+ENCODER_BACKEND = os.getenv('ENCODER_BACKEND', 'torch')
+ONNX_MODEL_DIR = 'models/onnx'
+ENCODER_THREADS = int(os.getenv('ENCODER_THREADS', '0'))  # 0 lets the runtime decide
+QUERY_EMBEDDING_CACHE_SIZE = 4096  # LRU of normalised query -> embedding (0 disables)
+
+# Several worker processes on one host (see models/encoder_service.py): map the
+# FAISS index read-only so its pages are shared, and encode queries in one
+# encoder process that workers reach over a Unix socket
+INDEX_MMAP = os.getenv('INDEX_MMAP', '0') == '1'
+ENCODER_SERVICE = os.getenv('ENCODER_SERVICE')  # Socket path, e.g. "/tmp/faq-encoder.sock"; unset encodes in-process
+ENCODER_SERVICE_BATCH_WINDOW_MS = 2  # How long the first query of a batch waits for others
+ENCODER_SERVICE_MAX_BATCH = 64       # Texts per encode call
+ENCODER_SERVICE_TIMEOUT = 10         # Seconds a worker waits for its embeddings
+
+# Direct-answer fast path: return the stored FAQ answer without an LLM call when
+# the top hit is a near-exact match with a clear margin over the runner-up.
+# Calibrate the thresholds with `python -m models.calibrate_direct_answer --labels <hand-labelled file>`.
+DIRECT_ANSWER_ENABLED = os.getenv('DIRECT_ANSWER_ENABLED', '0') == '1'
+DIRECT_ANSWER_THRESHOLD = 0.9   # Min cosine similarity between the query and the top FAQ question
+DIRECT_ANSWER_MARGIN = 0.05     # Min similarity gap to the next distinct FAQ question
+DIRECT_ANSWER_UPGRADE = os.getenv('DIRECT_ANSWER_UPGRADE', '0') == '1'  # Rephrase with the LLM in the background
+DIRECT_ANSWER_UPGRADE_WORKERS = 4
+DIRECT_ANSWER_CALIBRATION_PATH = 'models/direct_answer_calibration.json'  # Overrides the thresholds when present
+
+# Per-stage timing/token instrumentation (see models/metrics.py)
+RAG_METRICS_ENABLED = os.getenv('RAG_METRICS_ENABLED', '0') == '1'
+
+# Headless API server (api_server.py)
+API_BATCH_WINDOW_MS = 5   # How long the first query of a batch waits for others
+API_MAX_BATCH = 64        # Queries per encode/search call
+API_MAX_PENDING = 256     # Requests in flight before new ones get 503
+API_LLM_WORKERS = 32      # Concurrent LLM calls
+
 # Always import and use these config values in your pipeline and inference code!
@@ -0,0 +1,217 @@
+"""
+FAQ corpus loading and the compact columnar corpus artifact.
+
+The JSON corpus is nested by category and subcategory; `flatten_faqs` turns
+it into a flat list of FAQ dicts. For serving, build_faiss_index also writes
+a columnar copy that the pipeline memory-maps instead of parsing JSON:
+
+    models/faq_corpus/
+        meta.json                        n, interned category names, fingerprints, current version
+        <version>/
+            question_bytes.npy + _offsets    UTF-8 text, row i is bytes[offsets[i]:offsets[i+1]]
+            answer_bytes.npy + _offsets
+            key_bytes.npy + _offsets         precomputed question_key() of each question
+            category_ids.npy                 int32 ids into meta['categories'] (-1 for none)
+            subcategory_ids.npy
+
+Strings are only decoded for the rows that are actually read.
+
+A rebuild writes its columns into a new version directory and then swaps
+meta.json, so processes that mapped the previous version keep reading
+intact files. Only versions older than the previous one are deleted.
+"""
+import json
+import os
+import shutil
+import time
+import numpy as np
+from .related_graph import question_key, corpus_fingerprint
+
+CORPUS_PATH = 'models/faq_corpus'
+TEXT_COLUMNS = ('question', 'answer', 'key')
+
+def flatten_faqs(faqs):
+    flat = []
+    def recurse(obj, category=None, subcategory=None):
+        if isinstance(obj, list):
+            for item in obj:
+                if isinstance(item, dict) and 'question' in item and 'answer' in item:
+                    flat.append({
+                        'question': item['question'],
+                        'answer': item['answer'],
+                        'category': category,
+                        'subcategory': subcategory
+                    })
+        elif isinstance(obj, dict):
+            for k, v in obj.items():
+                if category is None:
+                    recurse(v, category=k, subcategory=None)
+                else:
+                    recurse(v, category=category, subcategory=k)
+    recurse(faqs)
+    return flat
+
+def load_faq_json(data_path):
+    with open(data_path, 'r') as f:
+        return flatten_faqs(json.load(f))
+
+def source_signature(path):
+    # Size and mtime are enough to notice a re-scraped or re-cleaned JSON file
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+class TextColumn:
+    """Read-only sequence of strings over an offset-indexed UTF-8 buffer."""
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.data[start:end].tobytes().decode('utf8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+class LabelColumn:
+    """Read-only sequence of interned labels (None where the id is -1)."""
+    def __init__(self, ids, names):
+        self.ids = ids
+        self.names = names
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        label = self.ids[i]
+        return self.names[label] if label >= 0 else None
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+class FAQRows:
+    """Sequence of FAQ dicts materialised per row from the columns."""
+    def __init__(self, corpus):
+        self.corpus = corpus
+
+    def __len__(self):
+        return len(self.corpus['questions'])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return {
+            'question': self.corpus['questions'][i],
+            'answer': self.corpus['answers'][i],
+            'category': self.corpus['categories'][i],
+            'subcategory': self.corpus['subcategories'][i],
+        }
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+def _encode_text(texts):
+    encoded = [text.encode('utf8') for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype='int64')
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype='uint8'), offsets
+
+def _intern(labels):
+    names = []
+    ids = {}
+    out = np.empty(len(labels), dtype='int32')
+    for i, label in enumerate(labels):
+        if label is None:
+            out[i] = -1
+            continue
+        if label not in ids:
+            ids[label] = len(names)
+            names.append(label)
+        out[i] = ids[label]
+    return out, names
+
+def save_columnar_corpus(faqs, path=CORPUS_PATH, source_path=None):
+    """Write the columnar artifact for a flat FAQ list; `source_path` is the JSON it came from."""
+    questions = [faq['question'] for faq in faqs]
+    question_keys = [question_key(q) for q in questions]
+    categories = [faq.get('category') for faq in faqs]
+    subcategories = [faq.get('subcategory') for faq in faqs]
+    previous = _read_meta(path)
+    version = f"v{time.time_ns()}"
+    version_dir = os.path.join(path, version)
+    os.makedirs(version_dir)
+    columns = {
+        'question': questions,
+        'answer': [faq['answer'] for faq in faqs],
+        'key': question_keys,
+    }
+    for name, texts in columns.items():
+        data, offsets = _encode_text(texts)
+        np.save(os.path.join(version_dir, f'{name}_bytes.npy'), data)
+        np.save(os.path.join(version_dir, f'{name}_offsets.npy'), offsets)
+    category_ids, category_names = _intern(categories)
+    subcategory_ids, subcategory_names = _intern(subcategories)
+    np.save(os.path.join(version_dir, 'category_ids.npy'), category_ids)
+    np.save(os.path.join(version_dir, 'subcategory_ids.npy'), subcategory_ids)
+    meta = {
+        'version': version,
+        'n': len(faqs),
+        'categories': category_names,
+        'subcategories': subcategory_names,
+        'fingerprint': corpus_fingerprint(question_keys, categories, subcategories),
+        'source_signature': source_signature(source_path) if source_path else None,
+    }
+    # meta.json last: its presence marks a complete artifact, and swapping it switches readers over
+    tmp_path = os.path.join(path, 'meta.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(path, 'meta.json'))
+    # Keep the previous version for readers that read the old meta.json but have not opened its columns yet
+    keep = {version, previous.get('version') if previous else None}
+    for name in os.listdir(path):
+        if name.startswith('v') and name not in keep and os.path.isdir(os.path.join(path, name)):
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+    return meta
+
+def _read_meta(path):
+    meta_file = os.path.join(path, 'meta.json')
+    if not os.path.exists(meta_file):
+        return None
+    with open(meta_file, 'r') as f:
+        return json.load(f)
+
+def load_columnar_corpus(path=CORPUS_PATH, source_path=None):
+    """
+    Memory-map the columnar artifact as a corpus dict (same keys as
+    corpus_from_faqs), or return None if it is missing or older than
+    `source_path`.
+    """
+    meta = _read_meta(path)
+    if meta is None:
+        return None
+    if source_path and os.path.exists(source_path) and meta.get('source_signature') != source_signature(source_path):
+        return None
+    columns_dir = os.path.join(path, meta['version'])
+    def load(name):
+        return np.load(os.path.join(columns_dir, name), mmap_mode='r')
+    text = {name: TextColumn(load(f'{name}_bytes.npy'), load(f'{name}_offsets.npy')) for name in TEXT_COLUMNS}
+    corpus = {
+        'questions': text['question'],
+        'answers': text['answer'],
+        'question_keys': text['key'],
+        'categories': LabelColumn(load('category_ids.npy'), meta['categories']),
+        'subcategories': LabelColumn(load('subcategory_ids.npy'), meta['subcategories']),
+        'fingerprint': meta['fingerprint'],
+    }
+    corpus['faqs'] = FAQRows(corpus)
+    return corpus
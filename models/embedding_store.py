@@ -0,0 +1,120 @@
+"""
+Content-hashed embedding store for incremental index builds.
+
+Question embeddings are saved in corpus order next to a list of content keys
+(a hash of model name + normalised question). A rebuild only encodes
+questions whose key is not already in the store; everything else is copied
+from the memory-mapped previous store. The keys file also records a digest
+of the vectors it was saved with, so a store whose two files come from
+different builds is never reused.
+"""
+import hashlib
+import json
+import os
+import re
+import numpy as np
+
+def normalize_question(text):
+    # Lowercase, strip, and collapse whitespace (same as scraper.preprocess_faqs)
+    return re.sub(r'\s+', ' ', text.lower().strip())
+
+def content_key(model_name, question):
+    return hashlib.sha1(f"{model_name}\x00{normalize_question(question)}".encode('utf8')).hexdigest()
+
+def entry_ids(faqs):
+    """
+    Stable int64 FAISS ids per FAQ entry, derived from its question and
+    category so they survive reordering of the corpus. Exact duplicates get
+    an occurrence counter so ids stay unique.
+    """
+    ids = []
+    seen = {}
+    for faq in faqs:
+        base = f"{normalize_question(faq['question'])}\x00{faq.get('category')}\x00{faq.get('subcategory')}"
+        n = seen.get(base, 0)
+        seen[base] = n + 1
+        digest = hashlib.sha1(f"{base}\x00{n}".encode('utf8')).hexdigest()
+        ids.append(int(digest[:15], 16))  # 60 bits, always a positive int64
+    return np.array(ids, dtype='int64')
+
+def vectors_digest(vectors):
+    """SHA-1 over the shape, dtype and raw bytes of an embedding matrix."""
+    vectors = np.ascontiguousarray(vectors)
+    digest = hashlib.sha1(f"{vectors.shape}\x00{vectors.dtype.str}".encode('utf8'))
+    digest.update(memoryview(vectors).cast('B'))
+    return digest.hexdigest()
+
+def keys_path(embeddings_path):
+    return os.path.splitext(embeddings_path)[0] + '.keys.json'
+
+class EmbeddingStore:
+    """
+    Corpus-ordered embedding matrix plus one content key per row.
+
+    Args:
+        embeddings_path (str): .npy file holding the vectors
+        model_name (str): Embedding model; part of every content key
+    """
+    def __init__(self, embeddings_path, model_name):
+        self.embeddings_path = embeddings_path
+        self.model_name = model_name
+
+    def load(self):
+        """Return (keys, memory-mapped vectors), or ([], None) if there is no usable store."""
+        path = keys_path(self.embeddings_path)
+        if not (os.path.exists(path) and os.path.exists(self.embeddings_path)):
+            return [], None
+        with open(path, 'r') as f:
+            data = json.load(f)
+        if data.get('model_name') != self.model_name:
+            return [], None
+        vectors = np.load(self.embeddings_path, mmap_mode='r')
+        # The two files are replaced one after the other; they must come from the same save
+        if len(vectors) != len(data['keys']) or data.get('vectors_sha1') != vectors_digest(vectors):
+            return [], None
+        return data['keys'], vectors
+
+    def update(self, questions, encode):
+        """
+        Bring the store in line with `questions`.
+
+        Args:
+            questions (list): Questions in corpus order
+            encode (callable): list of str -> float32 array; only called for new/changed questions
+
+        Returns:
+            tuple: (vectors in corpus order, number re-encoded, number reused)
+        """
+        old_keys, old_vectors = self.load()
+        old_rows = {key: row for row, key in enumerate(old_keys)}
+        keys = [content_key(self.model_name, q) for q in questions]
+        # Encode each missing key once, even if the question appears twice
+        missing = {}
+        for q, key in zip(questions, keys):
+            if key not in old_rows and key not in missing:
+                missing[key] = q
+        fresh = {}
+        if missing:
+            encoded = np.asarray(encode(list(missing.values())), dtype='float32')
+            fresh = dict(zip(missing.keys(), encoded))
+        dim = old_vectors.shape[1] if old_vectors is not None else next(iter(fresh.values())).shape[0]
+        vectors = np.empty((len(keys), dim), dtype='float32')
+        reused = 0
+        for row, key in enumerate(keys):
+            if key in old_rows:
+                vectors[row] = old_vectors[old_rows[key]]
+                reused += 1
+            else:
+                vectors[row] = fresh[key]
+        self.save(keys, vectors)
+        return vectors, len(keys) - reused, reused
+
+    def save(self, keys, vectors):
+        # Write to temp files then swap, so a reader holding the old mmap is unaffected
+        tmp_vectors = self.embeddings_path + '.tmp.npy'
+        np.save(tmp_vectors, vectors)
+        os.replace(tmp_vectors, self.embeddings_path)
+        tmp_keys = keys_path(self.embeddings_path) + '.tmp'
+        with open(tmp_keys, 'w') as f:
+            json.dump({'model_name': self.model_name, 'vectors_sha1': vectors_digest(vectors), 'keys': keys}, f)
+        os.replace(tmp_keys, keys_path(self.embeddings_path))
@@ -0,0 +1,258 @@
+"""
+One query-encoder process shared by every worker process on a host.
+
+    python -m models.encoder_service --socket /tmp/faq-encoder.sock --backend onnx_int8
+    INDEX_MMAP=1 ENCODER_SERVICE=/tmp/faq-encoder.sock streamlit run app.py
+
+Without it each Streamlit or API worker loads its own copy of the model
+(and, for the torch backends, of torch itself). The service loads it once.
+Workers send lists of texts over a Unix socket (multiprocessing.connection,
+raw bytes, never pickle). Requests that arrive within
+ENCODER_SERVICE_BATCH_WINDOW_MS of each other are encoded in one call, up to
+ENCODER_SERVICE_MAX_BATCH texts. A batch goes out early once every connected
+worker has a request in it. The service also keeps a query-embedding LRU
+shared by all workers.
+
+Protocol: on connect the service sends a JSON hello with the model name,
+backend and dimension. Each request is a JSON list of strings, and each
+reply is b'\\x00' followed by float32 embeddings (one row per text), or
+b'\\x01' followed by an error message.
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+import numpy as np
+from .encoders import CachedEncoder, load_encoder, store_model_id
+from .config import (
+    ENCODER_BACKEND, ENCODER_THREADS, QUERY_EMBEDDING_CACHE_SIZE, ENCODER_SERVICE,
+    ENCODER_SERVICE_BATCH_WINDOW_MS, ENCODER_SERVICE_MAX_BATCH, ENCODER_SERVICE_TIMEOUT
+)
+
+REPLY_OK = b'\x00'
+REPLY_ERROR = b'\x01'
+
+class EncoderService:
+    """
+    Serves `encoder` over a Unix socket, batching concurrent requests.
+
+    Args:
+        encoder: Anything with encode(texts)
+        window (float): Seconds the first request of a batch waits for others
+        max_batch (int): Texts per encode call
+    """
+    def __init__(self, encoder, model_name, backend, window=ENCODER_SERVICE_BATCH_WINDOW_MS / 1000,
+                 max_batch=ENCODER_SERVICE_MAX_BATCH):
+        self.encoder = encoder
+        self.window = window
+        self.max_batch = max_batch
+        dim = np.asarray(encoder.encode(["warmup"])).shape[1]  # Also warms the encoder up
+        self.hello = json.dumps({'model': model_name, 'backend': backend, 'dim': int(dim)}).encode('utf8')
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.texts = 0
+        self.connections = 0
+        self.open_connections = 0
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def _collect(self):
+        batch = [self.requests.get()]
+        n_texts = len(batch[0][0])
+        flush_at = time.monotonic() + self.window
+        # Each connection has at most one request outstanding: once all of them are in, nothing else can join
+        while n_texts < self.max_batch and len(batch) < self.open_connections:
+            remaining = flush_at - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            n_texts += len(item[0])
+        return batch
+
+    def _encode_loop(self):
+        while True:
+            batch = self._collect()
+            texts = [text for item_texts, _ in batch for text in item_texts]
+            try:
+                vectors = np.asarray(self.encoder.encode(texts), dtype='float32')
+                replies, start = [], 0
+                for item_texts, _ in batch:
+                    replies.append(REPLY_OK + vectors[start:start + len(item_texts)].tobytes())
+                    start += len(item_texts)
+            except Exception as e:
+                replies = [REPLY_ERROR + str(e).encode('utf8')] * len(batch)
+            self.batches += 1
+            self.texts += len(texts)
+            for (_, conn), reply in zip(batch, replies):
+                try:
+                    conn.send_bytes(reply)
+                except OSError:
+                    pass  # The worker went away; its handler thread closes the connection
+
+    def _handle(self, conn):
+        # One request at a time per connection: replies come back from the encode thread
+        with self._lock:
+            self.open_connections += 1
+        try:
+            conn.send_bytes(self.hello)
+            while True:
+                try:
+                    texts = json.loads(conn.recv_bytes())
+                except ValueError as e:
+                    conn.send_bytes(REPLY_ERROR + f"bad request: {e}".encode('utf8'))
+                    continue
+                if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                    conn.send_bytes(REPLY_ERROR + b"request must be a JSON list of strings")
+                    continue
+                self.requests.put((texts, conn))
+        except (EOFError, OSError):
+            pass
+        finally:
+            with self._lock:
+                self.open_connections -= 1
+            conn.close()
+
+    def serve(self, address=ENCODER_SERVICE):
+        if os.path.exists(address):
+            os.unlink(address)  # A socket left behind by a previous run
+        old_umask = os.umask(0o077)  # Only this user's workers can connect
+        try:
+            self._listener = Listener(address, family='AF_UNIX')
+        finally:
+            os.umask(old_umask)
+        threading.Thread(target=self._encode_loop, name='encoder-batch', daemon=True).start()
+        print(f"Encoder service listening on {address}")
+        try:
+            while True:
+                try:
+                    conn = self._listener.accept()
+                except OSError:
+                    break  # Closed by shutdown()
+                self.connections += 1
+                threading.Thread(target=self._handle, args=(conn,), name='encoder-conn', daemon=True).start()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+    def stats(self):
+        return {
+            'connections': self.connections,
+            'open_connections': self.open_connections,
+            'batches': self.batches,
+            'texts': self.texts,
+            'mean_batch_size': self.texts / self.batches if self.batches else 0.0,
+        }
+
+class RemoteEncoder:
+    """
+    Client of an EncoderService; a drop-in for a local encoder in the pipeline.
+    Each calling thread borrows a connection of its own, so concurrent
+    queries from one worker can share the service's batches. With
+    `model_name`, the service must serve that model with `backend`, since
+    another backend's vectors drift from those the index was built with.
+    """
+    def __init__(self, address=ENCODER_SERVICE, model_name=None, backend=ENCODER_BACKEND,
+                 timeout=ENCODER_SERVICE_TIMEOUT):
+        self.address = address
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        conn = self._connect()
+        if model_name is not None:
+            expected = store_model_id(model_name, backend)
+            served = store_model_id(self.info['model'], self.info.get('backend'))
+            if served != expected:
+                conn.close()
+                raise ValueError(f"Encoder service at {address} serves {served!r}, not {expected!r}")
+        self._release(conn)
+
+    def _connect(self):
+        conn = Client(self.address, family='AF_UNIX')
+        if not conn.poll(self.timeout):
+            conn.close()
+            raise TimeoutError(f"Encoder service at {self.address} did not answer")
+        self.info = json.loads(conn.recv_bytes())
+        return conn
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._connect()
+
+    def _release(self, conn):
+        with self._lock:
+            self._idle.append(conn)
+
+    def get_sentence_embedding_dimension(self):
+        return self.info['dim']
+
+    def encode(self, texts, **kwargs):
+        # SentenceTransformer.encode kwargs are accepted and ignored; the service decides
+        if isinstance(texts, str):
+            texts = [texts]
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.info['dim']), dtype='float32')
+        conn = self._acquire()
+        try:
+            conn.send_bytes(json.dumps(texts).encode('utf8'))
+            if not conn.poll(self.timeout):
+                raise TimeoutError(f"Encoder service did not reply within {self.timeout}s")
+            reply = conn.recv_bytes()
+        except BaseException:
+            conn.close()  # A late reply must not reach the next request on this connection
+            raise
+        self._release(conn)
+        if reply[:1] != REPLY_OK:
+            raise RuntimeError(f"Encoder service error: {reply[1:].decode('utf8', 'replace')}")
+        # Copy out of the reply buffer so the array is aligned and writable
+        return np.frombuffer(reply, dtype='float32', offset=1).reshape(len(texts), self.info['dim']).copy()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+def parse_args():
+    from .rag_pipeline import MODEL_NAME
+    parser = argparse.ArgumentParser(description="Serve the query encoder to worker processes over a Unix socket")
+    parser.add_argument('--socket', default=ENCODER_SERVICE or '/tmp/faq-encoder.sock')
+    parser.add_argument('--model', default=MODEL_NAME)
+    parser.add_argument('--backend', default=ENCODER_BACKEND, help="torch, torch_int8, onnx or onnx_int8")
+    parser.add_argument('--threads', type=int, default=ENCODER_THREADS, help="Encoder threads (0 = runtime default)")
+    parser.add_argument('--cache-size', type=int, default=QUERY_EMBEDDING_CACHE_SIZE,
+                        help="Shared query-embedding LRU entries (0 disables)")
+    parser.add_argument('--window-ms', type=float, default=ENCODER_SERVICE_BATCH_WINDOW_MS)
+    parser.add_argument('--max-batch', type=int, default=ENCODER_SERVICE_MAX_BATCH)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    encoder = load_encoder(args.model, args.backend, threads=args.threads)
+    if args.cache_size:
+        encoder = CachedEncoder(encoder, args.cache_size)
+    service = EncoderService(encoder, args.model, args.backend, window=args.window_ms / 1000, max_batch=args.max_batch)
+    try:
+        service.serve(args.socket)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Encoder service stopped: {service.stats()}")
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Sentence-embedding backends for query and FAQ encoding.
+
+    python -m models.encoders --export                 # ONNX + int8 ONNX of MODEL_NAME
+    ENCODER_BACKEND=onnx_int8 streamlit run app.py
+
+Backends:
+    torch       SentenceTransformer, fp32 (the reference)
+    torch_int8  SentenceTransformer with int8 dynamic quantisation of its Linear layers
+    onnx        onnxruntime + tokenizers; never imports torch
+    onnx_int8   the same over an int8 dynamically quantised ONNX graph
+
+Every backend returns float32 numpy arrays from `encode(texts)` and exposes
+`get_sentence_embedding_dimension()`, like SentenceTransformer.
+`CachedEncoder` puts a bounded LRU of normalised query -> embedding in front
+of any of them.
+"""
+import argparse
+import json
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from .embedding_store import normalize_question
+from .config import ONNX_MODEL_DIR, ENCODER_THREADS, QUERY_EMBEDDING_CACHE_SIZE
+
+ENCODER_BACKENDS = ('torch', 'torch_int8', 'onnx', 'onnx_int8')
+ONNX_FILE = 'model.onnx'
+ONNX_INT8_FILE = 'model_int8.onnx'
+ONNX_CONFIG_FILE = 'encoder_config.json'
+
+def onnx_dir(model_name, root=ONNX_MODEL_DIR):
+    return os.path.join(root, model_name.replace('/', '__'))
+
+def store_model_id(model_name, backend):
+    """Embedding-store key prefix; non-reference backends get their own entries."""
+    return model_name if backend == 'torch' else f"{model_name}@{backend}"
+
+def backend_embeddings_path(embeddings_path, backend):
+    """Embedding-store file for `backend`, so building with one backend never overwrites another's vectors."""
+    if backend == 'torch':
+        return embeddings_path
+    root, ext = os.path.splitext(embeddings_path)
+    return f"{root}.{backend}{ext}"
+
+def load_encoder(model_name, backend='torch', threads=ENCODER_THREADS):
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unknown encoder backend {backend!r}; expected one of {ENCODER_BACKENDS}")
+    if backend.startswith('onnx'):
+        return OnnxEncoder(onnx_dir(model_name), quantized=backend == 'onnx_int8', threads=threads)
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name, device='cpu')
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    if backend == 'torch_int8':
+        import torch
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+class OnnxEncoder:
+    """Mean-pooled sentence embeddings from an exported transformer, on onnxruntime."""
+    def __init__(self, model_dir, quantized=False, threads=ENCODER_THREADS):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        path = os.path.join(model_dir, ONNX_INT8_FILE if quantized else ONNX_FILE)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found; run `python -m models.encoders --export` first")
+        with open(os.path.join(model_dir, ONNX_CONFIG_FILE), 'r') as f:
+            self.config = json.load(f)
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, 'tokenizer.json'))
+        self.tokenizer.enable_truncation(self.config['max_seq_length'])
+        self.tokenizer.enable_padding(pad_id=self.config['pad_id'], pad_token=self.config['pad_token'])
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def get_sentence_embedding_dimension(self):
+        return self.config['dim']
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=None, **kwargs):
+        # Extra SentenceTransformer.encode kwargs (show_progress_bar, ...) are accepted and ignored
+        if isinstance(texts, str):
+            texts = [texts]
+        normalize = self.config['normalize'] if normalize_embeddings is None else normalize_embeddings
+        out = []
+        for start in range(0, len(texts), batch_size):
+            batch = self.tokenizer.encode_batch(list(texts[start:start + batch_size]))
+            feeds = {
+                'input_ids': np.array([e.ids for e in batch], dtype='int64'),
+                'attention_mask': np.array([e.attention_mask for e in batch], dtype='int64'),
+                'token_type_ids': np.array([e.type_ids for e in batch], dtype='int64'),
+            }
+            hidden = self.session.run(None, {name: feeds[name] for name in self.input_names})[0]
+            mask = feeds['attention_mask'][..., None].astype('float32')
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if normalize:
+                pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            out.append(pooled.astype('float32'))
+        if not out:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype='float32')
+        return np.vstack(out)
+
+class CachedEncoder:
+    """
+    Bounded LRU of normalised text -> embedding in front of an encoder.
+    Misses in a batch are encoded together in one call.
+    """
+    def __init__(self, encoder, max_entries=QUERY_EMBEDDING_CACHE_SIZE):
+        self.encoder = encoder
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # Everything else (get_sentence_embedding_dimension, ...) comes from the wrapped encoder
+        return getattr(self.encoder, name)
+
+    def encode(self, texts, **kwargs):
+        if isinstance(texts, str):
+            texts = [texts]
+        keys = [normalize_question(text) for text in texts]
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = vector
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+        first_text = dict(zip(reversed(keys), reversed(texts)))  # any original text per key
+        if missing:
+            vectors = np.asarray(self.encoder.encode([first_text[key] for key in missing], **kwargs), dtype='float32')
+            with self._lock:
+                for key, vector in zip(missing, vectors):
+                    found[key] = vector
+                    self._entries[key] = vector
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        with self._lock:
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        return np.stack([found[key] for key in keys]) if keys else np.zeros((0, 0), dtype='float32')
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+def export_onnx(model_name, out_dir=None, quantize=True, opset=17):
+    """
+    Export the transformer of a SentenceTransformer model to ONNX (and an
+    int8 dynamically quantised copy) with its tokenizer and pooling config.
+    Needs torch, onnx and onnxruntime; serving the result needs only
+    onnxruntime and tokenizers.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+    out_dir = out_dir or onnx_dir(model_name)
+    os.makedirs(out_dir, exist_ok=True)
+    st_model = SentenceTransformer(model_name, device='cpu')
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+    tokenizer.save_pretrained(out_dir)
+    sample = tokenizer(['export sample', 'a longer export sample sentence'], padding=True, return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+    axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names + ['last_hidden_state']}
+    path = os.path.join(out_dir, ONNX_FILE)
+
+    class LastHiddenState(torch.nn.Module):
+        # Plain tensor in, tensor out: keeps the traced graph free of
+        # ModelOutput/cache plumbing that differs between transformers versions
+        def __init__(self):
+            super().__init__()
+            self.transformer = transformer
+
+        def forward(self, *inputs):
+            return self.transformer(**dict(zip(input_names, inputs)), return_dict=True).last_hidden_state
+
+    with torch.no_grad():
+        torch.onnx.export(
+            LastHiddenState().eval(), tuple(sample[name] for name in input_names), path,
+            input_names=input_names, output_names=['last_hidden_state'], dynamic_axes=axes,
+            opset_version=opset, dynamo=False,
+        )
+    pooling = [m for m in st_model if type(m).__name__ == 'Pooling']
+    if pooling and not getattr(pooling[0], 'pooling_mode_mean_tokens', True):
+        raise ValueError(f"{model_name} does not use mean pooling, which OnnxEncoder implements")
+    config = {
+        'model_name': model_name,
+        'dim': transformer.config.hidden_size,  # mean pooling keeps the hidden size
+        'max_seq_length': st_model.max_seq_length,
+        'normalize': any(type(m).__name__ == 'Normalize' for m in st_model),
+        'pad_id': tokenizer.pad_token_id,
+        'pad_token': tokenizer.pad_token,
+    }
+    with open(os.path.join(out_dir, ONNX_CONFIG_FILE), 'w') as f:
+        json.dump(config, f, indent=2)
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(path, os.path.join(out_dir, ONNX_INT8_FILE), weight_type=QuantType.QInt8)
+    return out_dir
+
+def parse_args():
+    from .rag_pipeline import MODEL_NAME
+    parser = argparse.ArgumentParser(description="Export sentence-embedding models for the ONNX backends")
+    parser.add_argument('--export', action='store_true', help="Export MODEL_NAME (or --model) to ONNX")
+    parser.add_argument('--model', default=MODEL_NAME)
+    parser.add_argument('--out', help=f"Output directory (default {ONNX_MODEL_DIR}/<model>)")
+    parser.add_argument('--no-quantize', action='store_true', help="Skip the int8 ONNX copy")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if not args.export:
+        print(f"Backends: {', '.join(ENCODER_BACKENDS)}. Use --export to create the ONNX models.")
+        return
+    out_dir = export_onnx(args.model, args.out, quantize=not args.no_quantize)
+    print(f"Exported {args.model} to {out_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+FAISS index factory shared by build_faiss_index.py (build time) and
+rag_pipeline.py (query time).
+
+The index type and its parameters are written to a small JSON file next to
+the index so the pipeline can apply the matching search parameters
+(nprobe / efSearch) and query normalisation when it loads the index.
+"""
+import json
+import os
+import numpy as np
+
+INDEX_TYPES = ('flat_l2', 'flat_ip', 'ivf_flat', 'hnsw', 'ivf_pq')
+
+DEFAULT_INDEX_PARAMS = {
+    'flat_l2': {},
+    'flat_ip': {},
+    'ivf_flat': {'nlist': 1024, 'nprobe': 16},
+    'hnsw': {'M': 32, 'efConstruction': 200, 'efSearch': 64},
+    'ivf_pq': {'nlist': 1024, 'nprobe': 16, 'pq_m': 16, 'pq_nbits': 8},
+}
+
+# Parameters that are applied at search time rather than build time
+SEARCH_PARAMS = ('nprobe', 'efSearch')
+
+def meta_path(index_path):
+    return os.path.splitext(index_path)[0] + '.meta.json'
+
+def ids_path(index_path):
+    # Corpus-ordered FAISS ids for ID-mapped indexes
+    return os.path.splitext(index_path)[0] + '.ids.npy'
+
+def id_lookup(ids):
+    """Sorted (ids, corpus rows) pair for mapping search results back to rows."""
+    ids = np.asarray(ids, dtype='int64')
+    order = np.argsort(ids)
+    return ids[order], order
+
+def ids_to_positions(I, lookup):
+    # Unknown ids (and FAISS's -1 padding) map to -1
+    sorted_ids, order = lookup
+    pos = np.clip(np.searchsorted(sorted_ids, I), 0, len(sorted_ids) - 1)
+    return np.where(sorted_ids[pos] == I, order[pos], -1)
+
+def uses_cosine(index_type):
+    # Everything except the original brute-force L2 index searches normalised
+    # vectors by inner product, i.e. cosine similarity
+    return index_type != 'flat_l2'
+
+def normalize(embeddings):
+    import faiss
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32').copy()
+    faiss.normalize_L2(embeddings)
+    return embeddings
+
+def resolve_params(index_type, params=None, n_vectors=None, dim=None):
+    """
+    Merge user params over the defaults and shrink them to what the corpus
+    size allows (k-means needs at least as many points as centroids).
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+    resolved = dict(DEFAULT_INDEX_PARAMS[index_type])
+    # Ignore parameters that belong to other index types
+    resolved.update({k: v for k, v in (params or {}).items() if v is not None and k in resolved})
+    if n_vectors is not None and 'nlist' in resolved:
+        # FAISS recommends ~39 training points per centroid
+        resolved['nlist'] = max(1, min(resolved['nlist'], n_vectors // 39 or 1))
+        resolved['nprobe'] = min(resolved.get('nprobe', 1), resolved['nlist'])
+    if index_type == 'ivf_pq':
+        if dim is not None and dim % resolved['pq_m'] != 0:
+            raise ValueError(f"pq_m={resolved['pq_m']} must divide the embedding dimension {dim}")
+        if n_vectors is not None:
+            while resolved['pq_nbits'] > 1 and 39 * 2 ** resolved['pq_nbits'] > n_vectors:
+                resolved['pq_nbits'] -= 1
+    return resolved
+
+def factory_string(index_type, params):
+    if index_type in ('flat_l2', 'flat_ip'):
+        return 'Flat'
+    if index_type == 'ivf_flat':
+        return f"IVF{params['nlist']},Flat"
+    if index_type == 'hnsw':
+        return f"HNSW{params['M']},Flat"
+    if index_type == 'ivf_pq':
+        return f"IVF{params['nlist']},PQ{params['pq_m']}x{params['pq_nbits']}"
+    raise ValueError(f"Unknown index type {index_type!r}")
+
+def supports_remove(index_type):
+    # HNSW graphs cannot delete nodes; those indexes are rebuilt instead
+    return index_type != 'hnsw'
+
+def build_index(embeddings, index_type='flat_l2', params=None, ids=None):
+    """
+    Build and fill an index of the given type. With `ids`, vectors are added
+    under those int64 ids (ID-mapped) instead of their row positions.
+
+    Returns:
+        tuple: (faiss index, resolved params)
+    """
+    import faiss
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    n, dim = embeddings.shape
+    params = resolve_params(index_type, params, n_vectors=n, dim=dim)
+    if uses_cosine(index_type):
+        embeddings = normalize(embeddings)
+        metric = faiss.METRIC_INNER_PRODUCT
+    else:
+        metric = faiss.METRIC_L2
+    index = faiss.index_factory(dim, factory_string(index_type, params), metric)
+    if index_type == 'hnsw':
+        index.hnsw.efConstruction = params['efConstruction']
+    if not index.is_trained:
+        index.train(embeddings)
+    if ids is None:
+        index.add(embeddings)
+    else:
+        # IVF indexes store ids natively; flat and HNSW need an id map
+        if index_type not in ('ivf_flat', 'ivf_pq'):
+            index = faiss.IndexIDMap2(index)
+        index.add_with_ids(embeddings, np.asarray(ids, dtype='int64'))
+    apply_search_params(index, params)
+    return index, params
+
+def add_vectors(index, index_type, embeddings, ids):
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    if uses_cosine(index_type):
+        embeddings = normalize(embeddings)
+    index.add_with_ids(embeddings, np.asarray(ids, dtype='int64'))
+
+def remove_vectors(index, ids):
+    return index.remove_ids(np.asarray(ids, dtype='int64'))
+
+def apply_search_params(index, params):
+    import faiss
+    space = faiss.ParameterSpace()
+    for name in SEARCH_PARAMS:
+        if name in params:
+            space.set_index_parameter(index, name, params[name])
+
+def id_selector(ids):
+    """Reusable FAISS selector accepting only `ids` (row positions, or content ids when ID-mapped)."""
+    import faiss
+    return faiss.IDSelectorBatch(np.ascontiguousarray(ids, dtype='int64'))
+
+def filtered_search(index, queries, k, selector):
+    """
+    index.search restricted to the vectors `selector` accepts, with the
+    index's own nprobe / efSearch. The search runs on the shared (possibly
+    memory-mapped) index, so no vectors are copied.
+    """
+    import faiss
+    inner = index
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        inner = faiss.downcast_index(index.index)
+    ivf = faiss.try_extract_index_ivf(inner)
+    if ivf is not None:
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    elif isinstance(inner, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=inner.hnsw.efSearch)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    return index.search(np.ascontiguousarray(queries, dtype='float32'), k, params=params)
+
+def index_meta(index_type, params, **extra):
+    meta = {
+        'index_type': index_type,
+        'params': params,
+        'metric': 'inner_product' if uses_cosine(index_type) else 'l2',
+        'normalize': uses_cosine(index_type),
+    }
+    meta.update(extra)
+    return meta
+
+def save_index(index, index_path, index_type, params, **extra):
+    import faiss
+    # Write aside and rename: processes that memory-mapped the old file keep reading it intact
+    tmp_path = f"{index_path}.tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, index_path)
+    meta = index_meta(index_type, params, ntotal=int(index.ntotal), dim=int(index.d), **extra)
+    tmp_meta = f"{meta_path(index_path)}.tmp"
+    with open(tmp_meta, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_meta, meta_path(index_path))
+    return meta
+
+def save_ids(ids, index_path):
+    tmp_path = f"{ids_path(index_path)}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, ids)
+    os.replace(tmp_path, ids_path(index_path))
+
+def read_index(index_path, mmap=False):
+    """
+    Load a saved index. With `mmap` its vectors (and HNSW graph or IVF lists)
+    are mapped read-only from the file instead of copied onto the heap, so
+    every process serving the same file shares one copy in the page cache.
+    A mapped index cannot be modified.
+    """
+    import faiss
+    if not mmap:
+        return faiss.read_index(index_path)
+    # IO_FLAG_MMAP_IFC (faiss >= 1.10) maps flat codes too; older versions only map IVF lists
+    flags = faiss.IO_FLAG_READ_ONLY | getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP)
+    return faiss.read_index(index_path, flags)
+
+def load_index_meta(index_path):
+    """Metadata for an index; indexes built before it existed are flat L2."""
+    path = meta_path(index_path)
+    if not os.path.exists(path):
+        return index_meta('flat_l2', {})
+    with open(path, 'r') as f:
+        return json.load(f)
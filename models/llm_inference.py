@@ -1,11 +1,26 @@
 import os
 import requests
+from .config import HF_API_URL, HF_MODEL, HF_CONNECT_TIMEOUT, HF_READ_TIMEOUT
 
-def query_huggingface_llm(prompt, model="mistralai/Mistral-7B-Instruct-v0.3"):
-    api_url = f"https://api-inference.huggingface.co/models/{model}"
+_session = requests.Session()
+
+def format_chat_prompt(system_prompt, user_prompt):
+    # Mistral instruct format; the system message goes inside the first [INST] block
+    return f"<s>[INST] {system_prompt}\n\n{user_prompt} [/INST]"
+
+def query_huggingface_llm(prompt, model=HF_MODEL, max_new_tokens=None, timeout=(HF_CONNECT_TIMEOUT, HF_READ_TIMEOUT),
+                          api_url=HF_API_URL):
+    api_url = api_url.format(model=model)
     headers = {"Authorization": f"Bearer {os.getenv('HF_API_KEY')}", "Content-Type": "application/json"}
-    payload = {"inputs": prompt}
-    response = requests.post(api_url, headers=headers, json=payload)
+    payload = {"inputs": prompt, "parameters": {"return_full_text": False}}
+    if max_new_tokens:
+        payload["parameters"]["max_new_tokens"] = max_new_tokens
+    try:
+        response = _session.post(api_url, headers=headers, json=payload, timeout=timeout)
+    except requests.exceptions.Timeout as e:
+        raise TimeoutError(f"HuggingFace API request timed out: {str(e)}")
+    except requests.exceptions.RequestException as e:
+        raise Exception(f"HuggingFace API request failed: {str(e)}")
     if response.status_code == 200:
         result = response.json()
         # HuggingFace returns a list of dicts with 'generated_text'
@@ -18,4 +33,4 @@ def query_huggingface_llm(prompt, model="mistralai/Mistral-7B-Instruct-v0.3"):
 
 if __name__ == "__main__":
     prompt = "What is Jupiter Money?"
-    print(query_huggingface_llm(prompt)) 
\ No newline at end of file
+    print(query_huggingface_llm(prompt))
@@ -0,0 +1,228 @@
+"""
+LLM providers behind one interface, with hedged requests and deadlines.
+
+A provider turns a build_prompt() prompt into completion text:
+
+    together     Together AI chat completions (together_inference)
+    huggingface  Hugging Face Inference API (llm_inference)
+
+`HedgedLLM` sends a request to the first provider. If no answer has arrived
+after that provider's recent p95 latency (LLM_HEDGE_QUANTILE), it sends the
+same request to the next provider and returns whichever good response comes
+first. A provider that fails is failed over immediately. With a deadline,
+it raises DeadlineExceeded once the deadline passes instead of blocking.
+
+Calls that lose the race cannot be interrupted mid-request. Unstarted ones
+are cancelled; in-flight ones are abandoned and end by their own timeouts,
+which the deadline caps (LLM_HEDGE_CALL_TIMEOUT when there is none). While
+abandoned calls fill the thread pool, no new hedges are sent: they would only
+queue behind them. Failover still happens.
+
+    LLM_PROVIDERS=together,huggingface streamlit run app.py
+"""
+import contextvars
+import functools
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import numpy as np
+from . import metrics
+from .together_inference import DeadlineExceeded, get_client
+from .llm_inference import format_chat_prompt, query_huggingface_llm
+from .config import (
+    HF_API_URL, HF_MODEL, HF_CONNECT_TIMEOUT, HF_READ_TIMEOUT, LLM_PROVIDERS, LLM_HEDGE_QUANTILE, LLM_HEDGE_INITIAL_DELAY, LLM_HEDGE_MIN_DELAY,
+    LLM_HEDGE_MIN_SAMPLES, LLM_HEDGE_WINDOW, LLM_HEDGE_WORKERS, LLM_HEDGE_CALL_TIMEOUT
+)
+
+class TogetherProvider:
+    name = 'together'
+
+    def __init__(self, client=None):
+        self.client = client
+
+    def complete(self, prompt, deadline=None):
+        client = self.client or get_client()
+        return client.chat(client.system_messages(prompt['system'], prompt['user']),
+                           max_tokens=prompt['max_tokens'], deadline=deadline)
+
+class HuggingFaceProvider:
+    name = 'huggingface'
+
+    def __init__(self, model=HF_MODEL, api_url=HF_API_URL):
+        self.model = model
+        self.api_url = api_url
+
+    def complete(self, prompt, deadline=None):
+        # Never unbounded: a hedged or failover call must not hold a pool thread forever
+        timeout = (HF_CONNECT_TIMEOUT, HF_READ_TIMEOUT)
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded("LLM deadline exceeded")
+            timeout = (min(HF_CONNECT_TIMEOUT, remaining), min(HF_READ_TIMEOUT, remaining))
+        text = query_huggingface_llm(format_chat_prompt(prompt['system'], prompt['user']), model=self.model,
+                                     max_new_tokens=prompt['max_tokens'], timeout=timeout, api_url=self.api_url)
+        if not isinstance(text, str):
+            raise Exception(f"HuggingFace API error: unexpected response {str(text)[:200]}")
+        return text
+
+PROVIDERS = {'together': TogetherProvider, 'huggingface': HuggingFaceProvider}
+
+class HedgedLLM:
+    """
+    Completes prompts with the first provider, hedging to the next ones.
+
+    Args:
+        providers (list): Provider instances, primary first
+        quantile (float): Latency quantile of the pending provider to wait before hedging
+        initial_delay (float): Hedge delay until `min_samples` latencies are recorded
+        min_delay (float): Lower bound on the hedge delay
+        max_workers (int): Threads for concurrent provider calls
+        call_timeout (float): Seconds a pooled call may run when complete() gets no deadline
+    """
+    def __init__(self, providers, quantile=LLM_HEDGE_QUANTILE, initial_delay=LLM_HEDGE_INITIAL_DELAY,
+                 min_delay=LLM_HEDGE_MIN_DELAY, min_samples=LLM_HEDGE_MIN_SAMPLES, window=LLM_HEDGE_WINDOW,
+                 max_workers=LLM_HEDGE_WORKERS, call_timeout=LLM_HEDGE_CALL_TIMEOUT):
+        if not providers:
+            raise ValueError("HedgedLLM needs at least one provider")
+        self.providers = list(providers)
+        self.quantile = quantile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.latencies = {provider.name: deque(maxlen=window) for provider in self.providers}
+        self.wins = {provider.name: 0 for provider in self.providers}
+        self.max_workers = max_workers
+        self.call_timeout = call_timeout
+        self.in_flight = 0  # Pooled calls submitted and not yet finished, abandoned ones included
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='llm-hedge')
+
+    def _finished(self, future):
+        with self._lock:
+            self.in_flight -= 1
+
+    def hedge_delay(self, provider):
+        with self._lock:
+            samples = list(self.latencies[provider.name])
+        if len(samples) < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, float(np.quantile(samples, self.quantile)))
+
+    def _call(self, provider, prompt, deadline):
+        start = time.monotonic()
+        text = provider.complete(prompt, deadline=deadline)
+        with self._lock:
+            self.latencies[provider.name].append(time.monotonic() - start)
+        return text
+
+    def complete(self, prompt, deadline=None):
+        """
+        Returns:
+            tuple: (completion text, name of the provider that answered)
+
+        Raises:
+            DeadlineExceeded: `deadline` (a time.monotonic() value) passed first
+        """
+        if len(self.providers) == 1 and deadline is None:
+            # Nothing to race against: call inline and skip the thread hop
+            return self._call(self.providers[0], prompt, None), self.providers[0].name
+        remaining = iter(self.providers)
+        pending = {}
+        errors = []
+        # Calls that lose the race keep their thread until they end; never let that be unbounded
+        call_deadline = deadline if deadline is not None else time.monotonic() + self.call_timeout
+
+        def launch():
+            provider = next(remaining, None)
+            if provider is None:
+                return None
+            # Each call gets its own copy of the caller's context (metrics trace)
+            call = functools.partial(contextvars.copy_context().run, self._call, provider, prompt, call_deadline)
+            with self._lock:
+                self.in_flight += 1
+            future = self._executor.submit(call)
+            future.add_done_callback(self._finished)
+            pending[future] = provider
+            return provider
+
+        provider = launch()
+        hedge_at = time.monotonic() + self.hedge_delay(provider)
+        while pending:
+            wakes = [t for t in (hedge_at, deadline) if t is not None]
+            timeout = max(0.0, min(wakes) - time.monotonic()) if wakes else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    text = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    metrics.inc('llm_provider_errors')
+                    if not isinstance(e, DeadlineExceeded):
+                        failover = launch()
+                        if failover is not None:
+                            hedge_at = time.monotonic() + self.hedge_delay(failover)
+                    continue
+                for other in pending:
+                    other.cancel()
+                with self._lock:
+                    self.wins[provider.name] += 1
+                if provider is not self.providers[0]:
+                    metrics.inc('llm_hedge_wins')
+                return text, provider.name
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                for future in pending:
+                    future.cancel()
+                metrics.inc('llm_deadline_exceeded')
+                raise DeadlineExceeded("LLM deadline exceeded")
+            if pending and hedge_at is not None and now >= hedge_at:
+                if self.in_flight >= self.max_workers:
+                    # The pool is busy with abandoned calls; a hedge would only wait in the queue
+                    metrics.inc('llm_hedge_skipped')
+                    hedge_at = None
+                    continue
+                hedged = launch()
+                if hedged is not None:
+                    metrics.inc('llm_hedged')
+                    hedge_at = now + self.hedge_delay(hedged)
+                else:
+                    hedge_at = None
+        if errors and all(isinstance(e, DeadlineExceeded) for e in errors):
+            metrics.inc('llm_deadline_exceeded')
+            raise errors[-1]
+        raise Exception(f"All LLM providers failed: {'; '.join(str(e) for e in errors)}")
+
+    def stats(self):
+        """Per provider: answers won, recent p50 latency and the current hedge delay."""
+        stats = {}
+        for provider in self.providers:
+            with self._lock:
+                samples = list(self.latencies[provider.name])
+                wins = self.wins[provider.name]
+            stats[provider.name] = {
+                'wins': wins,
+                'p50_ms': 1000 * float(np.median(samples)) if samples else None,
+                'hedge_delay_ms': 1000 * self.hedge_delay(provider),
+            }
+        return stats
+
+_default_llm = None
+_default_llm_lock = threading.Lock()
+
+def get_llm():
+    """Return the process-wide HedgedLLM over LLM_PROVIDERS."""
+    global _default_llm
+    if _default_llm is None:
+        with _default_llm_lock:
+            if _default_llm is None:
+                _default_llm = HedgedLLM([PROVIDERS[name]() for name in LLM_PROVIDERS])
+    return _default_llm
+
+def set_llm(llm):
+    """Replace the shared HedgedLLM, e.g. with one over local stub servers."""
+    global _default_llm
+    with _default_llm_lock:
+        _default_llm = llm
@@ -0,0 +1,291 @@
+"""
+Optional per-request instrumentation for the RAG pipeline.
+
+When RAG_METRICS_ENABLED is off, `trace_request()` yields None and `stage()`
+returns a shared no-op context manager, so the hot path only pays for one
+ContextVar lookup per stage.
+
+When it is on, each request gets a Trace (stage timings, token counts,
+retries, cache hits) that is attached to the result dict and aggregated into
+process-wide histograms. Export them with `dump_metrics('prometheus'|'json')`
+or serve them over HTTP with `serve_metrics(port)`.
+"""
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .config import RAG_METRICS_ENABLED
+
+# Seconds; spans MiniLM encodes (ms) to 70B completions (tens of seconds)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+
+# HELP text for the fixed metric families; per-request counters get a generic one
+METRIC_HELP = {
+    'rag_requests_total': "Requests traced, by kind",
+    'rag_stage_seconds': "Time spent in each pipeline stage per request",
+    'rag_request_seconds': "End-to-end request time, by kind",
+    'rag_time_to_first_token_seconds': "Time until the first streamed answer token",
+    'llm_prompt_tokens': "Prompt tokens per request",
+    'llm_completion_tokens': "Completion tokens per request",
+}
+
+def metric_help(name):
+    if name in METRIC_HELP:
+        return METRIC_HELP[name]
+    if name.startswith('rag_') and name.endswith('_total'):
+        return f"Sum of the per-request {name[len('rag_'):-len('_total')]} counter"
+    return name
+
+_current_trace = contextvars.ContextVar('rag_trace', default=None)
+_enabled = RAG_METRICS_ENABLED
+
+def enable(flag=True):
+    global _enabled
+    _enabled = flag
+
+def is_enabled():
+    return _enabled
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+class MetricsRegistry:
+    """Thread-safe labelled histograms and counters."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram(buckets)
+            hist.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def record(self, trace):
+        for stage_name, seconds in trace.stages.items():
+            self.observe('rag_stage_seconds', seconds, stage=stage_name)
+        self.observe('rag_request_seconds', trace.total_seconds(), kind=trace.kind)
+        self.inc('rag_requests_total', kind=trace.kind)
+        for name, value in trace.counters.items():
+            self.inc(f'rag_{name}_total', value)
+        for name in ('prompt_tokens', 'completion_tokens'):
+            if name in trace.counters:
+                self.observe(f'llm_{name}', trace.counters[name], buckets=TOKEN_BUCKETS)
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def to_json(self):
+        with self._lock:
+            return {
+                'counters': [
+                    {'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                'histograms': [
+                    {'name': name, 'labels': dict(labels), 'buckets': list(hist.buckets),
+                     'counts': list(hist.counts), 'sum': hist.sum, 'count': hist.count}
+                    for (name, labels), hist in sorted(self.histograms.items())
+                ],
+            }
+
+    def to_prometheus(self):
+        def fmt_labels(labels, extra=None):
+            items = list(labels) + ([extra] if extra else [])
+            if not items:
+                return ''
+            return '{' + ','.join(f'{k}="{v}"' for k, v in items) + '}'
+        lines = []
+
+        def family(name, kind, seen):
+            # HELP and TYPE once per metric name, before its first sample
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {metric_help(name)}")
+                lines.append(f"# TYPE {name} {kind}")
+        with self._lock:
+            seen = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                family(name, 'counter', seen)
+                lines.append(f"{name}{fmt_labels(labels)} {value}")
+            for (name, labels), hist in sorted(self.histograms.items()):
+                family(name, 'histogram', seen)
+                cumulative = 0
+                for bound, count in zip(list(hist.buckets) + ['+Inf'], hist.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{fmt_labels(labels, ('le', bound))} {cumulative}")
+                lines.append(f"{name}_sum{fmt_labels(labels)} {hist.sum}")
+                lines.append(f"{name}_count{fmt_labels(labels)} {hist.count}")
+        return '\n'.join(lines) + '\n'
+
+registry = MetricsRegistry()
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class Trace:
+    """Timings and counters for one request."""
+    def __init__(self, kind='rag_answer'):
+        self.kind = kind
+        self.start = time.perf_counter()
+        self.end = None
+        self.stages = {}
+        self.counters = {}
+        self.flags = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def add_time(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def inc(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def total_seconds(self):
+        return (self.end or time.perf_counter()) - self.start
+
+    def as_dict(self):
+        return {
+            'total_ms': 1000 * self.total_seconds(),
+            'stages_ms': {name: 1000 * seconds for name, seconds in self.stages.items()},
+            **self.counters,
+            **self.flags,
+        }
+
+def current_trace():
+    return _current_trace.get()
+
+def stage(name):
+    """Time a block into the current request's trace (no-op without one)."""
+    trace = _current_trace.get()
+    if trace is None:
+        return _NULL_STAGE
+    return trace.stage(name)
+
+def inc(name, amount=1):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.inc(name, amount)
+
+def start_trace(kind='rag_answer'):
+    """A new Trace, or None when instrumentation is disabled. Does not make it current."""
+    return Trace(kind) if _enabled else None
+
+def finish_trace(trace):
+    if trace is not None:
+        trace.end = time.perf_counter()
+        registry.record(trace)
+
+@contextmanager
+def activate(trace):
+    """Make `trace` current for the block (stage()/inc() record into it)."""
+    if trace is None:
+        yield None
+        return
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+def iterate_in(trace, iterable):
+    """
+    Iterate `iterable` with `trace` current only while each item is produced,
+    so a generator can be traced without holding the context across yields.
+    """
+    if trace is None:
+        yield from iterable
+        return
+    it = iter(iterable)
+    while True:
+        token = _current_trace.set(trace)
+        try:
+            item = next(it)
+        except StopIteration:
+            return
+        finally:
+            _current_trace.reset(token)
+        yield item
+
+@contextmanager
+def trace_request(kind='rag_answer'):
+    """Yield a current Trace for the block and record it at the end, or None when disabled."""
+    trace = start_trace(kind)
+    if trace is None:
+        yield None
+        return
+    try:
+        with activate(trace):
+            yield trace
+    finally:
+        finish_trace(trace)
+
+def dump_metrics(fmt='prometheus'):
+    if fmt == 'json':
+        return json.dumps(registry.to_json(), indent=2)
+    return registry.to_prometheus()
+
+def serve_metrics(port=9108, host='127.0.0.1'):
+    """Serve /metrics (Prometheus text) and /metrics.json from a daemon thread."""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.startswith('/metrics.json'):
+                body, content_type = dump_metrics('json'), 'application/json'
+            elif self.path.startswith('/metrics'):
+                body, content_type = dump_metrics('prometheus'), 'text/plain; version=0.0.4'
+            else:
+                self.send_response(404)
+                self.end_headers()
+                return
+            data = body.encode('utf8')
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
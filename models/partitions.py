@@ -0,0 +1,54 @@
+"""
+Category partitions of the FAQ corpus for filtered search.
+
+Every category, and every (category, subcategory) pair, gets the sorted list
+of corpus rows it contains. build_faiss_index saves them next to the index;
+the pipeline searches the main index with a FAISS ID selector over a
+partition's rows, so a filtered query only considers its own partition
+instead of post-filtering an unfiltered search, and no per-partition copy of
+the vectors is kept.
+"""
+import json
+import os
+import numpy as np
+
+PARTITIONS_PATH = 'models/faq_partitions.npz'
+
+def partition_key(category, subcategory=None):
+    # Falsy subcategory means the whole category, matching select_related's filters
+    return (category, subcategory) if subcategory else (category,)
+
+def build_partitions(categories, subcategories):
+    """Dict of partition key -> int64 array of corpus rows."""
+    rows = {}
+    for i, (category, subcategory) in enumerate(zip(categories, subcategories)):
+        rows.setdefault(partition_key(category), []).append(i)
+        if subcategory:
+            rows.setdefault(partition_key(category, subcategory), []).append(i)
+    return {key: np.asarray(members, dtype='int64') for key, members in rows.items()}
+
+def save_partitions(partitions, fingerprint, path=PARTITIONS_PATH):
+    keys = list(partitions)
+    sizes = np.array([len(partitions[key]) for key in keys], dtype='int64')
+    # Write aside and rename so a worker loading the old file never sees a partial one
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(
+            f,
+            keys=np.array(json.dumps([list(key) for key in keys])),
+            offsets=np.concatenate([[0], np.cumsum(sizes)]),
+            rows=np.concatenate([partitions[key] for key in keys]) if keys else np.empty(0, dtype='int64'),
+            fingerprint=np.array(fingerprint),
+        )
+    os.replace(tmp_path, path)
+
+def load_partitions(fingerprint, path=PARTITIONS_PATH):
+    """Return the saved partitions, or None if they are missing or built for a different corpus."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        if str(data['fingerprint']) != fingerprint:
+            return None
+        keys = [tuple(key) for key in json.loads(str(data['keys']))]
+        offsets, rows = data['offsets'], data['rows']
+        return {key: rows[offsets[i]:offsets[i + 1]] for i, key in enumerate(keys)}
@@ -0,0 +1,146 @@
+"""
+Chat prompts for the RAG pipeline.
+
+Every prompt is a fixed system message followed by a user message with the
+retrieved FAQs and the question. The system message never changes between
+requests, so providers that cache prompt prefixes can reuse it. Everything
+per-request (FAQs, answer language, the question) goes in the user message.
+
+The FAQ context is fitted into PROMPT_CONTEXT_TOKENS: each answer is capped
+at PROMPT_ANSWER_TOKENS (trimmed at a sentence boundary), lower-ranked FAQs
+are trimmed further or dropped when the budget runs out, and the top FAQ is
+always kept. `max_tokens` for the completion grows with the context instead
+of always being MAX_TOKENS.
+
+Token counts are estimates (about four characters per token for ASCII text,
+one token per character otherwise); the provider's own counts are recorded
+by together_inference when metrics are enabled.
+"""
+import math
+import re
+from .config import (
+    MAX_TOKENS, TOP_K_RETRIEVAL, PROMPT_CONTEXT_TOKENS, PROMPT_ANSWER_TOKENS, PROMPT_MIN_ANSWER_TOKENS,
+    PROMPT_MIN_COMPLETION_TOKENS, PROMPT_COMPLETION_RATIO
+)
+
+CHARS_PER_TOKEN = 4
+NON_ENGLISH_COMPLETION_FACTOR = 2  # Non-Latin scripts take far more tokens per word
+TRIM_MARKER = ' …'
+
+SYSTEM_PROMPT = (
+    "You are a helpful, friendly, and knowledgeable FAQ assistant for Jupiter Money. "
+    "Each user message lists the most relevant FAQs, followed by the user's question. "
+    "If the answer is present in the FAQs, use and rephrase it in a natural, step-by-step, human-like way. "
+    "Use bullet points or numbered steps for clarity when possible. "
+    "If the user asks for the meaning of a banking or financial term (e.g., KYC, NEFT, UPI), provide a clear, concise explanation based on your general knowledge. "
+    "If you are unsure or the answer is not present, say so politely and suggest contacting support (support@jupiter.money). "
+    "Always be truthful, complete, accurate, safe, fluent, and coherent. "
+    "If the user message asks for a language, write the answer in it, keeping product names, app labels and email addresses as they are.\n"
+    "Start your reply with 'FINAL ANSWER:' and output only the answer."
+)
+
+LANGUAGE_NAMES = {
+    'en': 'English', 'hi': 'Hindi', 'fr': 'French', 'bn': 'Bengali', 'ta': 'Tamil', 'te': 'Telugu',
+    'mr': 'Marathi', 'gu': 'Gujarati', 'kn': 'Kannada', 'ml': 'Malayalam', 'pa': 'Punjabi', 'ur': 'Urdu',
+    'es': 'Spanish', 'de': 'German',
+}
+
+def language_name(code):
+    return LANGUAGE_NAMES.get(code, code)
+
+def estimate_tokens(text):
+    ascii_chars = sum(1 for c in text if c < '\x80')
+    return math.ceil(ascii_chars / CHARS_PER_TOKEN) + (len(text) - ascii_chars)
+
+def trim_text(text, max_tokens):
+    """Longest prefix within `max_tokens`, cut at a sentence (or failing that, word) boundary."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    budget = max(max_tokens - estimate_tokens(TRIM_MARKER), 1)
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    prefix = text[:lo]
+    sentence_ends = [m.end() for m in re.finditer(r'[.!?।](\s|$)|\n', prefix)]
+    if sentence_ends and sentence_ends[-1] >= len(prefix) // 2:
+        prefix = prefix[:sentence_ends[-1]]
+    elif ' ' in prefix:
+        prefix = prefix[:prefix.rindex(' ')]
+    return prefix.rstrip() + TRIM_MARKER
+
+def faq_block(faq, answer=None):
+    return (
+        f"Category: {faq['category'] or 'General'} | Subcategory: {faq['subcategory'] or '-'}\n"
+        f"Q: {faq['question']}\nA: {faq['answer'] if answer is None else answer}"
+    )
+
+def fit_context(retrieved, budget=PROMPT_CONTEXT_TOKENS, answer_tokens=PROMPT_ANSWER_TOKENS,
+                min_answer_tokens=PROMPT_MIN_ANSWER_TOKENS):
+    """
+    FAQ context within `budget` estimated tokens, in retrieval order.
+
+    Returns:
+        tuple: (context text, stats dict with context_tokens, faqs, trimmed, dropped)
+    """
+    blocks = []
+    used = 0
+    trimmed = 0
+    for faq in retrieved:
+        header_tokens = estimate_tokens(faq_block(faq, answer=''))
+        remaining = min(answer_tokens, budget - used - header_tokens)
+        if remaining < min_answer_tokens:
+            if blocks:
+                break
+            remaining = min_answer_tokens  # The top FAQ is always kept
+        answer = trim_text(faq['answer'], remaining)
+        trimmed += answer != faq['answer']
+        block = faq_block(faq, answer)
+        blocks.append(block)
+        used += estimate_tokens(block) + 1  # + the blank line between blocks
+    stats = {
+        'context_tokens': used,
+        'faqs': len(blocks),
+        'trimmed': trimmed,
+        'dropped': len(retrieved) - len(blocks),
+    }
+    return "\n\n".join(blocks), stats
+
+def completion_budget(context_tokens, answer_language=None):
+    """max_tokens for the completion: an answer rephrases the context, so it scales with it."""
+    tokens = PROMPT_MIN_COMPLETION_TOKENS + int(context_tokens * PROMPT_COMPLETION_RATIO)
+    if answer_language and answer_language != 'en':
+        tokens *= NON_ENGLISH_COMPLETION_FACTOR
+    return min(tokens, MAX_TOKENS)
+
+def build_prompt(user_query, retrieved, top_k=TOP_K_RETRIEVAL, answer_language=None, budget=PROMPT_CONTEXT_TOKENS):
+    """
+    Chat prompt for one query.
+
+    Returns:
+        dict: 'system' and 'user' messages, 'max_tokens' for the completion,
+        estimated 'prompt_tokens', and the fit_context stats
+    """
+    context, stats = fit_context(retrieved[:top_k], budget=budget)
+    language_instruction = ''
+    if answer_language and answer_language != 'en':
+        language_instruction = f"Answer in {language_name(answer_language)}.\n"
+    user = (
+        f"Relevant FAQs (top {stats['faqs']}):\n{context}\n\n"
+        f"{language_instruction}"
+        f"User question: {user_query}"
+    )
+    return dict(
+        stats,
+        system=SYSTEM_PROMPT,
+        user=user,
+        max_tokens=completion_budget(stats['context_tokens'], answer_language),
+        prompt_tokens=estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(user),
+    )
+
+def render_prompt(prompt):
+    """Readable text of a prompt, e.g. for the app's "thinking process" section."""
+    return f"[system]\n{prompt['system']}\n\n[user]\n{prompt['user']}"
@@ -1,9 +1,30 @@
 import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import faiss
-from sentence_transformers import SentenceTransformer
-from .together_inference import query_together_llm
-from .config import TOP_K_RETRIEVAL, TOP_K_RELATED
+from . import metrics
+from .together_inference import DeadlineExceeded, stream_together_llm_with_system_prompt
+from .llm_providers import get_llm
+from .config import (
+    TOP_K_RETRIEVAL, TOP_K_RELATED, ANSWER_CACHE_ENABLED, RETRIEVAL_MODE, MULTILINGUAL_MODEL_NAME,
+    MULTILINGUAL_INDEX_PATH, MULTILINGUAL_EMBEDDINGS_PATH, MULTILINGUAL_RELATED_GRAPH_PATH,
+    DIRECT_ANSWER_ENABLED, DIRECT_ANSWER_THRESHOLD, DIRECT_ANSWER_MARGIN, DIRECT_ANSWER_UPGRADE,
+    DIRECT_ANSWER_UPGRADE_WORKERS, DIRECT_ANSWER_CALIBRATION_PATH, ENCODER_BACKEND,
+    QUERY_EMBEDDING_CACHE_SIZE, RAG_DEADLINE, INDEX_MMAP, ENCODER_SERVICE
+)
+from .answer_cache import SemanticAnswerCache, cache_path_for_index, index_fingerprint
+from .index_factory import (
+    load_index_meta, index_meta as build_index_meta, apply_search_params, normalize, ids_path, id_lookup,
+    ids_to_positions, read_index, id_selector, filtered_search
+)
+from .related_graph import RELATED_GRAPH_PATH, question_key, corpus_fingerprint, select_related, load_related_graph
+from .partitions import PARTITIONS_PATH, partition_key, build_partitions, load_partitions
+from .corpus_store import CORPUS_PATH, load_faq_json, load_columnar_corpus
+from .encoders import CachedEncoder, load_encoder, backend_embeddings_path
+from .encoder_service import RemoteEncoder
+from .prompt_builder import build_prompt, render_prompt
 import re
 
 MODEL_NAME = 'all-MiniLM-L6-v2'
@@ -11,182 +32,865 @@ DATA_PATH = 'data/jupiter_faqs_clean.json'
 INDEX_PATH = 'models/faq_faiss.index'
 EMBEDDINGS_PATH = 'models/faq_embeddings.npy'
 
-def flatten_faqs(faqs):
-    flat = []
-    def recurse(obj, category=None, subcategory=None):
-        if isinstance(obj, list):
-            for item in obj:
-                if isinstance(item, dict) and 'question' in item and 'answer' in item:
-                    flat.append({
-                        'question': item['question'],
-                        'answer': item['answer'],
-                        'category': category,
-                        'subcategory': subcategory
-                    })
-        elif isinstance(obj, dict):
-            for k, v in obj.items():
-                if category is None:
-                    recurse(v, category=k, subcategory=None)
-                else:
-                    recurse(v, category=category, subcategory=k)
-    recurse(faqs)
-    return flat
-
-# Load data and index
-with open(DATA_PATH, 'r') as f:
-    faqs_nested = json.load(f)
-faqs = flatten_faqs(faqs_nested)
-questions = [faq['question'] for faq in faqs]
-answers = [faq['answer'] for faq in faqs]
-categories = [faq.get('category') for faq in faqs]
-subcategories = [faq.get('subcategory') for faq in faqs]
-
-index = faiss.read_index(INDEX_PATH)
-embeddings = np.load(EMBEDDINGS_PATH)
-model = SentenceTransformer(MODEL_NAME)
-
-def retrieve_faq(query, top_k=TOP_K_RETRIEVAL):
-    query_emb = model.encode([query]).astype('float32')
-    D, I = index.search(query_emb, top_k)
-    results = []
-    for idx in I[0]:
-        results.append({
-            'question': questions[idx],
-            'answer': answers[idx],
-            'category': categories[idx],
-            'subcategory': subcategories[idx],
-            'index': idx
-        })
-    return results
-
-def get_related_questions(query, exclude_idx, top_k=TOP_K_RELATED, category=None, subcategory=None):
-    query_emb = model.encode([query]).astype('float32')
-    D, I = index.search(query_emb, top_k + 10)  # Search more for deduplication/fallback
-    related = []
-    seen = set()
-    user_q_norm = re.sub(r'[^a-z0-9 ]', '', query.lower())
-    for idx in I[0]:
-        if idx == exclude_idx:
-            continue
-        q = questions[idx]
-        cat = categories[idx]
-        subcat = subcategories[idx]
-        # Never show the exact same question as the user query
-        q_norm = re.sub(r'[^a-z0-9 ]', '', q.lower())
-        if q_norm == user_q_norm:
-            continue
-        # Only show from same category/subcategory if specified
-        if category and cat != category:
-            continue
-        if subcategory and subcat != subcategory:
-            continue
-        # Deduplicate by question text
-        if q_norm in seen:
-            continue
-        seen.add(q_norm)
-        related.append({
-            'question': q,
-            'category': cat,
-            'subcategory': subcat
-        })
-        if len(related) >= top_k:
-            break
-    # Fallback: if not enough, fill from any category
-    if len(related) < top_k:
-        for idx in I[0]:
-            if idx == exclude_idx:
-                continue
-            q = questions[idx]
-            q_norm = re.sub(r'[^a-z0-9 ]', '', q.lower())
-            if q_norm == user_q_norm or q_norm in seen:
-                continue
-            cat = categories[idx]
-            subcat = subcategories[idx]
-            related.append({
-                'question': q,
-                'category': cat,
-                'subcategory': subcat
+RELATED_SEARCH_MARGIN = 10  # Search more for deduplication/fallback
+
+def corpus_from_faqs(faqs):
+    questions = [faq['question'] for faq in faqs]
+    corpus = {
+        'faqs': faqs,
+        'questions': questions,
+        'answers': [faq['answer'] for faq in faqs],
+        'categories': [faq.get('category') for faq in faqs],
+        'subcategories': [faq.get('subcategory') for faq in faqs],
+        # Normalised once here instead of per candidate per request
+        'question_keys': [question_key(q) for q in questions],
+    }
+    corpus['fingerprint'] = corpus_fingerprint(corpus['question_keys'], corpus['categories'], corpus['subcategories'])
+    return corpus
+
+class QueryContext:
+    """
+    One query embedding plus one widened FAISS search, shared by
+    retrieve_faq and get_related_questions so a query is encoded and
+    searched only once.
+    """
+    def __init__(self, query, embedding, distances, indices):
+        self.query = query
+        self.embedding = embedding
+        # FAISS pads with -1 when fewer than k vectors exist
+        keep = indices >= 0
+        self.distances = distances[keep]
+        self.indices = indices[keep]
+
+def search_width(top_k=TOP_K_RETRIEVAL, related_k=TOP_K_RELATED):
+    # Wide enough for retrieval and for the related-question candidates
+    return max(top_k, related_k + RELATED_SEARCH_MARGIN)
+
+class FAQPipeline:
+    """
+    Holds the FAQ corpus, FAISS index and embedding model.
+
+    Nothing is loaded on construction; each component is loaded the first
+    time it is used and its load time is recorded in `load_times`. Call
+    `warmup()` to load everything up front and run a dummy encode + search.
+
+    With `direct_answers` on, queries whose top FAQ clears `direct_threshold`
+    cosine similarity with at least `direct_margin` over the next distinct
+    question get the stored answer without an LLM call; `upgrade_direct`
+    also rephrases it with the LLM in the background for later hits.
+
+    Queries are encoded by `encoder_backend` (see models.encoders) behind an
+    LRU of `query_cache_size` normalised queries, so repeated questions skip
+    the encoder entirely. With `encoder_service` (a socket path) they are
+    encoded by a shared models.encoder_service process instead, and with
+    `index_mmap` the index is memory-mapped read-only, so worker processes
+    on one host share a single copy of the model and of the index.
+
+    With a `deadline` (seconds, per answer), a query whose LLM call has not
+    returned in time gets the top retrieved FAQ answer instead, flagged
+    'degraded'. LLM calls go through llm_providers.get_llm(), which can hedge
+    across providers.
+    """
+    def __init__(self, data_path=DATA_PATH, index_path=INDEX_PATH,
+                 embeddings_path=EMBEDDINGS_PATH, model_name=MODEL_NAME, answer_cache=None,
+                 related_graph_path=RELATED_GRAPH_PATH, direct_answers=DIRECT_ANSWER_ENABLED,
+                 direct_threshold=None, direct_margin=None, upgrade_direct=DIRECT_ANSWER_UPGRADE,
+                 partitions_path=PARTITIONS_PATH, corpus_path=CORPUS_PATH, encoder_backend=ENCODER_BACKEND,
+                 query_cache_size=QUERY_EMBEDDING_CACHE_SIZE, deadline=RAG_DEADLINE, index_mmap=INDEX_MMAP,
+                 encoder_service=ENCODER_SERVICE):
+        self.data_path = data_path
+        self.corpus_path = corpus_path
+        self.related_graph_path = related_graph_path
+        self.partitions_path = partitions_path
+        self.index_path = index_path
+        self.embeddings_path = embeddings_path
+        self.model_name = model_name
+        self.encoder_backend = encoder_backend
+        self.query_cache_size = query_cache_size
+        self.index_mmap = index_mmap
+        self.encoder_service = encoder_service
+        self.deadline = deadline
+        # answer_cache=False disables caching regardless of ANSWER_CACHE_ENABLED
+        if answer_cache is None and ANSWER_CACHE_ENABLED:
+            answer_cache = SemanticAnswerCache(path=cache_path_for_index(index_path))
+        # Not `answer_cache or None`: an empty cache has len() 0
+        self.answer_cache = answer_cache if answer_cache is not False else None
+        calibration = load_direct_answer_calibration(model_name)
+        self.direct_answers = direct_answers
+        self.direct_threshold = direct_threshold if direct_threshold is not None else calibration.get('threshold', DIRECT_ANSWER_THRESHOLD)
+        self.direct_margin = direct_margin if direct_margin is not None else calibration.get('margin', DIRECT_ANSWER_MARGIN)
+        self.upgrade_direct = upgrade_direct
+        self.answer_sources = {'llm': 0, 'cache': 0, 'faq': 0, 'degraded': 0}
+        self._upgrade_executor = None
+        self._upgrading = set()
+        self._partition_selectors = {}
+        self.index_version = None
+        self.index_meta = None
+        self._row_ids = None
+        self._id_lookup = None
+        self.load_times = {}
+        self._components = {}
+        self._lock = threading.RLock()
+
+    def _get(self, name, loader):
+        component = self._components.get(name)
+        if component is not None:
+            return component
+        with self._lock:
+            if name not in self._components:
+                start = time.time()
+                self._components[name] = loader()
+                self.load_times[name] = time.time() - start
+            return self._components[name]
+
+    def is_loaded(self, name):
+        return name in self._components
+
+    def use_components(self, faqs=None, index=None, model=None, index_meta=None, related_graph=None, embeddings=None):
+        """
+        Use in-memory components instead of loading them from disk, e.g. a
+        synthetic corpus for benchmarks. `faqs` is a flat list of FAQ dicts.
+        """
+        with self._lock:
+            if faqs is not None:
+                self._components['corpus'] = corpus_from_faqs(faqs)
+                self._components['related_graph'] = related_graph if related_graph is not None else False
+                self._components.pop('partitions', None)
+            # Partition selectors hold the current index's ids
+            self._partition_selectors = {}
+            if index is not None:
+                self._components['index'] = index
+                self.index_meta = index_meta or build_index_meta('flat_l2', {})
+                self._row_ids = None
+                self._id_lookup = None
+            if model is not None:
+                self._components['model'] = model
+            if embeddings is not None:
+                self._components['embeddings'] = embeddings
+        return self
+
+    def _load_corpus(self):
+        # The memory-mapped columnar artifact when it is up to date with the JSON, else the JSON
+        corpus = None
+        if self.corpus_path:
+            corpus = load_columnar_corpus(self.corpus_path, source_path=self.data_path)
+        if corpus is None:
+            corpus = corpus_from_faqs(load_faq_json(self.data_path))
+        return corpus
+
+    def _load_index(self):
+        self.index_version = index_fingerprint(self.index_path)
+        if self.answer_cache is not None:
+            # Cached answers are only valid for the index they were produced with
+            self.answer_cache.bind_index(self.index_version)
+        # Index type, normalisation and nprobe/efSearch recorded at build time
+        self.index_meta = load_index_meta(self.index_path)
+        index = read_index(self.index_path, mmap=self.index_mmap)
+        apply_search_params(index, self.index_meta.get('params', {}))
+        if self.index_meta.get('id_mapped'):
+            # Search returns stable content ids; keep a sorted id -> corpus row lookup
+            self._row_ids = np.load(ids_path(self.index_path))
+            self._id_lookup = id_lookup(self._row_ids)
+        return index
+
+    def _to_positions(self, I):
+        if self._id_lookup is None:
+            return I
+        return ids_to_positions(I, self._id_lookup)
+
+    def _load_model(self):
+        if self.encoder_service:
+            encoder = RemoteEncoder(self.encoder_service, model_name=self.model_name, backend=self.encoder_backend)
+        else:
+            encoder = load_encoder(self.model_name, self.encoder_backend)
+        if self.query_cache_size:
+            encoder = CachedEncoder(encoder, self.query_cache_size)
+        return encoder
+
+    def _load_related_graph(self):
+        # False (not None) marks a missing/stale artifact so it is not retried
+        corpus = self.corpus
+        fingerprint = corpus['fingerprint']
+        graph = load_related_graph(fingerprint, self.related_graph_path)
+        return graph if graph is not None else False
+
+    def _load_partitions(self):
+        corpus = self.corpus
+        fingerprint = corpus['fingerprint']
+        partitions = load_partitions(fingerprint, self.partitions_path)
+        if partitions is None:
+            # Cheap to derive; the saved artifact only saves the pass over the corpus
+            partitions = build_partitions(corpus['categories'], corpus['subcategories'])
+        return partitions
+
+    def _load_embeddings(self):
+        # The store built with this pipeline's backend, if any; the torch vectors otherwise
+        path = backend_embeddings_path(self.embeddings_path, self.encoder_backend)
+        if not os.path.exists(path):
+            path = self.embeddings_path
+        # Memory-mapped: the direct-answer check reads two rows per query
+        return np.load(path, mmap_mode='r')
+
+    @property
+    def corpus(self):
+        return self._get('corpus', self._load_corpus)
+
+    @property
+    def faqs(self):
+        return self.corpus['faqs']
+
+    @property
+    def questions(self):
+        return self.corpus['questions']
+
+    @property
+    def answers(self):
+        return self.corpus['answers']
+
+    @property
+    def categories(self):
+        return self.corpus['categories']
+
+    @property
+    def subcategories(self):
+        return self.corpus['subcategories']
+
+    @property
+    def question_keys(self):
+        return self.corpus['question_keys']
+
+    @property
+    def related_graph(self):
+        graph = self._get('related_graph', self._load_related_graph)
+        return graph if graph is not False else None
+
+    @property
+    def partitions(self):
+        return self._get('partitions', self._load_partitions)
+
+    @property
+    def index(self):
+        return self._get('index', self._load_index)
+
+    @property
+    def model(self):
+        return self._get('model', self._load_model)
+
+    @property
+    def embeddings(self):
+        return self._get('embeddings', self._load_embeddings)
+
+    def warmup(self):
+        """Load corpus, index and model, then run one dummy encode + search."""
+        self.corpus
+        self.related_graph
+        self.index
+        self.model
+        start = time.time()
+        self.build_query_context("warmup")
+        self.load_times['warmup_query'] = time.time() - start
+        return dict(self.load_times)
+
+    def embed_queries(self, queries):
+        """Query embeddings in the index's space (normalised for cosine indexes)."""
+        self._get('index', self._load_index)  # index_meta decides normalisation
+        with metrics.stage('encode'):
+            query_embs = self.model.encode(list(queries)).astype('float32')
+        if self.index_meta.get('normalize'):
+            query_embs = normalize(query_embs)
+        return query_embs
+
+    def build_query_contexts(self, queries, k=None):
+        """Encode a batch of queries in one call and search them in one call."""
+        queries = list(queries)
+        k = min(k or search_width(), self.index.ntotal)
+        query_embs = self.embed_queries(queries)
+        with metrics.stage('search'):
+            D, I = self.index.search(query_embs, k)
+            I = self._to_positions(I)
+        return [QueryContext(q, query_embs[i], D[i], I[i]) for i, q in enumerate(queries)]
+
+    def build_query_context(self, query, k=None):
+        return self.build_query_contexts([query], k=k)[0]
+
+    def search_width(self, top_k=TOP_K_RETRIEVAL):
+        """Neighbours to fetch per query so retrieval and related questions share one search."""
+        # With a fresh related-question table only the retrieval hits are needed
+        if self.related_graph is not None:
+            return top_k
+        return search_width(top_k)
+
+    def _ensure_context(self, query, ctx, k):
+        # Reuse the shared search if it is wide enough, otherwise search again
+        if ctx is None or (len(ctx.indices) < k and len(ctx.indices) < self.index.ntotal):
+            ctx = self.build_query_context(query, k=max(k, search_width()))
+        return ctx
+
+    def _partition_selector(self, key):
+        """(FAISS id selector, corpus rows) for a partition, or None if it does not exist."""
+        partition = self._partition_selectors.get(key)
+        if partition is not None:
+            return partition
+        rows = self.partitions.get(key)
+        if rows is None:
+            return None
+        self._get('index', self._load_index)  # Decides whether the index holds rows or content ids
+        ids = rows if self._row_ids is None else self._row_ids[rows]
+        with self._lock:
+            partition = self._partition_selectors.setdefault(key, (id_selector(ids), rows))
+        return partition
+
+    def _exact_partition_search(self, embedding, k, rows):
+        # Brute force over the partition's stored vectors, read from the shared memory map
+        vectors = np.asarray(self.embeddings[rows], dtype='float32')
+        if self.index_meta.get('normalize'):
+            scores = -(normalize(vectors) @ embedding)
+        else:
+            scores = ((vectors - embedding) ** 2).sum(axis=1)
+        return rows[np.argsort(scores, kind='stable')[:k]]
+
+    def search_partition(self, embedding, k, category, subcategory=None):
+        """Corpus rows of the k nearest FAQs within a category (and subcategory), nearest first."""
+        partition = self._partition_selector(partition_key(category, subcategory))
+        if partition is None:
+            return np.empty(0, dtype='int64')
+        selector, rows = partition
+        k = min(k, len(rows))
+        embedding = np.asarray(embedding, dtype='float32')
+        with metrics.stage('partition_search'):
+            _, I = filtered_search(self.index, embedding[None, :], k, selector)
+            hits = self._to_positions(I)[0]
+            hits = hits[hits >= 0]
+            if len(hits) < k:
+                # IVF probes and HNSW walks can miss most of a small partition; scan it instead
+                hits = self._exact_partition_search(embedding, k, rows)
+        return hits
+
+    def retrieve_faq(self, query, top_k=TOP_K_RETRIEVAL, ctx=None, category=None, subcategory=None):
+        """
+        Top FAQs for a query. With `category` (and optionally `subcategory`)
+        the index search is restricted to that partition, so all top_k come
+        from it.
+        """
+        if category:
+            embedding = ctx.embedding if ctx is not None else self.embed_queries([query])[0]
+            hits = self.search_partition(embedding, top_k, category, subcategory)
+        else:
+            ctx = self._ensure_context(query, ctx, top_k)
+            hits = ctx.indices[:top_k]
+        questions, answers = self.questions, self.answers
+        categories, subcategories = self.categories, self.subcategories
+        results = []
+        for idx in hits:
+            results.append({
+                'question': questions[idx],
+                'answer': answers[idx],
+                'category': categories[idx],
+                'subcategory': subcategories[idx],
+                'index': idx
             })
-            seen.add(q_norm)
-            if len(related) >= top_k:
+        return results
+
+    def get_related_questions(self, query, exclude_idx, top_k=TOP_K_RELATED, category=None, subcategory=None, ctx=None):
+        question_keys, categories, subcategories = self.question_keys, self.categories, self.subcategories
+        user_q_norm = question_key(query)
+        graph = self.related_graph
+        related = None
+        # Precomputed neighbours of the matched FAQ, when they were built for the same filter
+        if (graph is not None and exclude_idx is not None and graph.shape[1] >= top_k
+                and category == categories[exclude_idx] and subcategory == subcategories[exclude_idx]):
+            related = [int(i) for i in graph[exclude_idx] if i >= 0 and question_keys[i] != user_q_norm][:top_k]
+            if len(related) < top_k:
+                related = None
+        if related is None:
+            # Live search fallback: the matching partition first, then unfiltered hits to fill up
+            ctx = self._ensure_context(query, ctx, top_k + RELATED_SEARCH_MARGIN)
+            candidates = list(ctx.indices[:top_k + RELATED_SEARCH_MARGIN])
+            if category:
+                in_partition = self.search_partition(ctx.embedding, top_k + RELATED_SEARCH_MARGIN, category, subcategory)
+                candidates = list(in_partition) + candidates
+            related = select_related(candidates, exclude_idx, user_q_norm, top_k, question_keys,
+                                     categories, subcategories, category=category, subcategory=subcategory)
+        questions = self.questions
+        return [
+            {'question': questions[idx], 'category': categories[idx], 'subcategory': subcategories[idx]}
+            for idx in related
+        ]
+
+    def direct_answer_scores(self, ctx):
+        """
+        (similarity, margin, row) for the top hit: cosine similarity between
+        the query and the top FAQ question, and its gap to the next distinct
+        question. Computed from the stored embeddings so it means the same
+        thing for every index type.
+        """
+        question_keys = self.question_keys
+        rows, seen = [], set()
+        for idx in ctx.indices:
+            if question_keys[idx] in seen:
+                continue
+            seen.add(question_keys[idx])
+            rows.append(int(idx))
+            if len(rows) == 2:
                 break
-    return related
+        if not rows:
+            return 0.0, 0.0, None
+        vectors = normalize(np.asarray(self.embeddings[rows], dtype='float32'))
+        sims = vectors @ normalize(ctx.embedding[None, :])[0]
+        margin = float(sims[0] - sims[1]) if len(sims) > 1 else float(sims[0])
+        return float(sims[0]), margin, rows[0]
+
+    def _direct_answer(self, user_query, ctx, retrieved, prompt, answer_language):
+        # Stored answers are English, so other answer languages always go to the LLM
+        if not self.direct_answers or not retrieved or answer_language not in (None, 'en'):
+            return None
+        similarity, margin, row = self.direct_answer_scores(ctx)
+        if row is None or similarity < self.direct_threshold or margin < self.direct_margin:
+            return None
+        direct = {
+            'source': 'faq',
+            'llm_response': render_direct_answer(retrieved[0]),
+            'raw_llm_response': None,
+            'similarity': similarity,
+            'margin': margin,
+            'upgrade': None,
+        }
+        if self.upgrade_direct:
+            direct['upgrade'] = self._schedule_upgrade(user_query, ctx, retrieved, prompt, answer_language)
+        return direct
+
+    def _schedule_upgrade(self, user_query, ctx, retrieved, prompt, answer_language):
+        """
+        Rephrase a direct answer with the LLM in the background and store it
+        in the answer cache, so later paraphrases get the LLM answer. Returns
+        a Future of the upgraded answer, or None if one is already running.
+        """
+        faq_indices = tuple(int(r['index']) for r in retrieved)
+        with self._lock:
+            if faq_indices in self._upgrading:
+                return None
+            self._upgrading.add(faq_indices)
+            if self._upgrade_executor is None:
+                self._upgrade_executor = ThreadPoolExecutor(max_workers=DIRECT_ANSWER_UPGRADE_WORKERS,
+                                                            thread_name_prefix='direct-upgrade')
+        def upgrade():
+            try:
+                llm_response = complete_prompt(prompt)
+                final_answer = extract_final_answer(llm_response)
+                if self.answer_cache is not None:
+                    self.answer_cache.store(ctx.embedding, faq_indices, final_answer, llm_response,
+                                            query=user_query, language=answer_language)
+                return final_answer
+            finally:
+                with self._lock:
+                    self._upgrading.discard(faq_indices)
+        return self._upgrade_executor.submit(upgrade)
+
+    def _degraded_answer(self, retrieved, reason):
+        # Same shape as a cache hit, so it skips the answer cache store
+        metrics.inc('degraded_answers')
+        return {
+            'source': 'degraded',
+            'llm_response': render_direct_answer(retrieved[0]),
+            'raw_llm_response': None,
+            'reason': reason,
+        }
+
+    def _deadline_for(self, deadline):
+        seconds = self.deadline if deadline is None else deadline
+        return time.monotonic() + seconds if seconds else None
+
+    def answer_stats(self):
+        """
+        How answers were produced so far: 'llm', 'cache' (answer cache),
+        'faq' (direct answer) or 'degraded' (LLM missed the deadline).
+        """
+        with self._lock:
+            stats = dict(self.answer_sources)
+        total = sum(stats.values())
+        stats['direct_rate'] = stats['faq'] / total if total else 0.0
+        return stats
+
+    def _prepare_answer(self, user_query, ctx, top_k=TOP_K_RETRIEVAL, answer_language=None):
+        # Retrieve top_k FAQs from the shared search
+        with metrics.stage('retrieve'):
+            retrieved = self.retrieve_faq(user_query, top_k=top_k, ctx=ctx)
+            retrieved = group_similar_faqs(retrieved)
+        with metrics.stage('prompt'):
+            prompt = build_prompt(user_query, retrieved, top_k=top_k, answer_language=answer_language)
+        faq_indices = [r['index'] for r in retrieved]
+        cached = None
+        if self.answer_cache is not None:
+            with metrics.stage('cache_lookup'):
+                cached = self.answer_cache.lookup(ctx.embedding, faq_indices, language=answer_language)
+            metrics.inc('answer_cache_hits' if cached is not None else 'answer_cache_misses')
+            if cached is not None:
+                cached['source'] = 'cache'
+        # An earlier LLM answer wins over the stored FAQ answer; both skip the LLM call
+        if cached is None:
+            with metrics.stage('direct_check'):
+                cached = self._direct_answer(user_query, ctx, retrieved, prompt, answer_language)
+            if cached is not None:
+                metrics.inc('direct_answers')
+        return retrieved, prompt, cached
+
+    def _finish_answer(self, user_query, ctx, retrieved, prompt, llm_response, final_answer, cached, return_prompt=False,
+                       answer_language=None):
+        if cached is None and self.answer_cache is not None:
+            faq_indices = [r['index'] for r in retrieved]
+            self.answer_cache.store(ctx.embedding, faq_indices, final_answer, llm_response, query=user_query,
+                                    language=answer_language)
+        # Use category/subcategory of top FAQ for related questions
+        top_cat = retrieved[0]['category'] if retrieved else None
+        top_subcat = retrieved[0]['subcategory'] if retrieved else None
+        with metrics.stage('related'):
+            related = self.get_related_questions(user_query, exclude_idx=retrieved[0]['index'], top_k=TOP_K_RELATED, category=top_cat, subcategory=top_subcat, ctx=ctx)
+        source = cached['source'] if cached is not None else 'llm'
+        with self._lock:
+            self.answer_sources[source] += 1
+        # Estimated tokens sent to the LLM for this request (none for cached/direct answers)
+        prompt_tokens = prompt['prompt_tokens'] if source == 'llm' else 0
+        if prompt_tokens:
+            metrics.inc('prompt_tokens_estimated', prompt_tokens)
+        result = {
+            'retrieved_faqs': retrieved,
+            'llm_response': final_answer,
+            'related_questions': related,
+            'answer_source': source,
+            'prompt_tokens': prompt_tokens,
+        }
+        if source == 'faq':
+            result['direct_answer'] = {'similarity': cached['similarity'], 'margin': cached['margin']}
+            if cached['upgrade'] is not None:
+                # Future of the LLM-rephrased answer
+                result['upgrade'] = cached['upgrade']
+        elif source == 'degraded':
+            result['degraded'] = cached['reason']
+        if self.answer_cache is not None:
+            result['cache'] = dict(self.answer_cache.stats(), hit=source == 'cache')
+        if return_prompt:
+            result['system_prompt'] = render_prompt(prompt)
+            result['prompt_budget'] = {key: prompt[key] for key in
+                                       ('prompt_tokens', 'context_tokens', 'max_tokens', 'faqs', 'trimmed', 'dropped')}
+            result['raw_llm_response'] = llm_response
+        return result
+
+    def _answer_from_context(self, user_query, ctx, return_prompt=False, top_k=TOP_K_RETRIEVAL, answer_language=None,
+                             deadline=None):
+        # `deadline` is a time.monotonic() value here
+        retrieved, prompt, cached = self._prepare_answer(user_query, ctx, top_k=top_k, answer_language=answer_language)
+        provider = None
+        if cached is None:
+            try:
+                with metrics.stage('llm'):
+                    llm_response, provider = get_llm().complete(prompt, deadline=deadline)
+            except DeadlineExceeded:
+                cached = self._degraded_answer(retrieved, 'deadline')
+            except Exception:
+                # Without a deadline the caller gets the error, as before
+                if deadline is None:
+                    raise
+                cached = self._degraded_answer(retrieved, 'llm_error')
+            else:
+                with metrics.stage('extract'):
+                    final_answer = extract_final_answer(llm_response)
+        if cached is not None:
+            llm_response = cached['raw_llm_response'] or cached['llm_response']
+            final_answer = cached['llm_response']
+        result = self._finish_answer(user_query, ctx, retrieved, prompt, llm_response, final_answer, cached,
+                                     return_prompt=return_prompt, answer_language=answer_language)
+        if provider is not None:
+            result['llm_provider'] = provider
+        return result
+
+    def rag_answer(self, user_query, return_prompt=False, top_k=TOP_K_RETRIEVAL, answer_language=None, deadline=None):
+        """
+        Answer one query. `answer_language` (an ISO code such as 'hi') asks
+        the LLM to reply in that language instead of English. With metrics enabled (RAG_METRICS_ENABLED or
+        metrics.enable()) the result also carries a 'metrics' dict of stage
+        timings, token counts, retries and cache hits for this request.
+
+        `deadline` is an end-to-end budget in seconds (default: the
+        pipeline's). If it runs out before the LLM answers, the top FAQ
+        answer is returned with answer_source 'degraded' and result['degraded']
+        set to 'deadline' (or 'llm_error' if every provider failed).
+        """
+        deadline = self._deadline_for(deadline)
+        with metrics.trace_request('rag_answer') as trace:
+            ctx = self.build_query_context(user_query, k=self.search_width(top_k))
+            result = self._answer_from_context(user_query, ctx, return_prompt=return_prompt, top_k=top_k,
+                                               answer_language=answer_language, deadline=deadline)
+            if trace is not None:
+                result['metrics'] = trace.as_dict()
+        return result
+
+    def rag_answer_stream(self, user_query, return_prompt=False, top_k=TOP_K_RETRIEVAL, answer_language=None,
+                          deadline=None):
+        """
+        Generator variant of rag_answer.
+
+        Yields {'type': 'token', 'text': ...} events with the answer text as
+        the LLM streams it (the "FINAL ANSWER:" preamble is held back), then
+        one {'type': 'result', 'result': ...} event with the same dict
+        rag_answer returns. The result's 'llm_response' is re-extracted from
+        the full completion, so it can differ slightly from the streamed text.
+        result['timing'] holds time_to_first_token and total_time in seconds.
+
+        Streams always go to Together (no hedging). `deadline` bounds the wait
+        for the stream to start: if it passes, or the call fails, before any
+        text was shown, the degraded FAQ answer is yielded instead.
+        """
+        start = time.time()
+        deadline = self._deadline_for(deadline)
+        # The trace is only made current while this generator runs, never across a yield
+        trace = metrics.start_trace('rag_answer_stream')
+        with metrics.activate(trace):
+            ctx = self.build_query_context(user_query, k=self.search_width(top_k))
+            retrieved, prompt, cached = self._prepare_answer(user_query, ctx, top_k=top_k, answer_language=answer_language)
+        first_token_at = None
+        if cached is not None:
+            llm_response = cached['raw_llm_response'] or cached['llm_response']
+            final_answer = cached['llm_response']
+            first_token_at = time.time()
+            yield {'type': 'token', 'text': final_answer}
+        else:
+            llm_start = time.time()
+            extractor = FinalAnswerStream()
+            try:
+                for delta in metrics.iterate_in(trace, stream_prompt(prompt, deadline=deadline)):
+                    text = extractor.feed(delta)
+                    if text:
+                        if first_token_at is None:
+                            first_token_at = time.time()
+                        yield {'type': 'token', 'text': text}
+                text = extractor.finish()
+                if text:
+                    if first_token_at is None:
+                        first_token_at = time.time()
+                    yield {'type': 'token', 'text': text}
+            except Exception as e:
+                # Text already shown cannot be taken back; without a deadline the caller gets the error
+                if first_token_at is not None or deadline is None:
+                    raise
+                with metrics.activate(trace):
+                    cached = self._degraded_answer(retrieved, 'deadline' if isinstance(e, DeadlineExceeded) else 'llm_error')
+            if cached is not None:
+                llm_response = final_answer = cached['llm_response']
+                first_token_at = time.time()
+                yield {'type': 'token', 'text': final_answer}
+            if trace is not None:
+                trace.add_time('llm', time.time() - llm_start)
+            if cached is None:
+                llm_response = extractor.raw
+                with metrics.activate(trace), metrics.stage('extract'):
+                    final_answer = extract_final_answer(llm_response)
+        with metrics.activate(trace):
+            result = self._finish_answer(user_query, ctx, retrieved, prompt, llm_response, final_answer, cached,
+                                         return_prompt=return_prompt, answer_language=answer_language)
+        end = time.time()
+        result['timing'] = {
+            'time_to_first_token': (first_token_at or end) - start,
+            'total_time': end - start,
+        }
+        if trace is not None:
+            trace.flags['time_to_first_token_ms'] = 1000 * result['timing']['time_to_first_token']
+            metrics.finish_trace(trace)
+            metrics.registry.observe('rag_time_to_first_token_seconds', result['timing']['time_to_first_token'])
+            result['metrics'] = trace.as_dict()
+        yield {'type': 'result', 'result': result}
+
+    def rag_answer_batch(self, queries, return_prompt=False, top_k=TOP_K_RETRIEVAL, answer_language=None, deadline=None):
+        """
+        Answer several queries with one encode call and one index.search call.
+        LLM calls are still made one per query, each with its own `deadline`.
+        """
+        with metrics.trace_request('rag_answer_batch'):
+            contexts = self.build_query_contexts(queries, k=self.search_width(top_k))
+        return [
+            self.answer_with_context(ctx, return_prompt=return_prompt, top_k=top_k, answer_language=answer_language,
+                                     deadline=deadline)
+            for ctx in contexts
+        ]
+
+    def answer_with_context(self, ctx, return_prompt=False, top_k=TOP_K_RETRIEVAL, answer_language=None, deadline=None):
+        """
+        rag_answer for a query that was already encoded and searched (see
+        build_query_contexts); `deadline` counts from this call.
+        """
+        deadline = self._deadline_for(deadline)
+        with metrics.trace_request('rag_answer') as trace:
+            result = self._answer_from_context(ctx.query, ctx, return_prompt=return_prompt, top_k=top_k,
+                                               answer_language=answer_language, deadline=deadline)
+            if trace is not None:
+                result['metrics'] = trace.as_dict()
+        return result
+
+_pipelines = {}
+_pipelines_lock = threading.Lock()
+
+def pipeline_kwargs(mode=None):
+    """FAQPipeline arguments for a retrieval mode ('translate' or 'multilingual', default RETRIEVAL_MODE)."""
+    mode = mode or RETRIEVAL_MODE
+    if mode not in ('translate', 'multilingual'):
+        raise ValueError(f"Unknown retrieval mode {mode!r}")
+    if mode == 'multilingual':
+        return {'index_path': MULTILINGUAL_INDEX_PATH, 'embeddings_path': MULTILINGUAL_EMBEDDINGS_PATH,
+                'model_name': MULTILINGUAL_MODEL_NAME, 'related_graph_path': MULTILINGUAL_RELATED_GRAPH_PATH}
+    return {}
+
+def get_pipeline(mode=None):
+    """
+    Return the process-wide shared FAQPipeline for a retrieval mode
+    ('translate' or 'multilingual', default RETRIEVAL_MODE), creating it on
+    first use.
+    """
+    mode = mode or RETRIEVAL_MODE
+    kwargs = pipeline_kwargs(mode)
+    pipeline = _pipelines.get(mode)
+    if pipeline is None:
+        with _pipelines_lock:
+            pipeline = _pipelines.get(mode)
+            if pipeline is None:
+                pipeline = FAQPipeline(**kwargs)
+                _pipelines[mode] = pipeline
+    return pipeline
+
+def load_direct_answer_calibration(model_name, path=DIRECT_ANSWER_CALIBRATION_PATH):
+    """Calibrated direct-answer threshold/margin for `model_name`, or {} if there are none."""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        calibration = json.load(f)
+    if calibration.get('model_name') != model_name:
+        return {}
+    return calibration
+
+def render_direct_answer(faq):
+    # The stored answer is already written for users; only tidy whitespace
+    return re.sub(r'[ \t]+', ' ', faq['answer']).strip()
 
 def group_similar_faqs(retrieved):
     # Group FAQs with similar questions (ignoring case/punctuation)
     grouped = []
     seen = set()
     for r in retrieved:
-        key = re.sub(r'[^a-z0-9 ]', '', r['question'].lower())
+        key = question_key(r['question'])
         if key in seen:
             continue
         seen.add(key)
         grouped.append(r)
     return grouped
 
-def rag_answer(user_query, return_prompt=False, top_k=TOP_K_RETRIEVAL):
-    # Retrieve top_k FAQs
-    retrieved = retrieve_faq(user_query, top_k=top_k)
-    retrieved = group_similar_faqs(retrieved)
-    # Compose context for LLM
-    context = "\n\n".join([
-        f"Category: {r['category'] or 'General'} | Subcategory: {r['subcategory'] or '-'}\nQ: {r['question']}\nA: {r['answer']}"
-        for r in retrieved
-    ])
-    prompt = (
-        f"User question: {user_query}\n\n"
-        f"Relevant FAQs (top {top_k}):\n{context}\n\n"
-        "You are a helpful, friendly, and knowledgeable FAQ assistant for Jupiter Money. "
-        "If the answer is present in the FAQs above, use and rephrase it in a natural, step-by-step, human-like way. "
-        "Use bullet points or numbered steps for clarity when possible. "
-        "If the user asks for the meaning of a banking or financial term (e.g., KYC, NEFT, UPI), provide a clear, concise explanation based on your general knowledge. "
-        "If you are unsure or the answer is not present, say so politely and suggest contacting support (support@jupiter.money). "
-        "Always be truthful, complete, accurate, safe, fluent, and coherent.\n"
-        "Start your reply with 'FINAL ANSWER:' and output only the answer."
-    )
-    llm_response = query_together_llm(prompt)
-    # Improved extraction: look for FINAL ANSWER:, then A:/Answer:, then fallback to last paragraph
-    def extract_final_answer(llm_response):
-        matches = list(re.finditer(r'FINAL ANSWER:\s*', llm_response, re.IGNORECASE))
-        if matches:
-            if len(matches) >= 2:
-                start = matches[1].end()
-                after_final = llm_response[start:]
+def complete_prompt(prompt, deadline=None):
+    """Send a build_prompt() prompt to the LLM providers and return the completion text."""
+    return get_llm().complete(prompt, deadline=deadline)[0]
+
+def stream_prompt(prompt, deadline=None):
+    """Streaming variant of complete_prompt (Together only); yields text deltas."""
+    return stream_together_llm_with_system_prompt(prompt['system'], prompt['user'], max_tokens=prompt['max_tokens'],
+                                                  deadline=deadline)
+
+# Improved extraction: look for FINAL ANSWER:, then A:/Answer:, then fallback to last paragraph
+def extract_final_answer(llm_response):
+    matches = list(re.finditer(r'FINAL ANSWER:\s*', llm_response, re.IGNORECASE))
+    if matches:
+        if len(matches) >= 2:
+            start = matches[1].end()
+            after_final = llm_response[start:]
+        else:
+            start = matches[0].end()
+            after_final = llm_response[start:]
+            a_match = re.search(r'(A:|Answer:|ANSWER:)\s*', after_final, re.IGNORECASE)
+            if a_match:
+                return after_final[a_match.end():].strip()
+            if after_final.strip().startswith(".'"):
+                return after_final.strip()[2:].strip()
+        cleaned = re.sub(r"^[\s\.'\"-]+", "", after_final)
+        return cleaned.strip()
+    matches = list(re.finditer(r'(?i)\b(A:|Answer:|ANSWER:)\s*', llm_response))
+    if matches:
+        last_match = matches[-1].end()
+        return llm_response[last_match:].strip()
+    paras = [p.strip() for p in llm_response.split('\n') if p.strip()]
+    if paras:
+        return paras[-1]
+    return llm_response.strip()
+
+class FinalAnswerStream:
+    """
+    Incremental counterpart of extract_final_answer for streamed completions.
+
+    Text is held back until the 'FINAL ANSWER:' marker has been seen, then
+    everything after it is passed through. If no marker shows up within
+    `max_preamble` characters the raw text is passed through instead, and
+    finish() releases a shorter reply that never had one.
+    """
+    MARKER = re.compile(r'FINAL ANSWER:\s*', re.IGNORECASE)
+    LEADING = " \t\r\n.'\"-"
+
+    def __init__(self, max_preamble=200):
+        self.max_preamble = max_preamble
+        self.raw = ''
+        self._pos = None
+        self._emitted = False
+
+    def feed(self, delta):
+        self.raw += delta
+        if self._pos is None:
+            match = self.MARKER.search(self.raw)
+            if match:
+                self._pos = match.end()
+            elif len(self.raw) > self.max_preamble:
+                self._pos = 0
             else:
-                start = matches[0].end()
-                after_final = llm_response[start:]
-                a_match = re.search(r'(A:|Answer:|ANSWER:)\s*', after_final, re.IGNORECASE)
-                if a_match:
-                    return after_final[a_match.end():].strip()
-                if after_final.strip().startswith(".'"):
-                    return after_final.strip()[2:].strip()
-            cleaned = re.sub(r"^[\s\.'\"-]+", "", after_final)
-            return cleaned.strip()
-        matches = list(re.finditer(r'(?i)\b(A:|Answer:|ANSWER:)\s*', llm_response))
-        if matches:
-            last_match = matches[-1].end()
-            return llm_response[last_match:].strip()
-        paras = [p.strip() for p in llm_response.split('\n') if p.strip()]
-        if paras:
-            return paras[-1]
-        return llm_response.strip()
-    final_answer = extract_final_answer(llm_response)
-    # Use category/subcategory of top FAQ for related questions
-    top_cat = retrieved[0]['category'] if retrieved else None
-    top_subcat = retrieved[0]['subcategory'] if retrieved else None
-    result = {
-        'retrieved_faqs': retrieved,
-        'llm_response': final_answer,
-        'related_questions': get_related_questions(user_query, exclude_idx=retrieved[0]['index'], top_k=TOP_K_RELATED, category=top_cat, subcategory=top_subcat)
-    }
-    if return_prompt:
-        result['system_prompt'] = prompt
-        result['raw_llm_response'] = llm_response
-    return result
+                return ''
+        if not self._emitted:
+            # Same leading-punctuation cleanup as extract_final_answer
+            while self._pos < len(self.raw) and self.raw[self._pos] in self.LEADING:
+                self._pos += 1
+        text = self.raw[self._pos:]
+        self._pos = len(self.raw)
+        if text:
+            self._emitted = True
+        return text
+
+    def finish(self):
+        """Whatever is still held back once the stream has ended (a short reply without the marker)."""
+        if self._pos is None:
+            self._pos = 0
+        return self.feed('')
+
+# Module-level API, backed by the shared pipeline
+def build_query_contexts(queries, k=None):
+    return get_pipeline().build_query_contexts(queries, k=k)
+
+def build_query_context(query, k=None):
+    return get_pipeline().build_query_context(query, k=k)
+
+def retrieve_faq(query, top_k=TOP_K_RETRIEVAL, ctx=None, category=None, subcategory=None):
+    return get_pipeline().retrieve_faq(query, top_k=top_k, ctx=ctx, category=category, subcategory=subcategory)
+
+def get_related_questions(query, exclude_idx, top_k=TOP_K_RELATED, category=None, subcategory=None, ctx=None):
+    return get_pipeline().get_related_questions(query, exclude_idx, top_k=top_k, category=category, subcategory=subcategory, ctx=ctx)
+
+def rag_answer(user_query, return_prompt=False, top_k=TOP_K_RETRIEVAL, answer_language=None, deadline=None):
+    return get_pipeline().rag_answer(user_query, return_prompt=return_prompt, top_k=top_k, answer_language=answer_language,
+                                     deadline=deadline)
+
+def rag_answer_stream(user_query, return_prompt=False, top_k=TOP_K_RETRIEVAL, answer_language=None, deadline=None):
+    return get_pipeline().rag_answer_stream(user_query, return_prompt=return_prompt, top_k=top_k,
+                                            answer_language=answer_language, deadline=deadline)
+
+def rag_answer_batch(queries, return_prompt=False, top_k=TOP_K_RETRIEVAL, answer_language=None, deadline=None):
+    return get_pipeline().rag_answer_batch(queries, return_prompt=return_prompt, top_k=top_k,
+                                           answer_language=answer_language, deadline=deadline)
 
 if __name__ == "__main__":
+    pipeline = get_pipeline()
+    for name, secs in pipeline.warmup().items():
+        print(f"Loaded {name} in {secs:.2f}s")
     user_query = input("Ask a question: ")
-    result = rag_answer(user_query)
+    result = pipeline.rag_answer(user_query)
     print("\n--- Retrieved FAQs ---")
     for r in result['retrieved_faqs']:
         print(f"Category: {r['category'] or 'General'} | Subcategory: {r['subcategory'] or '-'}")
@@ -196,4 +900,4 @@ if __name__ == "__main__":
     for q in result['related_questions']:
         print(f"Category: {q['category'] or 'General'} | Subcategory: {q['subcategory'] or '-'} | Q: {q['question']}")
     print("\n--- LLM Response ---")
-    print(result['llm_response']) 
\ No newline at end of file
+    print(result['llm_response'])
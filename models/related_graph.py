@@ -0,0 +1,100 @@
+"""
+Related-question selection and the precomputed FAQ-to-FAQ neighbour table.
+
+Related questions only depend on which FAQ matched, so build_faiss_index
+precomputes them for every FAQ and saves a compact (n_faqs, width) int32
+array. At query time the pipeline looks up the row of the top retrieved FAQ
+and only falls back to a live search when the artifact is missing or stale.
+"""
+import hashlib
+import os
+import re
+import numpy as np
+
+RELATED_GRAPH_PATH = 'models/faq_related.npz'
+
+def question_key(question):
+    # Normalised form used for "same question" checks and deduplication
+    return re.sub(r'[^a-z0-9 ]', '', question.lower())
+
+def corpus_fingerprint(question_keys, categories, subcategories):
+    digest = hashlib.sha1()
+    for key, cat, subcat in zip(question_keys, categories, subcategories):
+        digest.update(f"{key}\x00{cat}\x00{subcat}\n".encode('utf8'))
+    return digest.hexdigest()
+
+def select_related(candidates, exclude_idx, user_q_norm, top_k, question_keys, categories, subcategories,
+                   category=None, subcategory=None):
+    """
+    Pick up to top_k related FAQ rows from ranked candidates: skip the
+    matched FAQ and anything equal to the user's question, prefer the given
+    category/subcategory, deduplicate by normalised question, then fill from
+    any category.
+    """
+    related = []
+    seen = set()
+    for idx in candidates:
+        if idx < 0 or idx == exclude_idx:
+            continue
+        q_norm = question_keys[idx]
+        # Never show the exact same question as the user query
+        if q_norm == user_q_norm:
+            continue
+        # Only show from same category/subcategory if specified
+        if category and categories[idx] != category:
+            continue
+        if subcategory and subcategories[idx] != subcategory:
+            continue
+        # Deduplicate by question text
+        if q_norm in seen:
+            continue
+        seen.add(q_norm)
+        related.append(int(idx))
+        if len(related) >= top_k:
+            return related
+    # Fallback: if not enough, fill from any category
+    for idx in candidates:
+        if idx < 0 or idx == exclude_idx:
+            continue
+        q_norm = question_keys[idx]
+        if q_norm == user_q_norm or q_norm in seen:
+            continue
+        seen.add(q_norm)
+        related.append(int(idx))
+        if len(related) >= top_k:
+            break
+    return related
+
+def build_related_graph(candidate_rows, question_keys, categories, subcategories, width):
+    """
+    Args:
+        candidate_rows (array): (n_faqs, n_candidates) corpus rows ranked by similarity to each FAQ
+        width (int): Related FAQs kept per row
+
+    Returns:
+        np.ndarray: (n_faqs, width) int32, padded with -1
+    """
+    graph = np.full((len(candidate_rows), width), -1, dtype='int32')
+    for i, candidates in enumerate(candidate_rows):
+        row = select_related(
+            candidates, i, question_keys[i], width, question_keys, categories, subcategories,
+            category=categories[i], subcategory=subcategories[i]
+        )
+        graph[i, :len(row)] = row
+    return graph
+
+def save_related_graph(graph, fingerprint, path=RELATED_GRAPH_PATH):
+    # Write aside and rename so a worker loading the old file never sees a partial one
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, neighbors=graph, fingerprint=np.array(fingerprint))
+    os.replace(tmp_path, path)
+
+def load_related_graph(fingerprint, path=RELATED_GRAPH_PATH):
+    """Return the neighbour table, or None if it is missing or built for a different corpus."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        if str(data['fingerprint']) != fingerprint:
+            return None
+        return data['neighbors']
@@ -1,60 +1,344 @@
-import os
+import asyncio
+import contextvars
+import functools
+import hashlib
+import random
+import threading
+import time
+import weakref
 import requests
 import json
-from .config import TOGETHER_API_KEY, TOGETHER_API_URL, DEFAULT_MODEL, MAX_TOKENS, TEMPERATURE, TOP_P
+from requests.adapters import HTTPAdapter
+from . import metrics
+from .config import (
+    TOGETHER_API_KEY, TOGETHER_API_URL, DEFAULT_MODEL, MAX_TOKENS, TEMPERATURE, TOP_P,
+    TOGETHER_CONNECT_TIMEOUT, TOGETHER_READ_TIMEOUT, TOGETHER_MAX_RETRIES,
+    TOGETHER_BACKOFF_BASE, TOGETHER_BACKOFF_MAX, TOGETHER_POOL_SIZE
+)
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class DeadlineExceeded(TimeoutError):
+    """The caller's deadline passed before a response arrived."""
+
+class _RetryableError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TogetherClient:
+    """
+    Pooled client for Together AI's chat completions API.
+
+    One instance keeps a requests.Session (keep-alive + TLS reuse) and is
+    safe to share across threads. Calls use separate connect/read timeouts,
+    retry 429/5xx and connection errors with jittered exponential backoff,
+    and identical requests in flight at the same time share one upstream call.
+    An optional `deadline` (a time.monotonic() value) caps every attempt's
+    timeouts and stops retrying once it cannot be met.
+
+    Args:
+        api_url (str): Chat completions endpoint (point at a local stub for tests)
+        api_key (str): Together API key
+        model (str): Default model name
+        connect_timeout (float): Seconds to wait for the TCP/TLS connection
+        read_timeout (float): Seconds to wait for the response
+        max_retries (int): Retries after the first attempt
+        backoff_base (float): Base delay in seconds for exponential backoff
+        backoff_max (float): Upper bound on a single backoff delay
+        pool_size (int): Max pooled connections to the API host
+    """
+    def __init__(self, api_url=TOGETHER_API_URL, api_key=TOGETHER_API_KEY, model=DEFAULT_MODEL,
+                 connect_timeout=TOGETHER_CONNECT_TIMEOUT, read_timeout=TOGETHER_READ_TIMEOUT,
+                 max_retries=TOGETHER_MAX_RETRIES, backoff_base=TOGETHER_BACKOFF_BASE,
+                 backoff_max=TOGETHER_BACKOFF_MAX, pool_size=TOGETHER_POOL_SIZE):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.model = model
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        })
+        # Single-flight bookkeeping: request key -> waiters for the in-flight call
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        # Per event loop: a future belongs to the loop that created it
+        self._async_inflight = weakref.WeakKeyDictionary()
+
+    def build_payload(self, messages, model=None, max_tokens=MAX_TOKENS, temperature=TEMPERATURE, top_p=TOP_P):
+        return {
+            "model": model or self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "top_p": top_p
+        }
+
+    @staticmethod
+    def _request_key(payload):
+        return hashlib.sha1(json.dumps(payload, sort_keys=True).encode('utf8')).hexdigest()
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        # Full jitter: uniform over [0, base * 2^attempt], capped
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _send(self, payload, timeout=None, stream=False):
+        try:
+            response = self.session.post(
+                self.api_url, json=payload, stream=stream,
+                timeout=timeout or (self.connect_timeout, self.read_timeout)
+            )
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            raise _RetryableError(f"Together API request failed: {str(e)}")
+        except requests.exceptions.RequestException as e:
+            raise Exception(f"Together API request failed: {str(e)}")
+        if response.status_code in RETRY_STATUS_CODES:
+            # Release the connection (a streamed response holds it until closed)
+            response.close()
+            retry_after = response.headers.get('Retry-After')
+            try:
+                retry_after = float(retry_after) if retry_after is not None else None
+            except ValueError:
+                retry_after = None
+            raise _RetryableError(
+                f"Together API request failed: {response.status_code} {response.text[:200]}",
+                retry_after=retry_after
+            )
+        try:
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            response.close()
+            raise Exception(f"Together API request failed: {str(e)}")
+        return response
+
+    def _post_once(self, payload, timeout=None):
+        response = self._send(payload, timeout=timeout)
+        try:
+            result = response.json()
+        except (json.JSONDecodeError, ValueError) as e:
+            raise Exception(f"Failed to parse API response: {str(e)}")
+        self._record_usage(result.get('usage'))
+        # Extract the response content
+        if 'choices' in result and len(result['choices']) > 0:
+            return result['choices'][0]['message']['content']
+        raise Exception("Together API error: No response content found in API response")
+
+    @staticmethod
+    def _record_usage(usage):
+        if usage:
+            metrics.inc('prompt_tokens', usage.get('prompt_tokens', 0))
+            metrics.inc('completion_tokens', usage.get('completion_tokens', 0))
+            # Prompt-prefix cache hits, where the provider reports them (OpenAI-style usage)
+            cached = (usage.get('prompt_tokens_details') or {}).get('cached_tokens')
+            if cached:
+                metrics.inc('cached_prompt_tokens', cached)
+
+    def _attempt_timeout(self, timeout, deadline):
+        if deadline is None:
+            return timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("LLM deadline exceeded")
+        connect, read = timeout or (self.connect_timeout, self.read_timeout)
+        return (min(connect, remaining), min(read, remaining))
+
+    def _with_retries(self, fn, *args, deadline=None, timeout=None, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return fn(*args, timeout=self._attempt_timeout(timeout, deadline), **kwargs)
+            except _RetryableError as e:
+                if attempt >= self.max_retries:
+                    raise Exception(f"{e} (after {attempt + 1} attempts)")
+                delay = self._backoff(attempt, e.retry_after)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    raise DeadlineExceeded(f"LLM deadline exceeded after {attempt + 1} attempts: {e}")
+                metrics.inc('llm_retries')
+                time.sleep(delay)
+                attempt += 1
+
+    def _post_with_retries(self, payload, timeout=None, deadline=None):
+        return self._with_retries(self._post_once, payload, timeout=timeout, deadline=deadline)
+
+    def chat(self, messages, model=None, timeout=None, deadline=None, **params):
+        """Send a chat completion request and return the response text."""
+        payload = self.build_payload(messages, model=model, **params)
+        key = self._request_key(payload)
+        with self._inflight_lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = {'done': threading.Event(), 'result': None, 'error': None}
+                self._inflight[key] = flight
+        if not leader:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not flight['done'].wait(remaining):
+                raise DeadlineExceeded("LLM deadline exceeded")
+            if flight['error'] is not None:
+                raise flight['error']
+            return flight['result']
+        try:
+            flight['result'] = self._post_with_retries(payload, timeout=timeout, deadline=deadline)
+            return flight['result']
+        except Exception as e:
+            flight['error'] = e
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+            flight['done'].set()
+
+    def complete(self, prompt, model=None, **params):
+        return self.chat([{"role": "user", "content": prompt}], model=model, **params)
+
+    def stream_chat(self, messages, model=None, timeout=None, deadline=None, **params):
+        """
+        Stream a chat completion (server-sent events) and yield text deltas
+        as they arrive. Retries only apply before the first byte is received;
+        `deadline` bounds the wait for the response, not the whole stream.
+        """
+        payload = self.build_payload(messages, model=model, **params)
+        payload['stream'] = True
+        response = self._with_retries(self._send, payload, timeout=timeout, deadline=deadline, stream=True)
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                try:
+                    chunk = json.loads(data)
+                except json.JSONDecodeError as e:
+                    raise Exception(f"Failed to parse API stream chunk: {str(e)}")
+                self._record_usage(chunk.get('usage'))
+                choices = chunk.get('choices') or []
+                if not choices:
+                    continue
+                delta = choices[0].get('delta') or {}
+                text = delta.get('content') or choices[0].get('text')
+                if text:
+                    yield text
+
+    @staticmethod
+    def system_messages(system_prompt, user_prompt):
+        return [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}]
+
+    def stream(self, prompt, model=None, **params):
+        return self.stream_chat([{"role": "user", "content": prompt}], model=model, **params)
+
+    async def achat(self, messages, model=None, timeout=None, **params):
+        """
+        asyncio variant of chat(). The blocking pooled call runs in the default
+        executor; concurrent identical requests on the same event loop await
+        one shared future.
+        """
+        payload = self.build_payload(messages, model=model, **params)
+        key = self._request_key(payload)
+        loop = asyncio.get_running_loop()
+        with self._inflight_lock:
+            inflight = self._async_inflight.setdefault(loop, {})
+        future = inflight.get(key)
+        if future is None:
+            # Carry the caller's context (e.g. its metrics trace) into the worker thread
+            call = functools.partial(contextvars.copy_context().run, self._post_with_retries, payload, timeout)
+            future = loop.run_in_executor(None, call)
+            future = asyncio.ensure_future(future)
+            inflight[key] = future
+            future.add_done_callback(lambda _: inflight.pop(key, None))
+        # shield() so one cancelled waiter does not cancel the shared call
+        return await asyncio.shield(future)
+
+    async def acomplete(self, prompt, model=None, **params):
+        return await self.achat([{"role": "user", "content": prompt}], model=model, **params)
+
+    def close(self):
+        self.session.close()
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+def get_client():
+    """Return the process-wide shared TogetherClient."""
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = TogetherClient()
+    return _default_client
+
+def set_client(client):
+    """Replace the shared client, e.g. with one pointed at a local stub server."""
+    global _default_client
+    with _default_client_lock:
+        _default_client = client
 
 def query_together_llm(prompt, model=DEFAULT_MODEL):
     """
     Query Together AI's API for LLM inference
-    
+
     Args:
         prompt (str): The input prompt for the model
         model (str): The model to use (default: Llama-3.3-70B-Instruct-Turbo)
-    
+
     Returns:
         str: The generated response from the model
     """
-    api_url = TOGETHER_API_URL
-    
-    # Use the API key from config
-    api_key = TOGETHER_API_KEY
-    
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    
-    payload = {
-        "model": model,
-        "messages": [
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        "max_tokens": MAX_TOKENS,
-        "temperature": TEMPERATURE,
-        "top_p": TOP_P
-    }
-    
-    try:
-        response = requests.post(api_url, headers=headers, json=payload)
-        response.raise_for_status()
-        
-        result = response.json()
-        
-        # Extract the response content
-        if 'choices' in result and len(result['choices']) > 0:
-            return result['choices'][0]['message']['content']
-        else:
-            raise Exception("No response content found in API response")
-            
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Together API request failed: {str(e)}")
-    except json.JSONDecodeError as e:
-        raise Exception(f"Failed to parse API response: {str(e)}")
-    except Exception as e:
-        raise Exception(f"Together API error: {str(e)}")
+    return get_client().complete(prompt, model=model)
+
+def stream_together_llm(prompt, model=DEFAULT_MODEL):
+    """
+    Stream a Together AI completion
+
+    Args:
+        prompt (str): The input prompt for the model
+        model (str): The model to use (default: Llama-3.3-70B-Instruct-Turbo)
+
+    Yields:
+        str: Text deltas in generation order
+    """
+    return get_client().stream(prompt, model=model)
+
+def query_together_llm_with_system_prompt(system_prompt, user_prompt, model=DEFAULT_MODEL, max_tokens=MAX_TOKENS,
+                                          deadline=None):
+    """
+    Query Together AI with a system message followed by a user message
+
+    Args:
+        system_prompt (str): Fixed instructions; keep it identical across calls so the provider can cache the prefix
+        user_prompt (str): Per-request content
+        model (str): The model to use (default: Llama-3.3-70B-Instruct-Turbo)
+        max_tokens (int): Completion token limit
+        deadline (float): Optional time.monotonic() value to give up at (raises DeadlineExceeded)
+
+    Returns:
+        str: The generated response from the model
+    """
+    client = get_client()
+    return client.chat(client.system_messages(system_prompt, user_prompt), model=model, max_tokens=max_tokens,
+                       deadline=deadline)
+
+def stream_together_llm_with_system_prompt(system_prompt, user_prompt, model=DEFAULT_MODEL, max_tokens=MAX_TOKENS,
+                                           deadline=None):
+    """Streaming variant of query_together_llm_with_system_prompt; yields text deltas."""
+    client = get_client()
+    return client.stream_chat(client.system_messages(system_prompt, user_prompt), model=model, max_tokens=max_tokens,
+                              deadline=deadline)
+
+async def aquery_together_llm(prompt, model=DEFAULT_MODEL):
+    """asyncio variant of query_together_llm"""
+    return await get_client().acomplete(prompt, model=model)
 
 if __name__ == "__main__":
     # Test the API
@@ -64,4 +348,4 @@ if __name__ == "__main__":
         response = query_together_llm(test_prompt)
         print(f"Response: {response}")
     except Exception as e:
-        print(f"Error: {e}") 
\ No newline at end of file
+        print(f"Error: {e}")
@@ -0,0 +1,241 @@
+"""
+Incremental multi-page FAQ crawler.
+
+    python -m scraper.crawl_faqs --urls data/faq_urls.txt
+    python -m scraper.crawl_faqs --sitemap https://jupiter.money/sitemap.xml --match /contact
+
+Pages are fetched concurrently over one pooled session with conditional GET
+(ETag / Last-Modified); unchanged pages are skipped. requests is blocking, so
+the fetches run on a thread pool sized to the concurrency, driven from the
+event loop; HTML is parsed in a process pool. FAQs from changed pages replace
+that page's previous records in a JSONL file, which therefore always holds the
+full crawl. The optional delta file only lists what changed in this run; clean
+the full file (`--clean`), and the embedding store re-encodes only the
+questions that changed.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from .preprocess_faqs import preprocess_faqs
+from .scrape_jupiter_faq import parse_jupiter_faq_html
+
+STATE_PATH = 'data/crawl_state.json'
+OUTPUT_PATH = 'data/jupiter_faqs_raw.jsonl'
+CLEAN_PATH = 'data/jupiter_faqs_clean.json'
+USER_AGENT = 'FAQ-Bot crawler (+https://github.com/sanya21561/FAQ-Bot)'
+
+def load_state(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_state(state, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+def read_url_list(path):
+    with open(path, 'r') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+def sitemap_urls(session, sitemap_url, match=None, timeout=(5, 30)):
+    """URLs listed in a sitemap (nested sitemap indexes are followed)."""
+    response = session.get(sitemap_url, timeout=timeout)
+    response.raise_for_status()
+    soup = BeautifulSoup(response.text, 'html.parser')
+    urls = []
+    for sitemap in soup.find_all('sitemap'):
+        loc = sitemap.find('loc')
+        if loc:
+            urls.extend(sitemap_urls(session, loc.get_text(strip=True), match, timeout))
+    for url in soup.find_all('url'):
+        loc = url.find('loc')
+        if loc:
+            text = loc.get_text(strip=True)
+            if match is None or match in text:
+                urls.append(text)
+    return urls
+
+class FAQCrawler:
+    """
+    Args:
+        concurrency (int): Max pages fetched at once
+        state_path (str): Where ETag/Last-Modified/content hashes are kept between runs
+        parse (callable): html -> list of {'question', 'answer'}; must be picklable
+        parse_workers (int): Processes used for parsing (0 parses in threads)
+        timeout (tuple): (connect, read) seconds per request
+    """
+    def __init__(self, concurrency=8, state_path=STATE_PATH, parse=parse_jupiter_faq_html,
+                 parse_workers=2, timeout=(5, 30)):
+        self.concurrency = concurrency
+        self.state_path = state_path
+        self.parse = parse
+        self.parse_workers = parse_workers
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'User-Agent': USER_AGENT})
+        self.state = load_state(state_path)
+
+    def _fetch(self, url):
+        headers = {}
+        previous = self.state.get(url, {})
+        if previous.get('etag'):
+            headers['If-None-Match'] = previous['etag']
+        if previous.get('last_modified'):
+            headers['If-Modified-Since'] = previous['last_modified']
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        return response
+
+    async def _crawl_one(self, url, semaphore, fetch_executor, parse_executor):
+        # One bad page (network, decoding, parsing) is recorded; it must not abort the crawl
+        try:
+            return await self._crawl_page(url, semaphore, fetch_executor, parse_executor)
+        except Exception as e:
+            return {'url': url, 'status': 'error', 'error': f"{type(e).__name__}: {e}"}
+
+    async def _crawl_page(self, url, semaphore, fetch_executor, parse_executor):
+        loop = asyncio.get_running_loop()
+        async with semaphore:
+            response = await loop.run_in_executor(fetch_executor, self._fetch, url)
+        if response.status_code == 304:
+            return {'url': url, 'status': 'not_modified'}
+        if response.status_code != 200:
+            return {'url': url, 'status': 'error', 'error': f"HTTP {response.status_code}"}
+        html = response.text
+        content_hash = hashlib.sha1(html.encode('utf8')).hexdigest()
+        page_state = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'content_hash': content_hash,
+            'fetched_at': time.time(),
+        }
+        if self.state.get(url, {}).get('content_hash') == content_hash:
+            # Server ignored the conditional headers but nothing changed
+            return {'url': url, 'status': 'unchanged', 'state': page_state}
+        faqs = await loop.run_in_executor(parse_executor, self.parse, html)
+        return {'url': url, 'status': 'changed', 'state': page_state, 'faqs': faqs}
+
+    async def crawl_async(self, urls):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        # One thread per in-flight request, matching the session's connection pool
+        fetch_executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='crawl-fetch')
+        if self.parse_workers:
+            parse_executor = ProcessPoolExecutor(max_workers=self.parse_workers)
+        else:
+            parse_executor = None  # default thread pool
+        try:
+            return await asyncio.gather(*[
+                self._crawl_one(url, semaphore, fetch_executor, parse_executor) for url in dict.fromkeys(urls)
+            ])
+        finally:
+            fetch_executor.shutdown()
+            if parse_executor is not None:
+                parse_executor.shutdown()
+
+    def crawl(self, urls, output_path=OUTPUT_PATH, delta_path=None, clean_path=None):
+        """
+        Crawl `urls`, merge FAQs from changed pages into `output_path` (JSONL)
+        and persist the conditional-GET state. With `clean_path`, the full
+        merged output is deduplicated into it whenever something changed.
+
+        Returns:
+            dict: Page counts by status and the number of FAQs written
+        """
+        start = time.time()
+        try:
+            results = asyncio.run(self.crawl_async(urls))
+            for r in results:
+                if r['status'] == 'unchanged':
+                    self.state[r['url']] = r['state']
+            changed = {r['url']: r['faqs'] for r in results if r['status'] == 'changed'}
+            if changed:
+                merge_jsonl(output_path, changed)
+                if delta_path:
+                    write_jsonl(delta_path, changed)
+            # Only once their FAQs are written, or the next run would skip them as not modified
+            for r in results:
+                if r['status'] == 'changed':
+                    self.state[r['url']] = r['state']
+        finally:
+            save_state(self.state, self.state_path)
+        if clean_path and (changed or not os.path.exists(clean_path)) and os.path.exists(output_path):
+            # Always the full merged crawl: cleaning the delta alone would drop every unchanged page
+            preprocess_faqs(output_path, clean_path)
+        summary = {'pages': len(results), 'seconds': time.time() - start,
+                   'faqs_written': sum(len(f) for f in changed.values())}
+        for r in results:
+            summary[r['status']] = summary.get(r['status'], 0) + 1
+        for r in results:
+            if r['status'] == 'error':
+                print(f"Failed {r['url']}: {r['error']}")
+        return summary
+
+def _records(url, faqs):
+    for faq in faqs:
+        yield dict(faq, url=url)
+
+def write_jsonl(path, pages):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        for url, faqs in pages.items():
+            for record in _records(url, faqs):
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+def merge_jsonl(path, pages):
+    """Replace the records of every page in `pages`, streaming the rest through unchanged."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as out:
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    if line.strip() and json.loads(line).get('url') not in pages:
+                        out.write(line if line.endswith('\n') else line + '\n')
+        for url, faqs in pages.items():
+            for record in _records(url, faqs):
+                out.write(json.dumps(record, ensure_ascii=False) + '\n')
+    os.replace(tmp_path, path)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Crawl FAQ pages incrementally")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--urls', help="File with one URL per line")
+    source.add_argument('--sitemap', help="Sitemap URL to read page URLs from")
+    parser.add_argument('--match', help="Only crawl sitemap URLs containing this string")
+    parser.add_argument('--output', default=OUTPUT_PATH, help="JSONL file FAQs are merged into")
+    parser.add_argument('--delta', help="Also write the FAQs of this run's changed pages here (a change log, "
+                                        "not a preprocessing input)")
+    parser.add_argument('--clean', nargs='?', const=CLEAN_PATH,
+                        help=f"After a crawl with changes, deduplicate the full output into this file "
+                             f"(default {CLEAN_PATH})")
+    parser.add_argument('--state', default=STATE_PATH)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--parse-workers', type=int, default=2)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    crawler = FAQCrawler(concurrency=args.concurrency, state_path=args.state, parse_workers=args.parse_workers)
+    if args.sitemap:
+        urls = sitemap_urls(crawler.session, args.sitemap, match=args.match)
+    else:
+        urls = read_url_list(args.urls)
+    print(f"Crawling {len(urls)} pages")
+    summary = crawler.crawl(urls, output_path=args.output, delta_path=args.delta, clean_path=args.clean)
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
+import argparse
 import json
 import os
 import re
+import time
 from collections import OrderedDict
-from datasketch import MinHash
+from concurrent.futures import ProcessPoolExecutor
+from datasketch import MinHash, MinHashLSH, LeanMinHash
 
 def normalize_text(text):
     # Lowercase, strip, and remove extra spaces
@@ -16,9 +19,69 @@ def get_minhash(text, num_perm=128):
         m.update(token.encode('utf8'))
     return m
 
+def minhash_batch(texts, num_perm=128):
+    # Module-level so it can run in worker processes; LeanMinHash pickles compactly
+    return [LeanMinHash(get_minhash(text, num_perm=num_perm)) for text in texts]
+
+def iter_faqs(input_path):
+    """Yield raw FAQs one at a time. JSONL input is streamed; a JSON array is loaded whole."""
+    if input_path.endswith('.jsonl'):
+        with open(input_path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(input_path, 'r') as f:
+            yield from json.load(f)
+
+def iter_batches(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class FAQWriter:
+    """Streams FAQs to a JSONL file, or to a JSON array if the path ends in .json."""
+    def __init__(self, output_path):
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        self.jsonl = output_path.endswith('.jsonl')
+        self.f = open(output_path, 'w')
+        self.count = 0
+        if not self.jsonl:
+            self.f.write('[\n')
+
+    def write(self, faq):
+        if self.jsonl:
+            self.f.write(json.dumps(faq, ensure_ascii=False) + '\n')
+        else:
+            if self.count:
+                self.f.write(',\n')
+            self.f.write(json.dumps(faq, indent=2, ensure_ascii=False))
+        self.count += 1
+
+    def close(self):
+        if not self.jsonl:
+            self.f.write('\n]')
+        self.f.close()
+
+def exact_dedup_decisions(questions, minhash_threshold=0.8, num_perm=128):
+    """Keep/drop decision per question using the original pairwise comparison."""
+    minhashes = []
+    keep = []
+    for question in questions:
+        mh = get_minhash(question, num_perm=num_perm)
+        is_duplicate = any(mh.jaccard(existing_mh) >= minhash_threshold for existing_mh in minhashes)
+        if not is_duplicate:
+            minhashes.append(mh)
+        keep.append(not is_duplicate)
+    return keep
+
 def preprocess_faqs(input_path, output_path, minhash_threshold=0.8):
-    with open(input_path, 'r') as f:
-        faqs = json.load(f)
+    faqs = list(iter_faqs(input_path))
 
     # Normalize questions and answers
     for faq in faqs:
@@ -40,10 +103,106 @@ def preprocess_faqs(input_path, output_path, minhash_threshold=0.8):
             unique_faqs.append(faq)
 
     # Save cleaned data
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    with open(output_path, 'w') as f:
-        json.dump(unique_faqs, f, indent=2, ensure_ascii=False)
+    writer = FAQWriter(output_path)
+    for faq in unique_faqs:
+        writer.write(faq)
+    writer.close()
     print(f"Preprocessed {len(faqs)} FAQs, deduplicated to {len(unique_faqs)}. Saved to {output_path}")
 
+def preprocess_faqs_lsh(input_path, output_path, minhash_threshold=0.8, num_perm=128,
+                        batch_size=1000, workers=1, agreement_sample=2000):
+    """
+    Streaming dedup for large scraped corpora.
+
+    MinHashes are built per batch (across `workers` processes when > 1) and
+    candidate duplicates come from a banded MinHashLSH index instead of a
+    comparison against every kept question. Candidates are confirmed with the
+    same Jaccard threshold as the exact mode. Output is written as it goes.
+
+    Returns:
+        dict: Report with counts, throughput, duplicate clusters and agreement
+        with the exact pairwise mode on the first `agreement_sample` questions.
+    """
+    start = time.time()
+    lsh = MinHashLSH(threshold=minhash_threshold, num_perm=num_perm)
+    kept_minhashes = {}
+    clusters = OrderedDict()  # kept row -> rows dropped as its duplicates
+    sample_questions = []
+    sample_keep = []
+    total = 0
+    writer = FAQWriter(output_path)
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for batch in iter_batches(iter_faqs(input_path), batch_size):
+            for faq in batch:
+                faq['question'] = normalize_text(faq['question'])
+                faq['answer'] = faq['answer'].strip()
+            texts = [faq['question'] for faq in batch]
+            if pool is not None:
+                chunk = max(1, len(texts) // workers)
+                parts = [texts[i:i + chunk] for i in range(0, len(texts), chunk)]
+                minhashes = [mh for part in pool.map(minhash_batch, parts, [num_perm] * len(parts)) for mh in part]
+            else:
+                minhashes = minhash_batch(texts, num_perm=num_perm)
+            for faq, mh in zip(batch, minhashes):
+                row = total
+                total += 1
+                duplicate_of = None
+                for candidate in lsh.query(mh):
+                    if mh.jaccard(kept_minhashes[candidate]) >= minhash_threshold:
+                        duplicate_of = candidate if duplicate_of is None else min(duplicate_of, candidate)
+                if duplicate_of is None:
+                    lsh.insert(row, mh)
+                    kept_minhashes[row] = mh
+                    writer.write(faq)
+                else:
+                    clusters.setdefault(duplicate_of, []).append(row)
+                if len(sample_questions) < agreement_sample:
+                    sample_questions.append(faq['question'])
+                    sample_keep.append(duplicate_of is None)
+    finally:
+        writer.close()
+        if pool is not None:
+            pool.shutdown()
+    elapsed = time.time() - start
+    exact_keep = exact_dedup_decisions(sample_questions, minhash_threshold, num_perm)
+    agreement = sum(a == b for a, b in zip(exact_keep, sample_keep)) / len(sample_keep) if sample_keep else 1.0
+    report = {
+        'input': total,
+        'kept': writer.count,
+        'duplicates': total - writer.count,
+        'duplicate_clusters': len(clusters),
+        'largest_cluster': max((len(v) + 1 for v in clusters.values()), default=0),
+        'seconds': elapsed,
+        'faqs_per_second': total / elapsed if elapsed else 0.0,
+        'agreement_sample': len(sample_keep),
+        'agreement_with_exact': agreement,
+    }
+    print(f"Preprocessed {total} FAQs, deduplicated to {writer.count} "
+          f"({len(clusters)} duplicate clusters) in {elapsed:.1f}s. Saved to {output_path}")
+    return report
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Normalise and deduplicate scraped FAQs")
+    parser.add_argument('input', nargs='?', default='data/jupiter_faqs_raw.json', help="JSON array or JSONL file")
+    parser.add_argument('output', nargs='?', default='data/jupiter_faqs_clean.json', help=".json or .jsonl output")
+    parser.add_argument('--mode', choices=('exact', 'lsh'), default='exact',
+                        help="exact: pairwise comparison (small corpora); lsh: banded MinHashLSH, streamed")
+    parser.add_argument('--threshold', type=float, default=0.8, help="Jaccard similarity for duplicates")
+    parser.add_argument('--num-perm', type=int, default=128)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=1, help="Processes used to build MinHashes")
+    parser.add_argument('--agreement-sample', type=int, default=2000,
+                        help="Questions re-checked with the exact mode for the report")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    preprocess_faqs('data/jupiter_faqs_raw.json', 'data/jupiter_faqs_clean.json') 
\ No newline at end of file
+    args = parse_args()
+    if args.mode == 'lsh':
+        report = preprocess_faqs_lsh(
+            args.input, args.output, minhash_threshold=args.threshold, num_perm=args.num_perm,
+            batch_size=args.batch_size, workers=args.workers, agreement_sample=args.agreement_sample
+        )
+        print(json.dumps(report, indent=2))
+    else:
+        preprocess_faqs(args.input, args.output, args.threshold)
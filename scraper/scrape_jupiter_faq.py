@@ -4,10 +4,9 @@ import json
 import os
 import re
 
-def scrape_jupiter_contact_faq(url):
-    """Scrape Q&A pairs from the Jupiter Contact FAQ page."""
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, 'html.parser')
+def parse_jupiter_faq_html(html):
+    """Extract Q&A pairs from a Jupiter help/FAQ page's HTML."""
+    soup = BeautifulSoup(html, 'html.parser')
     faqs = []
     for li in soup.find_all('li', class_=lambda c: c and 'border-black20' in c):
         # Find the question
@@ -21,6 +20,11 @@ def scrape_jupiter_contact_faq(url):
             faqs.append({'question': question, 'answer': answer})
     return faqs
 
+def scrape_jupiter_contact_faq(url):
+    """Scrape Q&A pairs from the Jupiter Contact FAQ page."""
+    response = requests.get(url)
+    return parse_jupiter_faq_html(response.text)
+
 def main():
     url = 'https://jupiter.money/contact/'
     print(f"Scraping: {url}")
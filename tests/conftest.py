@@ -0,0 +1,5 @@
+import os
+import sys
+
+# models/, scraper/ and benchmarks/ are imported from the repository root, as with `python -m`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
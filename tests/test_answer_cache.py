@@ -0,0 +1,85 @@
+import numpy as np
+from models.answer_cache import SemanticAnswerCache, cache_path_for_index
+
+def vec(*values):
+    return np.array(values, dtype='float32')
+
+def make_cache(**kwargs):
+    return SemanticAnswerCache(**dict({'threshold': 0.9, 'max_entries': 10, 'ttl': 0, 'path': None}, **kwargs))
+
+def test_hit_needs_similarity_and_same_faqs():
+    cache = make_cache()
+    cache.store(vec(1, 0, 0), [3, 1], 'answer', query='how to pay')
+    hit = cache.lookup(vec(0.99, 0.05, 0), [3, 1])
+    assert hit['llm_response'] == 'answer' and hit['similarity'] > 0.99
+    assert cache.lookup(vec(0.5, 0.5, 0), [3, 1]) is None   # Too far
+    assert cache.lookup(vec(1, 0, 0), [1, 3]) is None       # Other retrieved FAQs (order matters)
+    assert cache.stats() == {'hits': 1, 'misses': 2, 'size': 1}
+
+def test_best_match_wins():
+    cache = make_cache()
+    cache.store(vec(1, 0.3, 0), [1], 'close')
+    cache.store(vec(1, 0.05, 0), [1], 'closest')
+    assert cache.lookup(vec(1, 0, 0), [1])['llm_response'] == 'closest'
+
+def test_language_is_part_of_the_key():
+    cache = make_cache()
+    cache.store(vec(1, 0), [1], 'english')
+    cache.store(vec(1, 0), [1], 'hindi', language='hi')
+    assert cache.lookup(vec(1, 0), [1])['llm_response'] == 'english'
+    assert cache.lookup(vec(1, 0), [1], language='hi')['llm_response'] == 'hindi'
+    assert cache.lookup(vec(1, 0), [1], language='fr') is None
+
+def test_lru_evicts_least_recently_used():
+    cache = make_cache(max_entries=2)
+    cache.store(vec(1, 0, 0), [1], 'a')
+    cache.store(vec(0, 1, 0), [1], 'b')
+    assert cache.lookup(vec(1, 0, 0), [1]) is not None  # 'a' is now the most recent
+    cache.store(vec(0, 0, 1), [1], 'c')
+    assert len(cache) == 2
+    assert cache.lookup(vec(0, 1, 0), [1]) is None
+    assert cache.lookup(vec(1, 0, 0), [1])['llm_response'] == 'a'
+
+def test_ttl_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('models.answer_cache.time.time', lambda: now[0])
+    cache = make_cache(ttl=60)
+    cache.store(vec(1, 0), [1], 'answer')
+    now[0] += 59
+    assert cache.lookup(vec(1, 0), [1]) is not None
+    now[0] += 2
+    assert cache.lookup(vec(1, 0), [1]) is None and len(cache) == 0
+
+def test_rebinding_the_index_clears_entries():
+    cache = make_cache()
+    cache.bind_index('v1')
+    cache.store(vec(1, 0), [1], 'answer')
+    cache.bind_index('v1')
+    assert len(cache) == 1
+    cache.bind_index('v2')
+    assert len(cache) == 0
+
+def test_log_survives_restart_and_compacts(tmp_path):
+    path = str(tmp_path / 'cache.jsonl')
+    cache = make_cache(path=path)
+    cache.bind_index('v1')
+    for i in range(3):
+        cache.store(vec(1, i, 0), [i], f'answer {i}', language='hi' if i else None)
+    with open(path, 'a') as f:
+        f.write('{"entry": {"cut off')  # A crash mid-append
+    restarted = make_cache(path=path)
+    assert len(restarted) == 3 and restarted.index_version == 'v1'
+    assert restarted.lookup(vec(1, 2, 0), [2], language='hi')['llm_response'] == 'answer 2'
+    restarted.bind_index('v2')
+    for i in range(5):
+        restarted.store(vec(0, 1, i), [9], 'x')
+    small = make_cache(path=path, max_entries=2)
+    assert len(small) == 2
+    with open(path) as f:
+        assert len(f.readlines()) == 3  # Compacted to the version plus the live entries
+
+def test_one_log_per_index():
+    assert cache_path_for_index('models/faq_faiss.index', 'models/answer_cache.jsonl') == \
+        'models/answer_cache.faq_faiss.jsonl'
+    assert cache_path_for_index('models/faq_faiss_multilingual.index', 'c.jsonl') == 'c.faq_faiss_multilingual.jsonl'
+    assert cache_path_for_index('models/faq_faiss.index', None) is None
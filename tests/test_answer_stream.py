@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from models.rag_pipeline import FAQPipeline, FinalAnswerStream, extract_final_answer
+
+def feed_all(chunks, **kwargs):
+    stream = FinalAnswerStream(**kwargs)
+    shown = [stream.feed(chunk) for chunk in chunks]
+    shown.append(stream.finish())
+    return shown
+
+def test_preamble_before_the_marker_is_held_back():
+    shown = feed_all(['Let me check the FAQs. ', 'FINAL ANSWER: ', 'Open the app', ' and tap KYC.'])
+    assert shown == ['', '', 'Open the app', ' and tap KYC.', '']
+
+def test_marker_split_across_chunks():
+    chunks = ['Thinking... FINAL AN', 'SWER', ':', ' "Go to', ' Settings."']
+    shown = feed_all(chunks)
+    assert shown[:3] == ['', '', '']
+    assert ''.join(shown) == 'Go to Settings."'
+
+def test_marker_is_case_insensitive_and_leading_punctuation_is_dropped():
+    assert ''.join(feed_all(['final answer:', ' - . ', 'Yes.'])) == 'Yes.'
+
+def test_long_stream_without_a_marker_passes_through():
+    shown = feed_all(['x' * 150, 'y' * 100, 'z'], max_preamble=200)
+    assert shown == ['', 'x' * 150 + 'y' * 100, 'z', '']
+
+def test_short_stream_without_a_marker_is_flushed_at_the_end():
+    shown = feed_all(['UPI is free', ' on Jupiter.'])
+    assert shown == ['', '', 'UPI is free on Jupiter.']
+
+def test_nothing_is_flushed_twice():
+    stream = FinalAnswerStream()
+    stream.feed('FINAL ANSWER: done')
+    assert stream.finish() == ''
+
+class StubModel:
+    def encode(self, texts, **kwargs):
+        return np.array([[float(len(t)), 1.0] for t in texts], dtype='float32')
+
+@pytest.fixture
+def pipeline():
+    faiss = pytest.importorskip('faiss')
+    faqs = [{'question': f'question {"x" * i}', 'answer': f'answer {i}', 'category': 'General', 'subcategory': None}
+            for i in range(5)]
+    vectors = StubModel().encode([faq['question'] for faq in faqs])
+    index = faiss.IndexFlatL2(2)
+    index.add(vectors)
+    return FAQPipeline(answer_cache=False, direct_answers=False, deadline=0).use_components(
+        faqs=faqs, index=index, model=StubModel(), embeddings=vectors)
+
+@pytest.mark.parametrize('chunks', [
+    ['Sure. FINAL ', 'ANSWER: Use ', 'the app.'],
+    ['Use the app.'],  # No marker, shorter than the preamble limit
+])
+def test_rag_answer_stream_tokens_add_up_to_the_answer(pipeline, monkeypatch, chunks):
+    monkeypatch.setattr('models.rag_pipeline.stream_prompt', lambda prompt, deadline=None: iter(chunks))
+    events = list(pipeline.rag_answer_stream('question xx'))
+    tokens = ''.join(event['text'] for event in events if event['type'] == 'token')
+    result = events[-1]['result']
+    assert events[-1]['type'] == 'result' and tokens == 'Use the app.'
+    assert result['llm_response'] == extract_final_answer(''.join(chunks)) == 'Use the app.'
+    assert result['timing']['time_to_first_token'] <= result['timing']['total_time']
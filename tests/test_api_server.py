@@ -0,0 +1,109 @@
+import asyncio
+import json
+import threading
+import pytest
+from api_server import MAX_HEADER_BYTES, MAX_HEADERS, APIServer
+
+class FakeContext:
+    def __init__(self, query):
+        self.query = query
+
+class FakePipeline:
+    """Just what APIServer calls; records the thread retrieval and the deadline each answer got."""
+    deadline = 5.0
+
+    def __init__(self):
+        self.retrieve_threads = []
+        self.deadlines = []
+
+    def search_width(self, top_k=3):
+        return top_k
+
+    def build_query_contexts(self, queries, k=None):
+        return [FakeContext(query) for query in queries]
+
+    def retrieve_faq(self, query, top_k=3, ctx=None, category=None, subcategory=None):
+        self.retrieve_threads.append(threading.current_thread().name)
+        return [{'question': query, 'category': category}]
+
+    def answer_with_context(self, ctx, deadline=None, **kwargs):
+        self.deadlines.append(deadline)
+        return {'llm_response': f"answer to {ctx.query}", 'answer_source': 'llm'}
+
+async def exchange(raw, **server_kwargs):
+    """Send raw bytes to a fresh server; returns (pipeline, everything it sent back)."""
+    pipeline = FakePipeline()
+    api = APIServer(pipeline, window=0.001, **server_kwargs)
+    api.batcher.start()
+    server = await asyncio.start_server(api.handle_connection, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(raw)
+        await writer.drain()
+        reply = await asyncio.wait_for(reader.read(), 5)  # Until the server closes
+        writer.close()
+        return pipeline, reply
+    finally:
+        server.close()
+        await api.batcher.stop()
+
+def post(path, body):
+    data = json.dumps(body).encode('utf8')
+    return (f"POST {path} HTTP/1.1\r\nContent-Length: {len(data)}\r\nConnection: close\r\n\r\n").encode() + data
+
+def status_and_body(reply):
+    head, _, body = reply.partition(b'\r\n\r\n')
+    return int(head.split(b' ')[1]), json.loads(body)
+
+@pytest.mark.parametrize('raw', [
+    b"GARBAGE\r\n\r\n",
+    b"POST /answer HTTP/1.1\r\nContent-Length: ten\r\n\r\n",
+    b"POST /answer HTTP/1.1\r\nContent-Length: -5\r\n\r\n",
+])
+def test_malformed_request_gets_400_and_close(raw):
+    _, reply = asyncio.run(exchange(raw))
+    status, body = status_and_body(reply)
+    assert status == 400 and 'Malformed request' in body['error']
+    assert b'Connection: close' in reply
+
+def test_answer_deadline_zero_is_not_the_default():
+    pipeline, reply = asyncio.run(exchange(post('/answer', {'query': 'kyc', 'deadline': 0})))
+    assert status_and_body(reply) == (200, {'llm_response': 'answer to kyc', 'answer_source': 'llm'})
+    assert pipeline.deadlines == [0]
+
+def test_answer_without_deadline_uses_the_default():
+    pipeline, _ = asyncio.run(exchange(post('/answer', {'query': 'kyc'})))
+    assert 0 < pipeline.deadlines[0] <= FakePipeline.deadline
+
+def test_partition_retrieve_runs_on_the_encoder_thread():
+    pipeline, reply = asyncio.run(exchange(post('/retrieve', {'query': 'kyc', 'category': 'Accounts'})))
+    assert status_and_body(reply) == (200, {'retrieved_faqs': [{'question': 'kyc', 'category': 'Accounts'}]})
+    assert pipeline.retrieve_threads[0].startswith('encoder')
+
+def test_bad_body_gets_400():
+    _, reply = asyncio.run(exchange(post('/answer', {'query': ''})))
+    assert status_and_body(reply)[0] == 400
+
+@pytest.mark.parametrize('body', [[1, 2], 'kyc', 7, None])
+def test_non_object_body_gets_400(body):
+    _, reply = asyncio.run(exchange(post('/answer', body)))
+    assert status_and_body(reply) == (400, {'error': "Request body must be a JSON object"})
+
+@pytest.mark.parametrize('headers', [
+    ''.join(f"X-Header-{i}: 1\r\n" for i in range(MAX_HEADERS + 1)),
+    ''.join(f"X-Same: {'v' * 1000}\r\n" for _ in range(MAX_HEADER_BYTES // 1000 + 1)),
+])
+def test_too_many_or_too_large_headers_get_431(headers):
+    raw = f"GET /health HTTP/1.1\r\n{headers}\r\n".encode()
+    _, reply = asyncio.run(exchange(raw))
+    status, _ = status_and_body(reply)
+    assert status == 431 and b'Connection: close' in reply
+
+@pytest.mark.parametrize('encoding, expected', [('chunked', 411), ('gzip', 501)])
+def test_transfer_encoding_is_refused(encoding, expected):
+    raw = f"POST /answer HTTP/1.1\r\nTransfer-Encoding: {encoding}\r\n\r\n5\r\nhello\r\n0\r\n\r\n".encode()
+    pipeline, reply = asyncio.run(exchange(raw))
+    status, _ = status_and_body(reply)
+    assert status == expected and b'Connection: close' in reply
+    assert pipeline.deadlines == []
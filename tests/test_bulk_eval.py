@@ -0,0 +1,71 @@
+import pytest
+from models.bulk_eval import COLUMNS, Progress, RowWriter, load_progress, read_questions
+
+def row(n, **values):
+    return dict(dict.fromkeys(COLUMNS, ''), row=n, question=f"question {n}", **values)
+
+def test_progress_watermark_and_out_of_order_rows():
+    progress = Progress()
+    for n in (0, 1, 3, 5, 1):
+        progress.add(n)
+    assert progress.count == 4 and progress.watermark == 2 and progress.ahead == {3, 5}
+    assert 1 in progress and 3 in progress and 2 not in progress
+    progress.add(2)
+    assert progress.watermark == 4 and progress.ahead == {5}
+
+@pytest.mark.parametrize('fmt', ['csv', 'jsonl'])
+def test_resume_reads_written_rows(tmp_path, fmt):
+    path = str(tmp_path / f'out.{fmt}')
+    writer = RowWriter(path, fmt)
+    for n in (0, 2, 1):
+        writer.write(row(n, rag_answer='multi\nline "quoted" answer'))
+    writer.close()
+    progress = load_progress(path, fmt)
+    assert progress.count == 3 and progress.watermark == 3
+
+@pytest.mark.parametrize('fmt', ['csv', 'jsonl'])
+def test_partial_last_record_is_truncated(tmp_path, fmt):
+    path = str(tmp_path / f'out.{fmt}')
+    writer = RowWriter(path, fmt)
+    writer.write(row(0))
+    writer.write(row(1, rag_answer='first line\nsecond'))
+    writer.close()
+    with open(path, 'rb') as f:
+        complete = f.read()
+    with open(path, 'ab') as f:
+        f.write(b'2,,"question 2","an answer cut\n' if fmt == 'csv' else b'{"row": 2, "question": "qu')
+    progress = load_progress(path, fmt)
+    assert progress.count == 2 and 2 not in progress
+    with open(path, 'rb') as f:
+        assert f.read() == complete
+    # New rows append cleanly after the truncation
+    writer = RowWriter(path, fmt)
+    writer.write(row(2))
+    writer.close()
+    assert load_progress(path, fmt).watermark == 3
+
+def test_read_questions_reports_bad_lines(tmp_path):
+    path = tmp_path / 'in.jsonl'
+    path.write_text('{"question": "a", "id": 7}\n\n{bad\n{"query": "b"}\n{"other": 1}\n')
+    items = list(read_questions(str(path)))
+    assert [(r, i, q) for r, i, q, _ in items] == [(0, 7, 'a'), (1, '', None), (2, '', 'b'), (3, '', None)]
+    assert items[1][3].startswith('invalid JSON') and items[3][3] == 'no question/query field'
+
+@pytest.mark.parametrize('fmt', ['csv', 'jsonl'])
+def test_failed_rows_are_retried_on_resume(tmp_path, fmt):
+    path = str(tmp_path / f'out.{fmt}')
+    writer = RowWriter(path, fmt)
+    writer.write(row(0, rag_answer='ok'))
+    writer.write(row(1, error='503 Service Unavailable'))
+    writer.write(dict(row(2, error='no question/query field'), question=''))
+    writer.write(row(3, rag_answer='ok'))
+    writer.close()
+    progress = load_progress(path, fmt)
+    assert 1 not in progress and all(n in progress for n in (0, 2, 3))
+    # The failed row is gone from the output, so its retry leaves one row per input row
+    writer = RowWriter(path, fmt)
+    writer.write(row(1, rag_answer='ok'))
+    writer.close()
+    assert load_progress(path, fmt).watermark == 4
+    with open(path, encoding='utf8') as f:
+        assert sum(1 for line in f) == 4 + (fmt == 'csv')
@@ -0,0 +1,27 @@
+import json
+import os
+import pytest
+from models.calibrate_direct_answer import choose, load_labels, sweep
+
+def test_pipeline_output_is_refused(tmp_path):
+    path = tmp_path / 'results.csv'
+    path.write_text('question,rag_answer,faq_match\nhow to do kyc,Open the app,Install the app\n')
+    with pytest.raises(ValueError, match="pipeline output"):
+        load_labels(str(path))
+
+def test_bundled_comparison_csv_is_refused():
+    with pytest.raises(ValueError, match="pipeline output"):
+        load_labels(os.path.join(os.path.dirname(__file__), '..', 'rag_vs_llm_results.csv'))
+
+def test_hand_labels_load(tmp_path):
+    csv_path = tmp_path / 'labels.csv'
+    csv_path.write_text('question,faq_match\nhow to do kyc,Install the app\nweather today,\n')
+    assert load_labels(str(csv_path)) == [('how to do kyc', None, 'Install the app'), ('weather today', None, None)]
+    jsonl_path = tmp_path / 'labels.jsonl'
+    jsonl_path.write_text(json.dumps({'query': 'kyc?', 'faq_question': 'How do I do KYC?'}) + '\n')
+    assert load_labels(str(jsonl_path)) == [('kyc?', 'How do I do KYC?', None)]
+
+def test_choose_prefers_coverage_at_target_precision():
+    scores = [(0.95, 0.2, True), (0.9, 0.1, True), (0.85, 0.01, False), (0.8, 0.2, True)]
+    best = choose(sweep(scores, thresholds=[0.8, 0.85, 0.9], margins=[0.0, 0.05]), 1.0)
+    assert (best['threshold'], best['margin'], best['fires']) == (0.8, 0.05, 3)
@@ -0,0 +1,57 @@
+import json
+import os
+import numpy as np
+from models.corpus_store import flatten_faqs, load_columnar_corpus, save_columnar_corpus
+from models.rag_pipeline import corpus_from_faqs
+
+NESTED = {
+    'Accounts': {'Savings': [{'question': 'How do I open an account?', 'answer': 'In the app.'}],
+                 'Closure': [{'question': 'How do I close it?', 'answer': 'Contact support.'}]},
+    'Payments': [{'question': 'Is UPI free? ₹0 fees', 'answer': 'Yes — always.'}],
+}
+
+def write_source(tmp_path):
+    source = tmp_path / 'faqs.json'
+    source.write_text(json.dumps(NESTED, ensure_ascii=False), encoding='utf8')
+    return str(source)
+
+def test_round_trip_matches_the_json_corpus(tmp_path):
+    source = write_source(tmp_path)
+    faqs = flatten_faqs(NESTED)
+    path = str(tmp_path / 'corpus')
+    save_columnar_corpus(faqs, path, source_path=source)
+    corpus = load_columnar_corpus(path, source_path=source)
+    expected = corpus_from_faqs(faqs)
+    for name in ('questions', 'answers', 'question_keys', 'categories', 'subcategories'):
+        assert list(corpus[name]) == list(expected[name])
+    assert corpus['fingerprint'] == expected['fingerprint']
+    assert list(corpus['faqs']) == faqs and corpus['faqs'][1:2] == faqs[1:2]
+    assert corpus['questions'][2] == 'Is UPI free? ₹0 fees'  # Multi-byte UTF-8 survives the offsets
+
+def test_columns_are_memory_mapped_and_categories_interned(tmp_path):
+    faqs = flatten_faqs(NESTED)
+    path = str(tmp_path / 'corpus')
+    meta = save_columnar_corpus(faqs, path)
+    corpus = load_columnar_corpus(path)
+    assert isinstance(corpus['questions'].data, np.memmap)
+    assert isinstance(corpus['categories'].ids, np.memmap)
+    assert meta['categories'] == ['Accounts', 'Payments']
+    assert corpus['categories'].ids.tolist() == [0, 0, 1]
+    assert corpus['subcategories'].ids.tolist() == [0, 1, -1] and corpus['subcategories'][2] is None
+
+def test_stale_or_missing_artifact_is_not_used(tmp_path):
+    source = write_source(tmp_path)
+    path = str(tmp_path / 'corpus')
+    assert load_columnar_corpus(path, source_path=source) is None
+    save_columnar_corpus(flatten_faqs(NESTED), path, source_path=source)
+    assert load_columnar_corpus(path, source_path=source) is not None
+    stat = os.stat(source)
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))  # Re-cleaned JSON
+    assert load_columnar_corpus(path, source_path=source) is None
+
+def test_rebuild_keeps_only_the_previous_version(tmp_path):
+    faqs = flatten_faqs(NESTED)
+    path = str(tmp_path / 'corpus')
+    versions = [save_columnar_corpus(faqs[:n], path)['version'] for n in (1, 2, 3)]
+    assert sorted(name for name in os.listdir(path) if name.startswith('v')) == sorted(versions[1:])
+    assert len(load_columnar_corpus(path)['questions']) == 3
@@ -0,0 +1,156 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from scraper.crawl_faqs import FAQCrawler, load_state, merge_jsonl
+
+LAST_MODIFIED = 'Wed, 01 Oct 2025 00:00:00 GMT'
+
+def page(*questions):
+    items = ''.join(
+        f'<li class="border-black20"><span class="text-black100 text-left">{q}</span>'
+        f'<p class="text-black60">Answer to {q}</p></li>' for q in questions
+    )
+    return f'<html><body><ul>{items}</ul></body></html>'
+
+class Site:
+    """Pages by path, each with an ETag; honours If-None-Match and If-Modified-Since."""
+    def __init__(self):
+        self.pages = {}
+        self.requests = []
+        self.conditional = True
+
+    def set(self, path, html, status=200):
+        self.pages[path] = (html, f'"{path}-{len(html)}-{hash(html)}"', status)
+
+@pytest.fixture
+def site():
+    site = Site()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            site.requests.append((self.path, self.headers.get('If-None-Match')))
+            if self.path not in site.pages:
+                self.send_error(404)
+                return
+            html, etag, status = site.pages[self.path]
+            if site.conditional and (self.headers.get('If-None-Match') == etag
+                                     or self.headers.get('If-Modified-Since') == LAST_MODIFIED
+                                     and not self.headers.get('If-None-Match')):
+                self.send_response(304)
+                self.end_headers()
+                return
+            data = html.encode('utf8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', LAST_MODIFIED)
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    site.url = f'http://127.0.0.1:{server.server_port}'
+    yield site
+    server.shutdown()
+    server.server_close()
+
+def read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+def crawl(site, tmp_path, paths, **kwargs):
+    crawler = FAQCrawler(concurrency=4, state_path=str(tmp_path / 'state.json'), parse_workers=0)
+    return crawler.crawl([site.url + path for path in paths], output_path=str(tmp_path / 'faqs.jsonl'), **kwargs)
+
+def test_first_crawl_writes_faqs_and_state(site, tmp_path):
+    site.set('/a', page('Q1', 'Q2'))
+    site.set('/b', page('Q3'))
+    summary = crawl(site, tmp_path, ['/a', '/b'])
+    assert summary['changed'] == 2 and summary['faqs_written'] == 3
+    records = read_jsonl(tmp_path / 'faqs.jsonl')
+    assert sorted(r['question'] for r in records) == ['Q1', 'Q2', 'Q3']
+    assert {r['url'] for r in records if r['question'] == 'Q3'} == {site.url + '/b'}
+    state = load_state(str(tmp_path / 'state.json'))
+    assert state[site.url + '/a']['etag'] == site.pages['/a'][1]
+    assert state[site.url + '/a']['last_modified'] == LAST_MODIFIED
+
+def test_recrawl_sends_conditional_headers_and_skips_304(site, tmp_path):
+    site.set('/a', page('Q1'))
+    crawl(site, tmp_path, ['/a'])
+    before = (tmp_path / 'faqs.jsonl').read_text()
+    summary = crawl(site, tmp_path, ['/a'])
+    assert summary['not_modified'] == 1 and summary['faqs_written'] == 0
+    assert site.requests[-1] == ('/a', site.pages['/a'][1])
+    assert (tmp_path / 'faqs.jsonl').read_text() == before
+
+def test_unchanged_content_without_conditional_support(site, tmp_path):
+    site.set('/a', page('Q1'))
+    crawl(site, tmp_path, ['/a'])
+    site.conditional = False
+    summary = crawl(site, tmp_path, ['/a'])
+    assert summary['unchanged'] == 1 and summary['faqs_written'] == 0
+
+def test_changed_page_replaces_only_its_records(site, tmp_path):
+    site.set('/a', page('Q1', 'Q2'))
+    site.set('/b', page('Q3'))
+    crawl(site, tmp_path, ['/a', '/b'])
+    site.set('/a', page('Q1 updated'))
+    summary = crawl(site, tmp_path, ['/a', '/b'], delta_path=str(tmp_path / 'delta.jsonl'))
+    assert summary['changed'] == 1 and summary['not_modified'] == 1
+    assert sorted(r['question'] for r in read_jsonl(tmp_path / 'faqs.jsonl')) == ['Q1 updated', 'Q3']
+    assert [r['question'] for r in read_jsonl(tmp_path / 'delta.jsonl')] == ['Q1 updated']
+
+def test_failing_page_is_recorded_and_others_still_merge(site, tmp_path):
+    site.set('/a', page('Q1'))
+    site.set('/broken', page('Q2'))
+
+    def parse(html):
+        if 'Q2' in html:
+            raise ValueError("unparseable")
+        return [{'question': 'Q1', 'answer': 'A1'}]
+    crawler = FAQCrawler(state_path=str(tmp_path / 'state.json'), parse=parse, parse_workers=0)
+    urls = [site.url + path for path in ('/a', '/broken', '/missing')]
+    summary = crawler.crawl(urls, output_path=str(tmp_path / 'faqs.jsonl'))
+    assert summary['changed'] == 1 and summary['error'] == 2
+    assert [r['question'] for r in read_jsonl(tmp_path / 'faqs.jsonl')] == ['Q1']
+    state = load_state(str(tmp_path / 'state.json'))
+    assert site.url + '/a' in state and site.url + '/broken' not in state
+
+def test_state_is_saved_when_the_merge_fails(site, tmp_path, monkeypatch):
+    site.set('/a', page('Q1'))
+    site.set('/b', page('Q2'))
+    crawl(site, tmp_path, ['/a'])
+    first_fetch = load_state(str(tmp_path / 'state.json'))[site.url + '/a']['fetched_at']
+    site.conditional = False
+
+    def fail(*args):
+        raise OSError("disk full")
+    monkeypatch.setattr('scraper.crawl_faqs.merge_jsonl', fail)
+    with pytest.raises(OSError):
+        crawl(site, tmp_path, ['/a', '/b'])
+    state = load_state(str(tmp_path / 'state.json'))
+    # /a was unchanged and keeps its refreshed state; /b's FAQs were never written, so it is fetched again
+    assert state[site.url + '/a']['fetched_at'] > first_fetch
+    assert site.url + '/b' not in state
+
+def test_merge_jsonl_keeps_other_pages(tmp_path):
+    path = str(tmp_path / 'faqs.jsonl')
+    merge_jsonl(path, {'u1': [{'question': 'a'}], 'u2': [{'question': 'b'}]})
+    merge_jsonl(path, {'u1': [{'question': 'c'}]})
+    assert sorted((r['url'], r['question']) for r in read_jsonl(path)) == [('u1', 'c'), ('u2', 'b')]
+
+def test_clean_output_keeps_unchanged_pages_after_a_delta_run(site, tmp_path):
+    site.set('/a', page('Q1'))
+    site.set('/b', page('Q3'))
+    clean = str(tmp_path / 'clean.json')
+    crawl(site, tmp_path, ['/a', '/b'], clean_path=clean)
+    site.set('/a', page('Q1 updated'))
+    crawl(site, tmp_path, ['/a', '/b'], delta_path=str(tmp_path / 'delta.jsonl'), clean_path=clean)
+    assert [r['question'] for r in read_jsonl(tmp_path / 'delta.jsonl')] == ['Q1 updated']
+    with open(clean) as f:
+        assert sorted(faq['question'] for faq in json.load(f)) == ['q1 updated', 'q3']
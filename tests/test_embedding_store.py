@@ -0,0 +1,63 @@
+import numpy as np
+from models.embedding_store import EmbeddingStore, content_key, entry_ids, keys_path
+
+class CountingEncoder:
+    """Deterministic 4-d vectors; remembers every text it was asked to encode."""
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return np.array([[len(t), t.count('a'), t.count('e'), 1.0] for t in texts], dtype='float32')
+
+def test_rebuild_only_encodes_new_questions(tmp_path):
+    path = str(tmp_path / 'emb.npy')
+    encode = CountingEncoder()
+    store = EmbeddingStore(path, 'model-a')
+    vectors, encoded, reused = store.update(['How do I pay?', 'What is KYC?'], encode)
+    assert (encoded, reused) == (2, 0)
+    vectors2, encoded, reused = store.update(['what is  kyc?', 'Open an account', 'How do I pay?'], encode)
+    assert (encoded, reused) == (1, 2)
+    assert encode.calls[-1] == ['Open an account']
+    np.testing.assert_array_equal(vectors2[2], vectors[0])
+
+def test_duplicate_questions_are_encoded_once(tmp_path):
+    encode = CountingEncoder()
+    EmbeddingStore(str(tmp_path / 'emb.npy'), 'm').update(['Same?', 'same?', 'Other'], encode)
+    assert encode.calls == [['Same?', 'Other']]
+
+def test_other_model_does_not_reuse_vectors(tmp_path):
+    path = str(tmp_path / 'emb.npy')
+    EmbeddingStore(path, 'model-a').update(['q1'], CountingEncoder())
+    _, encoded, reused = EmbeddingStore(path, 'model-a@onnx_int8').update(['q1'], CountingEncoder())
+    assert (encoded, reused) == (1, 0)
+    assert content_key('model-a', 'q1') != content_key('model-a@onnx_int8', 'q1')
+
+def test_store_length_mismatch_is_ignored(tmp_path):
+    path = str(tmp_path / 'emb.npy')
+    store = EmbeddingStore(path, 'm')
+    store.update(['q1', 'q2'], CountingEncoder())
+    np.save(path, np.zeros((1, 4), dtype='float32'))  # Keys and vectors out of step
+    assert store.load() == ([], None)
+    assert keys_path(path).endswith('emb.keys.json')
+
+def test_vectors_from_another_save_are_ignored(tmp_path):
+    path = str(tmp_path / 'emb.npy')
+    store = EmbeddingStore(path, 'm')
+    store.update(['q1', 'q2'], CountingEncoder())
+    keys, vectors = store.load()
+    assert keys and vectors is not None
+    # A crash between the two renames: new vectors with the previous keys, same row count
+    np.save(path, np.asarray(vectors) + 1)
+    assert store.load() == ([], None)
+    _, encoded, reused = store.update(['q1', 'q2'], CountingEncoder())
+    assert (encoded, reused) == (2, 0)
+
+def test_entry_ids_are_stable_and_unique():
+    faqs = [{'question': 'Q', 'category': 'c'}, {'question': 'q ', 'category': 'c'}, {'question': 'Q', 'category': 'd'}]
+    ids = entry_ids(faqs)
+    # Exact duplicates (after normalisation) still get distinct ids
+    assert len(set(ids.tolist())) == 3 and (ids > 0).all()
+    # Unique entries keep their id when the corpus is reordered
+    np.testing.assert_array_equal(entry_ids(faqs[1:][::-1])[::-1], entry_ids(faqs[1:]))
+    assert entry_ids([faqs[2]])[0] == ids[2]
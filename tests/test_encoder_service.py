@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Client
+import numpy as np
+import pytest
+from models.encoder_service import REPLY_ERROR, EncoderService, RemoteEncoder
+
+class StubEncoder:
+    """Row = [len(text), 1]; records every batch and can be told to fail."""
+    def __init__(self):
+        self.batches = []
+        self.fail = False
+
+    def encode(self, texts):
+        if self.fail:
+            raise RuntimeError("model exploded")
+        self.batches.append(list(texts))
+        return np.array([[len(t), 1.0] for t in texts], dtype='float32')
+
+@pytest.fixture
+def service():
+    """Factory for a running service on a fresh Unix socket; returns (service, stub, address)."""
+    started = []
+    directory = tempfile.mkdtemp()  # Short: AF_UNIX paths are capped at ~100 bytes
+
+    def start(**kwargs):
+        stub = StubEncoder()
+        service = EncoderService(stub, 'stub-model', 'torch', **dict({'window': 0.005}, **kwargs))
+        address = os.path.join(directory, f'enc{len(started)}.sock')
+        threading.Thread(target=service.serve, args=(address,), daemon=True).start()
+        while service._listener is None:
+            time.sleep(0.01)
+        stub.batches.clear()  # Drop the warmup call
+        started.append(service)
+        return service, stub, address
+    yield start
+    for service in started:
+        service.shutdown()
+    shutil.rmtree(directory, ignore_errors=True)
+
+def test_round_trip_and_errors(service):
+    _, stub, address = service()
+    encoder = RemoteEncoder(address, model_name='stub-model', backend='torch')
+    assert encoder.info == {'model': 'stub-model', 'backend': 'torch', 'dim': 2}
+    assert encoder.get_sentence_embedding_dimension() == 2
+    np.testing.assert_array_equal(encoder.encode(['ab', 'abcd']), [[2, 1], [4, 1]])
+    np.testing.assert_array_equal(encoder.encode('abc'), [[3, 1]])
+    assert encoder.encode([]).shape == (0, 2)
+    stub.fail = True
+    with pytest.raises(RuntimeError, match="model exploded"):
+        encoder.encode(['x'])
+    encoder.close()
+
+def test_malformed_request_gets_an_error_reply(service):
+    _, _, address = service()
+    conn = Client(address, family='AF_UNIX')
+    conn.recv_bytes()  # hello
+    conn.send_bytes(b'{"not": "a list"}')
+    assert conn.recv_bytes().startswith(REPLY_ERROR)
+    conn.send_bytes(b'not json')
+    assert conn.recv_bytes().startswith(REPLY_ERROR)
+    conn.close()
+
+def test_hello_must_match_model_and_backend(service):
+    _, _, address = service()
+    with pytest.raises(ValueError, match="stub-model@onnx_int8"):
+        RemoteEncoder(address, model_name='stub-model', backend='onnx_int8')
+    with pytest.raises(ValueError, match="serves 'stub-model'"):
+        RemoteEncoder(address, model_name='other-model', backend='torch')
+
+def encode_together(encoders, texts):
+    barrier = threading.Barrier(len(encoders))
+    results = [None] * len(encoders)
+
+    def run(i):
+        barrier.wait()
+        results[i] = encoders[i].encode(texts[i])
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(encoders))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_concurrent_requests_share_one_batch_and_flush_early(service):
+    svc, stub, address = service(window=2.0)
+    encoders = [RemoteEncoder(address) for _ in range(2)]
+    start = time.monotonic()
+    results = encode_together(encoders, [['a'], ['bb', 'ccc']])
+    # Every open connection had a request in, so the batch went out before the window ended
+    assert time.monotonic() - start < 1.0
+    assert len(stub.batches) == 1 and sorted(stub.batches[0]) == ['a', 'bb', 'ccc']
+    np.testing.assert_array_equal(results[1], [[2, 1], [3, 1]])
+    assert svc.stats()['mean_batch_size'] == 3
+
+def test_batch_waits_for_the_window_while_connections_are_idle(service):
+    _, stub, address = service(window=0.3)
+    encoders = [RemoteEncoder(address) for _ in range(2)]
+    start = time.monotonic()
+    encoders[0].encode(['a'])
+    assert time.monotonic() - start >= 0.3
+    assert stub.batches == [['a']]
+
+def test_max_batch_flushes_without_waiting(service):
+    _, stub, address = service(window=2.0, max_batch=3)
+    encoders = [RemoteEncoder(address) for _ in range(3)]
+    start = time.monotonic()
+    encoders[0].encode(['a', 'b', 'c'])
+    assert time.monotonic() - start < 1.0
+    assert stub.batches == [['a', 'b', 'c']]
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from models.encoders import CachedEncoder, backend_embeddings_path, store_model_id
+
+class StubEncoder:
+    """Vector = [len(text), number of calls so far]; records every batch it encodes."""
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, texts, **kwargs):
+        self.batches.append(list(texts))
+        return np.array([[len(t), len(self.batches)] for t in texts], dtype='float32')
+
+    def get_sentence_embedding_dimension(self):
+        return 2
+
+def test_only_misses_are_encoded_in_one_batch():
+    stub = StubEncoder()
+    encoder = CachedEncoder(stub, max_entries=10)
+    encoder.encode(['how to pay'])
+    vectors = encoder.encode(['how to pay', 'what is kyc', 'open account'])
+    assert stub.batches == [['how to pay'], ['what is kyc', 'open account']]
+    np.testing.assert_array_equal(vectors[:, 1], [1, 2, 2])  # The first row came from the cache
+    assert encoder.stats() == {'hits': 1, 'misses': 3, 'size': 3}
+
+def test_keys_are_normalised():
+    stub = StubEncoder()
+    encoder = CachedEncoder(stub, max_entries=10)
+    vectors = encoder.encode(['How  to Pay?', ' how to pay? '])
+    assert stub.batches == [['How  to Pay?']]  # One miss for both spellings
+    np.testing.assert_array_equal(vectors[0], vectors[1])
+    encoder.encode('HOW TO PAY?')
+    assert len(stub.batches) == 1
+
+def test_least_recently_used_is_evicted():
+    stub = StubEncoder()
+    encoder = CachedEncoder(stub, max_entries=2)
+    encoder.encode(['a', 'b'])
+    encoder.encode(['a'])  # 'a' is now the most recent
+    encoder.encode(['c'])
+    assert encoder.stats()['size'] == 2
+    encoder.encode(['a'])
+    assert len(stub.batches) == 2
+    encoder.encode(['b'])
+    assert stub.batches[-1] == ['b']
+
+def test_wrapped_encoder_attributes_pass_through():
+    assert CachedEncoder(StubEncoder()).get_sentence_embedding_dimension() == 2
+
+@pytest.mark.parametrize('backend, model_id, path', [
+    ('torch', 'm', 'models/faq_embeddings.npy'),
+    ('onnx_int8', 'm@onnx_int8', 'models/faq_embeddings.onnx_int8.npy'),
+])
+def test_backend_store_names(backend, model_id, path):
+    assert store_model_id('m', backend) == model_id
+    assert backend_embeddings_path('models/faq_embeddings.npy', backend) == path
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from models.index_factory import (
+    INDEX_TYPES, build_index, factory_string, id_lookup, ids_to_positions, load_index_meta, read_index,
+    resolve_params, save_ids, save_index
+)
+
+def test_defaults_and_overrides():
+    assert resolve_params('flat_l2') == {}
+    assert resolve_params('hnsw', {'efSearch': 128, 'M': None}) == {'M': 32, 'efConstruction': 200, 'efSearch': 128}
+
+def test_params_of_other_index_types_are_ignored():
+    assert resolve_params('hnsw', {'nlist': 10, 'nprobe': 4}) == resolve_params('hnsw')
+
+def test_unknown_index_type():
+    with pytest.raises(ValueError, match="Unknown index type"):
+        resolve_params('annoy')
+
+def test_nlist_and_nprobe_shrink_to_the_corpus():
+    assert resolve_params('ivf_flat', n_vectors=100_000) == {'nlist': 1024, 'nprobe': 16}
+    assert resolve_params('ivf_flat', n_vectors=390) == {'nlist': 10, 'nprobe': 10}
+    assert resolve_params('ivf_flat', {'nprobe': 4}, n_vectors=10) == {'nlist': 1, 'nprobe': 1}
+
+def test_pq_bits_shrink_and_pq_m_must_divide_dim():
+    params = resolve_params('ivf_pq', n_vectors=1000, dim=384)
+    assert params['pq_nbits'] == 4 and 39 * 2 ** params['pq_nbits'] <= 1000
+    assert resolve_params('ivf_pq', n_vectors=1_000_000, dim=384)['pq_nbits'] == 8
+    with pytest.raises(ValueError, match="must divide"):
+        resolve_params('ivf_pq', {'pq_m': 10}, dim=384)
+
+@pytest.mark.parametrize('index_type', INDEX_TYPES)
+def test_every_type_builds_and_finds_itself(index_type, tmp_path):
+    pytest.importorskip('faiss')
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(2000, 32)).astype('float32')
+    index, params = build_index(vectors, index_type, {'pq_m': 8})
+    assert factory_string(index_type, params)
+    path = str(tmp_path / 'faq.index')
+    save_index(index, path, index_type, params)
+    assert load_index_meta(path)['index_type'] == index_type
+    _, I = read_index(path).search(vectors[:5] / np.linalg.norm(vectors[:5], axis=1, keepdims=True)
+                                   if index_type == 'flat_ip' else vectors[:5], 1)
+    if index_type != 'ivf_pq':  # PQ is lossy
+        assert I[:, 0].tolist() == [0, 1, 2, 3, 4]
+
+def test_id_mapped_positions_round_trip(tmp_path):
+    ids = np.array([900, 17, 42], dtype='int64')
+    save_ids(ids, str(tmp_path / 'faq.index'))
+    lookup = id_lookup(np.load(tmp_path / 'faq.ids.npy'))
+    np.testing.assert_array_equal(ids_to_positions(np.array([[42, 900, -1]]), lookup), [[2, 0, -1]])
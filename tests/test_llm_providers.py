@@ -0,0 +1,106 @@
+import time
+import pytest
+from benchmarks.stub_together import start_stub_server
+from models import metrics
+from models.llm_providers import HedgedLLM, HuggingFaceProvider, TogetherProvider
+from models.together_inference import DeadlineExceeded, TogetherClient
+
+PROMPT = {'system': 'You answer FAQs.', 'user': 'User question: how do I pay?', 'max_tokens': 32}
+
+@pytest.fixture
+def providers():
+    """Factory for (primary, secondary) providers over two stub servers, with their stub configs."""
+    servers = []
+
+    def start(primary, secondary):
+        configs, urls = [], []
+        for name, kwargs in (('primary', primary), ('secondary', secondary)):
+            server, config, url = start_stub_server(**dict({'latency': 0.0, 'completion': name}, **kwargs))
+            servers.append(server)
+            configs.append(config)
+            urls.append(url)
+        client = TogetherClient(api_url=urls[0], api_key='test', backoff_base=0.0, max_retries=0)
+        return [TogetherProvider(client), HuggingFaceProvider(api_url=urls[1])], configs
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def hedged(providers, **kwargs):
+    return HedgedLLM(providers, **dict({'initial_delay': 0.1, 'min_delay': 0.0, 'min_samples': 5}, **kwargs))
+
+def test_hedge_delay_is_the_recent_latency_quantile():
+    llm = hedged([TogetherProvider(), HuggingFaceProvider()], initial_delay=2.0, min_delay=0.05, quantile=0.95)
+    primary = llm.providers[0]
+    assert llm.hedge_delay(primary) == 2.0  # Too few samples
+    llm.latencies['together'].extend([0.1] * 19 + [1.1])
+    assert llm.hedge_delay(primary) == pytest.approx(0.15)
+    llm.latencies['together'].clear()
+    llm.latencies['together'].extend([0.0] * 20)
+    assert llm.hedge_delay(primary) == 0.05
+
+def test_hedge_fires_after_the_delay_and_the_fast_provider_wins(providers):
+    pair, (primary, secondary) = providers({'latency': 1.0}, {'latency': 0.0})
+    llm = hedged(pair)
+    start = time.monotonic()
+    text, name = llm.complete(PROMPT)
+    elapsed = time.monotonic() - start
+    assert (text, name) == ('secondary', 'huggingface')
+    assert 0.1 <= elapsed < 0.6
+    assert primary.requests == secondary.requests == 1
+
+def test_no_hedge_when_the_primary_answers_in_time(providers):
+    pair, (primary, secondary) = providers({'latency': 0.0}, {'latency': 0.0})
+    assert hedged(pair, initial_delay=1.0).complete(PROMPT, deadline=time.monotonic() + 5) == ('primary', 'together')
+    assert secondary.requests == 0
+
+def test_first_good_response_wins_even_after_hedging(providers):
+    pair, (primary, secondary) = providers({'latency': 0.3}, {'latency': 1.5})
+    llm = hedged(pair)
+    start = time.monotonic()
+    assert llm.complete(PROMPT) == ('primary', 'together')
+    assert time.monotonic() - start < 1.0
+    assert secondary.requests == 1  # The hedge was sent, and lost
+    assert llm.stats()['together']['wins'] == 1
+
+def test_failover_when_the_primary_errors(providers):
+    pair, (primary, secondary) = providers({'error_rate': 1.0, 'error_status': 400}, {'latency': 0.0})
+    llm = hedged(pair, initial_delay=5.0)
+    start = time.monotonic()
+    assert llm.complete(PROMPT) == ('secondary', 'huggingface')
+    assert time.monotonic() - start < 1.0  # Did not wait for the hedge delay
+    assert primary.requests == 1
+
+def test_all_providers_failing_raises(providers):
+    pair, _ = providers({'error_rate': 1.0, 'error_status': 400}, {'error_rate': 1.0, 'error_status': 500})
+    with pytest.raises(Exception, match="All LLM providers failed"):
+        hedged(pair).complete(PROMPT)
+
+def test_deadline_passing_degrades_instead_of_blocking(providers):
+    pair, (primary, secondary) = providers({'latency': 2.0}, {'latency': 2.0})
+    llm = hedged(pair)
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        llm.complete(PROMPT, deadline=time.monotonic() + 0.4)
+    assert time.monotonic() - start < 0.8
+    assert primary.requests == secondary.requests == 1
+
+def test_losing_calls_are_bounded_without_a_deadline(providers):
+    pair, (primary, secondary) = providers({'latency': 0.2}, {'latency': 5.0})
+    llm = hedged(pair, initial_delay=0.05, call_timeout=0.5)
+    assert llm.complete(PROMPT) == ('primary', 'together')
+    assert secondary.requests == 1 and llm.in_flight == 1  # The lost hedge is still waiting on its reply
+    # Its read timeout is capped by call_timeout, not the provider's 60s default
+    give_up = time.monotonic() + 2.0
+    while llm.in_flight and time.monotonic() < give_up:
+        time.sleep(0.05)
+    assert llm.in_flight == 0
+
+def test_hedges_are_skipped_while_the_pool_is_full(providers):
+    pair, (primary, secondary) = providers({'latency': 0.3}, {'latency': 0.0})
+    llm = hedged(pair, max_workers=1)
+    trace = metrics.Trace()
+    with metrics.activate(trace):
+        assert llm.complete(PROMPT) == ('primary', 'together')
+    assert trace.counters.get('llm_hedge_skipped') == 1 and 'llm_hedged' not in trace.counters
+    assert secondary.requests == 0
@@ -0,0 +1,89 @@
+import contextvars
+import re
+import threading
+import pytest
+from models import metrics
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = metrics.MetricsRegistry()
+    monkeypatch.setattr(metrics, 'registry', registry)
+    return registry
+
+def test_disabled_mode_is_a_no_op(monkeypatch, registry):
+    monkeypatch.setattr(metrics, '_enabled', False)
+    with metrics.trace_request() as trace:
+        assert trace is None and metrics.current_trace() is None
+        assert metrics.stage('encode') is metrics._NULL_STAGE
+        with metrics.stage('encode'):
+            metrics.inc('llm_retries')
+    assert registry.to_json() == {'counters': [], 'histograms': []}
+    assert registry.to_prometheus() == '\n'
+
+def test_trace_is_recorded_into_the_registry(monkeypatch, registry):
+    monkeypatch.setattr(metrics, '_enabled', True)
+    with metrics.trace_request('rag_answer') as trace:
+        with metrics.stage('encode'):
+            pass
+        metrics.inc('llm_retries', 2)
+        metrics.inc('prompt_tokens', 300)
+    assert set(trace.stages) == {'encode'} and trace.counters == {'llm_retries': 2, 'prompt_tokens': 300}
+    counters = {(c['name'], tuple(c['labels'].items())): c['value'] for c in registry.to_json()['counters']}
+    assert counters[('rag_requests_total', (('kind', 'rag_answer'),))] == 1
+    assert counters[('rag_llm_retries_total', ())] == 2
+    names = {h['name'] for h in registry.to_json()['histograms']}
+    assert names == {'rag_stage_seconds', 'rag_request_seconds', 'llm_prompt_tokens'}
+
+def test_traces_follow_contextvars_not_threads():
+    outer, inner = metrics.Trace(), metrics.Trace()
+    seen = {}
+    with metrics.activate(outer):
+        with metrics.activate(inner):
+            metrics.inc('nested')
+        metrics.inc('outer_only')
+        # A copied context carries the trace into a worker thread; a bare thread does not
+        copied = threading.Thread(target=contextvars.copy_context().run,
+                                  args=(lambda: seen.update(copied=metrics.current_trace()),))
+        bare = threading.Thread(target=lambda: seen.update(bare=metrics.current_trace()))
+        for thread in (copied, bare):
+            thread.start()
+            thread.join()
+    assert metrics.current_trace() is None
+    assert inner.counters == {'nested': 1} and outer.counters == {'outer_only': 1}
+    assert seen == {'copied': outer, 'bare': None}
+
+def test_iterate_in_holds_the_trace_only_while_producing_items():
+    trace = metrics.Trace()
+
+    def produce():
+        for i in range(3):
+            metrics.inc('items')
+            yield metrics.current_trace()
+    consumer_view = []
+    for produced_under in metrics.iterate_in(trace, produce()):
+        assert produced_under is trace
+        consumer_view.append(metrics.current_trace())
+    assert consumer_view == [None, None, None] and trace.counters == {'items': 3}
+
+def test_prometheus_text_format(registry):
+    registry.inc('rag_requests_total', kind='rag_answer')
+    registry.inc('rag_llm_retries_total', 3)
+    for seconds in (0.004, 0.2, 0.2, 120):
+        registry.observe('rag_stage_seconds', seconds, stage='encode')
+    registry.observe('rag_stage_seconds', 0.01, stage='search')
+    text = registry.to_prometheus()
+    lines = text.splitlines()
+    assert lines.count('# TYPE rag_stage_seconds histogram') == 1
+    assert '# TYPE rag_requests_total counter' in lines and '# TYPE rag_llm_retries_total counter' in lines
+    assert '# HELP rag_stage_seconds Time spent in each pipeline stage per request' in lines
+    # HELP and TYPE come right before the family's first sample
+    first = next(i for i, line in enumerate(lines) if line.startswith('rag_stage_seconds'))
+    assert lines[first - 2].startswith('# HELP rag_stage_seconds') and lines[first - 1].startswith('# TYPE')
+    assert 'rag_requests_total{kind="rag_answer"} 1' in lines
+    assert 'rag_stage_seconds_bucket{stage="encode",le="0.005"} 1' in lines
+    assert 'rag_stage_seconds_bucket{stage="encode",le="0.25"} 3' in lines
+    assert 'rag_stage_seconds_bucket{stage="encode",le="+Inf"} 4' in lines
+    assert 'rag_stage_seconds_count{stage="encode"} 4' in lines
+    sample = re.compile(r'^[a-z_]+(\{[a-z_]+="[^"]*"(,[a-z_]+="[^"]*")*\})? \S+$')
+    assert all(line.startswith('# ') or sample.match(line) for line in lines)
+    assert text.endswith('\n')
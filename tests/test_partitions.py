@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+from models.index_factory import build_index, filtered_search, id_lookup, id_selector, index_meta
+from models.partitions import build_partitions, load_partitions, partition_key, save_partitions
+from models.rag_pipeline import FAQPipeline, QueryContext
+
+def test_partitions_by_category_and_subcategory():
+    partitions = build_partitions(['a', 'b', 'a', 'a'], ['x', None, 'y', 'x'])
+    assert sorted(partitions) == [('a',), ('a', 'x'), ('a', 'y'), ('b',)]
+    assert partitions[('a',)].tolist() == [0, 2, 3] and partitions[('a', 'x')].tolist() == [0, 3]
+    assert partition_key('a', '') == partition_key('a') == ('a',)
+
+def test_saved_partitions_are_tied_to_the_corpus(tmp_path):
+    path = str(tmp_path / 'partitions.npz')
+    partitions = build_partitions(['a', 'b', 'a'], ['x', None, None])
+    save_partitions(partitions, 'v1', path)
+    loaded = load_partitions('v1', path)
+    assert {key: rows.tolist() for key, rows in loaded.items()} == {key: rows.tolist() for key, rows in partitions.items()}
+    assert load_partitions('v2', path) is None
+    assert load_partitions('v1', str(tmp_path / 'missing.npz')) is None
+
+def corpus(n=400, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(n, dim)).astype('float32')
+    faqs = [{'question': f'question {i}', 'answer': f'answer {i}', 'category': 'small' if i % 40 == 0 else 'big',
+             'subcategory': 'odd' if i % 2 else None} for i in range(n)]
+    return faqs, vectors
+
+def pipeline_over(faqs, vectors, index_type, params=None, ids=None):
+    index, params = build_index(vectors, index_type, params, ids=ids)
+    return FAQPipeline(answer_cache=False, direct_answers=False).use_components(
+        faqs=faqs, index=index, index_meta=index_meta(index_type, params), embeddings=vectors)
+
+def normalize_one(vector):
+    return vector / np.linalg.norm(vector)
+
+def exact_rows(vectors, query, rows, k):
+    return rows[np.argsort(((vectors[rows] - query) ** 2).sum(axis=1), kind='stable')[:k]].tolist()
+
+@pytest.mark.parametrize('category, subcategory', [('big', None), ('big', 'odd'), ('small', None)])
+def test_filtered_retrieval_is_exact_within_the_partition(category, subcategory):
+    pytest.importorskip('faiss')
+    faqs, vectors = corpus()
+    pipeline = pipeline_over(faqs, vectors, 'flat_l2')
+    rows = pipeline.partitions[partition_key(category, subcategory)]
+    query = vectors[7] + 0.01
+    hits = pipeline.search_partition(query, 5, category, subcategory)
+    assert hits.tolist() == exact_rows(vectors, query, rows, 5)
+
+def test_id_mapped_index_returns_corpus_rows():
+    pytest.importorskip('faiss')
+    faqs, vectors = corpus()
+    ids = np.arange(len(faqs), dtype='int64')[::-1] * 11 + 5
+    pipeline = pipeline_over(faqs, vectors, 'flat_l2', ids=ids)
+    pipeline._row_ids = ids  # What _load_index reads from the saved .ids.npy
+    pipeline._id_lookup = id_lookup(ids)
+    rows = pipeline.partitions[('small',)]
+    assert pipeline.search_partition(vectors[40], 3, 'small').tolist() == exact_rows(vectors, vectors[40], rows, 3)
+
+def test_ivf_missing_a_small_partition_falls_back_to_a_scan():
+    pytest.importorskip('faiss')
+    faqs, vectors = corpus(n=2000)
+    pipeline = pipeline_over(faqs, vectors, 'ivf_flat', params={'nlist': 40, 'nprobe': 1})
+    rows = pipeline.partitions[('small',)]
+    query = normalize_one(vectors[3])[None, :]
+    # The one probed list holds only a few of the 50 'small' rows, so the filtered search comes up short
+    _, I = filtered_search(pipeline.index, query, 20, id_selector(rows))
+    assert 0 < (I[0] >= 0).sum() < 20 and set(I[0][I[0] >= 0].tolist()) <= set(rows.tolist())
+    hits = pipeline.search_partition(query[0], 20, 'small')
+    assert len(hits) == 20 and set(hits.tolist()) <= set(rows.tolist())
+
+def test_retrieve_faq_with_category_only_returns_that_partition():
+    pytest.importorskip('faiss')
+    faqs, vectors = corpus()
+    pipeline = pipeline_over(faqs, vectors, 'flat_ip')
+    embedding = normalize_one(vectors[80])
+    ctx = QueryContext('question 80', embedding, np.zeros(0, dtype='float32'), np.zeros(0, dtype='int64'))
+    results = pipeline.retrieve_faq('question 80', top_k=3, ctx=ctx, category='small')
+    assert [r['index'] for r in results][0] == 80
+    assert all(r['category'] == 'small' for r in results) and len(results) == 3
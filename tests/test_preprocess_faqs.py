@@ -0,0 +1,56 @@
+import json
+from scraper.preprocess_faqs import exact_dedup_decisions, normalize_text, preprocess_faqs, preprocess_faqs_lsh
+
+FAQS = [
+    {'question': 'How do I  open a savings account on Jupiter?', 'answer': ' A1 '},
+    {'question': 'how do i open a savings account on jupiter?', 'answer': 'A1 again'},
+    {'question': 'What is the daily UPI transaction limit?', 'answer': 'A2'},
+    {'question': 'How do I open a savings account on Jupiter? (new)', 'answer': 'A1 variant'},
+    {'question': 'Can I get a physical debit card delivered?', 'answer': 'A3'},
+]
+
+def write_jsonl(path, faqs):
+    with open(path, 'w') as f:
+        for faq in faqs:
+            f.write(json.dumps(faq) + '\n')
+
+def test_normalize_text():
+    assert normalize_text('  How DO\n I   pay? ') == 'how do i pay?'
+
+def test_exact_dedup_keeps_first_of_each_cluster():
+    questions = [normalize_text(faq['question']) for faq in FAQS]
+    assert exact_dedup_decisions(questions) == [True, False, True, False, True]
+
+def test_lsh_dedup_matches_exact_mode(tmp_path):
+    source = str(tmp_path / 'raw.jsonl')
+    write_jsonl(source, FAQS)
+    out = str(tmp_path / 'clean.jsonl')
+    report = preprocess_faqs_lsh(source, out, batch_size=2)
+    with open(out) as f:
+        kept = [json.loads(line) for line in f]
+    assert [faq['answer'] for faq in kept] == ['A1', 'A2', 'A3']
+    assert report['input'] == 5 and report['duplicates'] == 2
+    assert report['duplicate_clusters'] == 1 and report['largest_cluster'] == 3
+    assert report['agreement_with_exact'] == 1.0
+
+def test_lsh_json_output_equals_pairwise_mode(tmp_path):
+    source = str(tmp_path / 'raw.json')
+    with open(source, 'w') as f:
+        json.dump(FAQS, f)
+    preprocess_faqs(source, str(tmp_path / 'exact' / 'clean.json'))
+    preprocess_faqs_lsh(source, str(tmp_path / 'lsh' / 'clean.json'))
+    with open(tmp_path / 'exact' / 'clean.json') as f_exact, open(tmp_path / 'lsh' / 'clean.json') as f_lsh:
+        assert json.load(f_lsh) == json.load(f_exact)
+
+def test_lsh_dedup_in_worker_processes(tmp_path):
+    source = str(tmp_path / 'raw.jsonl')
+    write_jsonl(source, FAQS * 3)
+    report = preprocess_faqs_lsh(source, str(tmp_path / 'clean.jsonl'), batch_size=4, workers=2)
+    assert report['kept'] == 3
+
+def test_exact_mode_reads_jsonl(tmp_path):
+    source = str(tmp_path / 'raw.jsonl')
+    write_jsonl(source, FAQS)
+    preprocess_faqs(source, str(tmp_path / 'clean.json'))
+    with open(tmp_path / 'clean.json') as f:
+        assert [faq['answer'] for faq in json.load(f)] == ['A1', 'A2', 'A3']
@@ -0,0 +1,56 @@
+from models.config import MAX_TOKENS
+from models.prompt_builder import (
+    SYSTEM_PROMPT, TRIM_MARKER, build_prompt, completion_budget, estimate_tokens, fit_context, trim_text
+)
+
+def faq(question, answer, category='Accounts', subcategory=None):
+    return {'question': question, 'answer': answer, 'category': category, 'subcategory': subcategory}
+
+def test_estimate_tokens():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('abcd' * 10) == 10
+    assert estimate_tokens('नमस्ते') == 6  # One token per non-ASCII character
+
+def test_short_text_is_untouched():
+    assert trim_text('Open the app.', 100) == 'Open the app.'
+
+def test_trim_prefers_a_sentence_boundary():
+    text = 'Open the app and go to Settings. Then tap KYC and follow the steps shown on screen until done.'
+    trimmed = trim_text(text, 12)
+    assert trimmed == 'Open the app and go to Settings.' + TRIM_MARKER
+    assert estimate_tokens(trimmed) <= 12
+
+def test_trim_falls_back_to_a_word_boundary():
+    trimmed = trim_text('word ' * 100, 10)
+    assert trimmed.endswith('word' + TRIM_MARKER) and estimate_tokens(trimmed) <= 10
+
+def test_context_within_budget_keeps_every_faq():
+    retrieved = [faq(f'Q{i}', f'Short answer {i}.') for i in range(3)]
+    context, stats = fit_context(retrieved, budget=1000)
+    assert (stats['faqs'], stats['trimmed'], stats['dropped']) == (3, 0, 0)
+    assert estimate_tokens(context) <= stats['context_tokens']
+    assert context.count('Q: ') == 3 and 'Subcategory: -' in context
+
+def test_long_answers_are_capped_and_low_ranked_faqs_dropped():
+    long_answer = 'This is one sentence of a long answer. ' * 200
+    retrieved = [faq(f'Q{i}', long_answer) for i in range(3)]
+    context, stats = fit_context(retrieved, budget=300, answer_tokens=200, min_answer_tokens=50)
+    assert stats['faqs'] == 2 and stats['dropped'] == 1 and stats['trimmed'] == 2
+    assert stats['context_tokens'] <= 300
+    assert context.index('Q: Q0') < context.index('Q: Q1')
+
+def test_top_faq_is_always_kept():
+    _, stats = fit_context([faq('Q0', 'x ' * 1000)], budget=10, min_answer_tokens=40)
+    assert stats['faqs'] == 1 and stats['trimmed'] == 1
+
+def test_completion_budget_scales_and_is_capped():
+    assert completion_budget(0) < completion_budget(500) <= MAX_TOKENS
+    assert completion_budget(100, 'hi') > completion_budget(100, 'en')
+    assert completion_budget(10 ** 6) == MAX_TOKENS
+
+def test_system_prompt_is_the_same_for_every_request():
+    a = build_prompt('how to do kyc', [faq('Q', 'A.')], answer_language='hi')
+    b = build_prompt('what is upi', [faq('Other', 'B.')])
+    assert a['system'] == b['system'] == SYSTEM_PROMPT
+    assert 'Answer in Hindi.' in a['user'] and 'Answer in' not in b['user']
+    assert a['user'].endswith('User question: how to do kyc')
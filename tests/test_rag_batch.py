@@ -0,0 +1,80 @@
+import zlib
+import numpy as np
+import pytest
+from models.rag_pipeline import FAQPipeline, search_width
+from models.related_graph import build_related_graph, question_key
+
+DIM = 8
+rng = np.random.default_rng(0)
+FAQS = [{'question': f'question {i}', 'answer': f'answer {i}', 'category': f'cat{i % 3}',
+         'subcategory': f'sub{i % 2}' if i % 3 else None} for i in range(40)]
+FAQS[7]['question'] = FAQS[6]['question']  # A duplicate the related questions must skip
+VECTORS = rng.normal(size=(len(FAQS), DIM)).astype('float32')
+POSITIONS = {faq['question']: VECTORS[i] for i, faq in enumerate(FAQS)}
+
+class StubModel:
+    def encode(self, texts, **kwargs):
+        # FAQ questions map onto their own vector, anything else onto a fixed point derived from the text
+        return np.array([POSITIONS[t] if t in POSITIONS else
+                         np.random.default_rng(zlib.crc32(t.encode('utf8'))).normal(size=DIM)
+                         for t in texts], dtype='float32')
+
+class StubLLM:
+    def complete(self, prompt, deadline=None):
+        return f"FINAL ANSWER: {prompt['user'][-40:]}", 'stub'
+
+QUERIES = ['question 3', 'question 6', 'how do refunds work', 'question 25', 'upi limit', 'question 39']
+
+@pytest.fixture(params=['live', 'graph'])
+def pipeline(request, monkeypatch):
+    faiss = pytest.importorskip('faiss')
+    monkeypatch.setattr('models.rag_pipeline.get_llm', lambda: StubLLM())
+    index = faiss.IndexFlatL2(DIM)
+    index.add(VECTORS)
+    graph = None
+    if request.param == 'graph':
+        _, candidates = index.search(VECTORS, len(FAQS))
+        keys = [question_key(faq['question']) for faq in FAQS]
+        graph = build_related_graph(candidates, keys, [faq['category'] for faq in FAQS],
+                                    [faq['subcategory'] for faq in FAQS], width=5)
+    return FAQPipeline(answer_cache=False, direct_answers=False, deadline=0).use_components(
+        faqs=FAQS, index=index, model=StubModel(), embeddings=VECTORS, related_graph=graph)
+
+def fresh_results(pipeline, query, top_k):
+    # What a query gets with nothing shared: its own search for retrieval and for related questions
+    retrieved = pipeline.retrieve_faq(query, top_k=top_k)
+    top = retrieved[0]
+    related = pipeline.get_related_questions(query, top['index'], top_k=3, category=top['category'],
+                                             subcategory=top['subcategory'])
+    return retrieved, related
+
+def test_batched_contexts_match_single_query_searches(pipeline):
+    contexts = pipeline.build_query_contexts(QUERIES, k=search_width())
+    for query, ctx in zip(QUERIES, contexts):
+        single = pipeline.build_query_context(query, k=search_width())
+        np.testing.assert_array_equal(ctx.indices, single.indices)
+        np.testing.assert_allclose(ctx.distances, single.distances, rtol=1e-5)
+
+@pytest.mark.parametrize('width_for', [1, 5])
+def test_mixed_top_k_share_one_search(pipeline, width_for):
+    # One search sized for `width_for` serves every top_k; wider ones search again rather than come back short
+    contexts = pipeline.build_query_contexts(QUERIES, k=pipeline.search_width(width_for))
+    for query, ctx in zip(QUERIES, contexts):
+        for top_k in (1, 3, 5, 12):
+            retrieved = pipeline.retrieve_faq(query, top_k=top_k, ctx=ctx)
+            top = retrieved[0]
+            related = pipeline.get_related_questions(query, top['index'], top_k=3, category=top['category'],
+                                                     subcategory=top['subcategory'], ctx=ctx)
+            assert (retrieved, related) == fresh_results(pipeline, query, top_k)
+
+@pytest.mark.parametrize('top_k', [1, 3, 5])
+def test_rag_answer_batch_matches_rag_answer(pipeline, top_k):
+    batched = pipeline.rag_answer_batch(QUERIES, top_k=top_k)
+    assert len(batched) == len(QUERIES)
+    for query, result in zip(QUERIES, batched):
+        single = pipeline.rag_answer(query, top_k=top_k)
+        for key in ('retrieved_faqs', 'related_questions', 'llm_response', 'answer_source', 'prompt_tokens'):
+            assert result[key] == single[key]
+        assert len(result['retrieved_faqs']) == top_k
+        assert result['retrieved_faqs'] == fresh_results(pipeline, query, top_k)[0]
+        assert result['related_questions'] == fresh_results(pipeline, query, top_k)[1]
@@ -0,0 +1,120 @@
+import json
+import numpy as np
+import pytest
+from models.related_graph import (
+    build_related_graph, corpus_fingerprint, load_related_graph, question_key, save_related_graph, select_related
+)
+
+FAQS = {
+    'Accounts': {
+        'Savings': [
+            {'question': 'How do I open an account?', 'answer': 'In the app.'},
+            {'question': 'How to open a savings account', 'answer': 'Tap Open.'},
+            {'question': 'How to open a savings account?', 'answer': 'Tap Open.'},
+            {'question': 'Can I close my account?', 'answer': 'Yes.'},
+        ],
+    },
+    'Payments': {
+        'UPI': [
+            {'question': 'What are the UPI limits?', 'answer': '1 lakh a day.'},
+            {'question': 'Why did my UPI payment fail?', 'answer': 'Bank downtime.'},
+        ],
+    },
+}
+ROWS = [faq for sub in FAQS.values() for faqs in sub.values() for faq in faqs]
+QUESTIONS = [faq['question'] for faq in ROWS]
+KEYS = [question_key(q) for q in QUESTIONS]
+CATEGORIES = ['Accounts'] * 4 + ['Payments'] * 2
+SUBCATEGORIES = ['Savings'] * 4 + ['UPI'] * 2
+# 1-D positions: rows 1 and 2 are the nearest to row 0, then row 3, then the UPI rows
+VECTORS = np.array([[0.0, 0.0], [1.0, 0.0], [1.1, 0.0], [2.0, 0.0], [10.0, 0.0], [11.0, 0.0]], dtype='float32')
+
+def ranked_candidates():
+    # Every row ranked by distance to each FAQ, itself included, as the index search returns them
+    distances = np.abs(VECTORS[:, None, 0] - VECTORS[None, :, 0])
+    return np.argsort(distances, axis=1, kind='stable')
+
+def test_rows_exclude_the_faq_itself():
+    graph = build_related_graph(ranked_candidates(), KEYS, CATEGORIES, SUBCATEGORIES, width=3)
+    assert graph.shape == (6, 3) and graph.dtype == np.int32
+    for i, row in enumerate(graph):
+        assert i not in row
+
+def test_rows_prefer_the_same_category_then_fill_from_others():
+    graph = build_related_graph(ranked_candidates(), KEYS, CATEGORIES, SUBCATEGORIES, width=3)
+    # Row 4 has only one UPI neighbour; the rest come from the nearest other rows
+    assert graph[4][0] == 5
+    assert CATEGORIES[graph[4][1]] == 'Accounts'
+    assert list(graph[0]) == [1, 3, 4]
+
+def test_duplicate_questions_are_kept_once():
+    graph = build_related_graph(ranked_candidates(), KEYS, CATEGORIES, SUBCATEGORIES, width=3)
+    assert not {1, 2} <= set(graph[0]) and not {1, 2} <= set(graph[3])
+    # Row 1's only distinct same-category questions are rows 0 and 3: row 2 is the same question
+    assert 2 not in graph[1]
+
+def test_short_rows_are_padded():
+    candidates = [[0, 1], [1, 0], [2], [3], [4], [5]]
+    graph = build_related_graph(candidates, KEYS, CATEGORIES, SUBCATEGORIES, width=3)
+    assert list(graph[0]) == [1, -1, -1]
+    assert list(graph[2]) == [-1, -1, -1]
+
+def test_select_related_skips_the_users_own_question():
+    related = select_related([0, 1, 2, 3], 0, question_key('how to open a SAVINGS account?'), 2,
+                             KEYS, CATEGORIES, SUBCATEGORIES, category='Accounts', subcategory='Savings')
+    assert related == [3]
+
+def test_stale_graph_is_not_loaded(tmp_path):
+    path = str(tmp_path / 'related.npz')
+    fingerprint = corpus_fingerprint(KEYS, CATEGORIES, SUBCATEGORIES)
+    graph = build_related_graph(ranked_candidates(), KEYS, CATEGORIES, SUBCATEGORIES, width=3)
+    save_related_graph(graph, fingerprint, path)
+    np.testing.assert_array_equal(load_related_graph(fingerprint, path), graph)
+    renamed = corpus_fingerprint(KEYS[:-1] + ['why did my upi payment fail today'], CATEGORIES, SUBCATEGORIES)
+    assert load_related_graph(renamed, path) is None
+    assert load_related_graph(fingerprint, str(tmp_path / 'missing.npz')) is None
+
+class StubModel:
+    def encode(self, texts, **kwargs):
+        positions = dict(zip(QUESTIONS, VECTORS.tolist()))
+        return np.array([positions.get(t, [0.0, 0.0]) for t in texts], dtype='float32')
+
+def make_pipeline(tmp_path, graph, fingerprint):
+    faiss = pytest.importorskip('faiss')
+    from models.rag_pipeline import FAQPipeline
+    data_path = tmp_path / 'faqs.json'
+    data_path.write_text(json.dumps(FAQS))
+    graph_path = str(tmp_path / 'related.npz')
+    save_related_graph(graph, fingerprint, graph_path)
+    index = faiss.IndexFlatL2(2)
+    index.add(VECTORS)
+    pipeline = FAQPipeline(data_path=str(data_path), corpus_path=None, related_graph_path=graph_path,
+                           partitions_path=str(tmp_path / 'partitions.npz'), answer_cache=False,
+                           direct_answers=False, deadline=0)
+    # No faqs: the corpus and the graph are loaded from disk and checked against each other
+    return pipeline.use_components(index=index, model=StubModel(), embeddings=VECTORS)
+
+# Deliberately not what a live search gives (rows 1 then 3), so the source of the answer shows
+GRAPH = np.array([[3, 1, -1]] + [[-1, -1, -1]] * 5, dtype='int32')
+
+def related_rows(pipeline, exclude_idx=0, top_k=2, **filters):
+    filters = filters or {'category': CATEGORIES[exclude_idx], 'subcategory': SUBCATEGORIES[exclude_idx]}
+    related = pipeline.get_related_questions(QUESTIONS[exclude_idx], exclude_idx, top_k=top_k, **filters)
+    return [QUESTIONS.index(r['question']) for r in related]
+
+def test_pipeline_uses_a_fresh_graph(tmp_path):
+    pipeline = make_pipeline(tmp_path, GRAPH, corpus_fingerprint(KEYS, CATEGORIES, SUBCATEGORIES))
+    assert pipeline.related_graph is not None
+    assert pipeline.search_width(top_k=3) == 3
+    assert related_rows(pipeline) == [3, 1]
+
+def test_pipeline_falls_back_to_live_search_for_a_stale_graph(tmp_path):
+    pipeline = make_pipeline(tmp_path, GRAPH, 'built-for-another-corpus')
+    assert pipeline.related_graph is None
+    assert related_rows(pipeline) == [1, 3]
+
+def test_pipeline_searches_live_when_the_graph_cannot_serve_the_request(tmp_path):
+    pipeline = make_pipeline(tmp_path, GRAPH, corpus_fingerprint(KEYS, CATEGORIES, SUBCATEGORIES))
+    # Wider than the stored rows, or filtered differently from how the graph was built
+    assert related_rows(pipeline, top_k=4) == [1, 3, 4, 5]
+    assert related_rows(pipeline, category='Payments', subcategory='UPI') == [4, 5]
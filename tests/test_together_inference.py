@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import time
+import pytest
+from benchmarks.stub_together import DEFAULT_COMPLETION, start_stub_server
+from models.together_inference import DeadlineExceeded, TogetherClient
+
+MESSAGES = [{"role": "user", "content": "What is Jupiter Money?"}]
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**config_kwargs):
+        server, config, url = start_stub_server(**dict({'latency': 0.0}, **config_kwargs))
+        servers.append(server)
+        return config, url
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def make_client(url, **kwargs):
+    kwargs = dict({'api_key': 'test', 'backoff_base': 0.0, 'max_retries': 2}, **kwargs)
+    return TogetherClient(api_url=url, **kwargs)
+
+def test_chat_returns_completion(stub):
+    config, url = stub()
+    assert make_client(url).chat(MESSAGES) == DEFAULT_COMPLETION
+    assert config.requests == 1
+
+def test_retryable_status_is_retried_then_gives_up(stub):
+    config, url = stub(error_rate=1.0, error_status=503)
+    with pytest.raises(Exception, match="after 3 attempts"):
+        make_client(url, max_retries=2).chat(MESSAGES)
+    assert config.requests == 3
+
+def test_backoff_is_jittered_and_capped():
+    client = make_client('http://unused', backoff_base=1.0, backoff_max=3.0)
+    delays = [client._backoff(attempt) for attempt in range(6) for _ in range(20)]
+    assert all(0 <= delay <= 3.0 for delay in delays)
+    assert client._backoff(0, retry_after=10) == 3.0
+
+@pytest.mark.parametrize('status', [400, 401, 404])
+def test_non_retryable_status_fails_at_once(stub, status):
+    config, url = stub(error_rate=1.0, error_status=status)
+    with pytest.raises(Exception, match=str(status)):
+        make_client(url).chat(MESSAGES)
+    assert config.requests == 1
+
+def test_stream_non_retryable_status_releases_connection(stub):
+    config, url = stub(error_rate=1.0, error_status=400)
+    client = make_client(url, pool_size=1)
+    for _ in range(3):
+        with pytest.raises(Exception, match="400"):
+            list(client.stream_chat(MESSAGES))
+    assert config.requests == 3
+    # Each failed response went back to the pool, so one connection served every call
+    pools = client.session.get_adapter(url).poolmanager.pools
+    [pool] = [pools[key] for key in pools.keys()]
+    assert pool.num_connections == 1
+    config.error_rate = 0.0
+    assert ''.join(client.stream_chat(MESSAGES)).strip() == DEFAULT_COMPLETION
+
+def test_identical_concurrent_requests_share_one_call(stub):
+    config, url = stub(latency=0.3)
+    client = make_client(url)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(client.chat(MESSAGES))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [DEFAULT_COMPLETION] * 5
+    assert config.requests == 1
+
+def test_read_timeout_is_retried(stub):
+    config, url = stub(latency=0.5)
+    with pytest.raises(Exception, match="after 2 attempts"):
+        make_client(url, read_timeout=0.1, max_retries=1).chat(MESSAGES)
+    assert config.requests == 2
+
+def test_deadline_stops_the_call(stub):
+    _, url = stub(latency=1.0)
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        make_client(url).chat(MESSAGES, deadline=start + 0.2)
+    assert time.monotonic() - start < 0.9
+
+def test_achat_coalesces_on_one_loop(stub):
+    config, url = stub(latency=0.2)
+    client = make_client(url)
+
+    async def ask():
+        return await asyncio.gather(*(client.achat(MESSAGES) for _ in range(4)))
+    assert asyncio.run(ask()) == [DEFAULT_COMPLETION] * 4
+    assert config.requests == 1
+
+def test_achat_does_not_share_futures_across_loops(stub):
+    config, url = stub(latency=0.5)
+    client = make_client(url)
+    first = []
+    thread = threading.Thread(target=lambda: first.append(asyncio.run(client.achat(MESSAGES))))
+    thread.start()
+    while config.requests == 0:  # The first loop's call is in flight
+        time.sleep(0.01)
+    # A second loop must make its own call, not await the first loop's future
+    assert asyncio.run(client.achat(MESSAGES)) == DEFAULT_COMPLETION
+    thread.join()
+    assert first == [DEFAULT_COMPLETION]
+    assert config.requests == 2